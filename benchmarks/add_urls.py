@@ -0,0 +1,52 @@
+"""Benchmark adding urls to :class:`brainscopypaste.db.Quote`\ s.
+
+Compares adding urls one by one with :meth:`~brainscopypaste.db.Quote.add_url`
+(which extends the quote's url columns at each call) with accumulating them in
+a :class:`~brainscopypaste.db.UrlBuffer` and adding them in one go (as
+:class:`~brainscopypaste.load.MemeTrackerParser` does), for quotes with more
+and more urls. No database is needed.
+
+Usage: ``python benchmarks/add_urls.py``
+
+"""
+
+
+from datetime import datetime, timedelta
+from timeit import default_timer
+
+from brainscopypaste.db import Quote, Url, UrlBuffer
+
+
+def one_by_one(fields):
+    quote = Quote()
+    for timestamp, frequency, url_type, url in fields:
+        quote.add_url(Url(timestamp=timestamp, frequency=frequency,
+                          url_type=url_type, url=url))
+    return quote
+
+
+def buffered(fields):
+    quote = Quote()
+    buffer = UrlBuffer()
+    for timestamp, frequency, url_type, url in fields:
+        buffer.append(timestamp, frequency, url_type, url)
+    quote.add_urls(buffer)
+    return quote
+
+
+def main(sizes=(10, 100, 1000, 10000)):
+    basedate = datetime(year=2008, month=8, day=1)
+    print('{:>6} {:>12} {:>12}'.format('urls', 'add_url', 'UrlBuffer'))
+    for size in sizes:
+        fields = [(basedate + timedelta(seconds=i), 1, 'B',
+                   'http://example.com/{}'.format(i)) for i in range(size)]
+        times = []
+        for add in [one_by_one, buffered]:
+            start = default_timer()
+            assert add(fields).size == size
+            times.append(default_timer() - start)
+        print('{:>6} {:>11.4f}s {:>11.4f}s'.format(size, *times))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+"""Benchmark parallel FA betweenness in :mod:`brainscopypaste.load`.
+
+Writes a synthetic Free Association source file (see ``fa_engines.py``), then
+computes betweenness with the ``sparse`` engine and an increasing number of
+jobs (up to the number of CPUs), and prints the time taken and the speedup
+over one job. Betweenness is then estimated from increasing numbers of
+pivots, printing the time taken, the estimated median relative error, and the
+rank correlation with the exact betweenness.
+
+Usage: ``python benchmarks/betweenness.py [n_cues]``
+
+"""
+
+
+import os
+import sys
+from multiprocessing import cpu_count
+from timeit import default_timer
+
+from brainscopypaste.conf import settings
+from brainscopypaste.load import FAFeatureLoader
+from brainscopypaste.graph import rank_correlation
+
+from fa_engines import write_source
+
+
+def main(n_cues=1000):
+    path = write_source(n_cues)
+    try:
+        with settings.override(('FA_SOURCES', [path])):
+            reference = None
+            jobs = 1
+            while jobs <= cpu_count():
+                loader = FAFeatureLoader(jobs=jobs)
+                # Don't count building the graph.
+                loader._sparse_inverse_norms_graph
+                start = default_timer()
+                exact = loader.betweenness()
+                duration = default_timer() - start
+                reference = reference or duration
+                print('{:>4} jobs: {:>8.2f} s (speedup {:.1f})'.format(
+                    jobs, duration, reference / duration))
+                jobs *= 2
+
+            for pivots in [10, 50, 200]:
+                loader = FAFeatureLoader(pivots=pivots)
+                loader._sparse_inverse_norms_graph
+                start = default_timer()
+                estimate = loader.betweenness()
+                duration = default_timer() - start
+                print('{:>4} pivots: {:>6.2f} s (median relative error '
+                      '{:.1%}, rank correlation {:.3f})'.format(
+                          pivots, duration, loader.betweenness_error,
+                          rank_correlation(estimate, exact)))
+    finally:
+        os.remove(path)
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:2]])
@@ -0,0 +1,75 @@
+"""Benchmark the graph engines of FA features in :mod:`brainscopypaste.load`.
+
+Writes a synthetic Free Association source file (with about as many cues and
+links as the real norms), then computes degree, pagerank and clustering with
+the ``sparse`` and ``networkx`` engines, and prints the time and peak memory
+allocated for each feature (graph construction included).
+
+Usage: ``python benchmarks/fa_engines.py [n_cues]``
+
+"""
+
+
+import os
+import sys
+import random
+import tracemalloc
+from tempfile import mkstemp
+from timeit import default_timer
+
+from brainscopypaste.conf import settings
+from brainscopypaste.load import FAFeatureLoader
+
+
+header = '''<HTML>
+<BODY>
+<PRE>
+CUE, TARGET, NORMED?, #G, #P, FSG
+'''
+
+
+footer = '''</pre>
+</BODY>
+</HTML>'''
+
+
+def write_source(n_cues, targets=14, seed=0):
+    """Write a synthetic FA source with `n_cues` cues of `targets` targets
+    each, and return its path."""
+
+    rng = random.Random(seed)
+    words = ['word{}'.format(i) for i in range(n_cues * 2)]
+    fd, path = mkstemp()
+    with open(fd, 'w', encoding='iso-8859-2') as f:
+        f.write(header)
+        for cue in words[:n_cues]:
+            for target in rng.sample(words, targets):
+                f.write('{}, {}, YES, 150, 10, {:.3f}\n'
+                        .format(cue, target, rng.randint(1, 700) / 1000))
+        f.write(footer)
+    return path
+
+
+def main(n_cues=5000):
+    path = write_source(n_cues)
+    try:
+        with settings.override(('FA_SOURCES', [path])):
+            for feature in ['degree', 'pagerank', 'clustering']:
+                for engine in FAFeatureLoader.engines:
+                    loader = FAFeatureLoader(engine=engine)
+                    # Don't count parsing, which is the same for both engines.
+                    loader._norms
+                    tracemalloc.start()
+                    start = default_timer()
+                    getattr(loader, feature)()
+                    duration = default_timer() - start
+                    _, peak = tracemalloc.get_traced_memory()
+                    tracemalloc.stop()
+                    print('{:>10} {:>8}: {:>8.3f} s {:>8.1f} MB'.format(
+                        feature, engine, duration, peak / 2**20))
+    finally:
+        os.remove(path)
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:2]])
@@ -0,0 +1,54 @@
+"""Benchmark concurrent feature tasks in :mod:`brainscopypaste.load`.
+
+Writes a synthetic Free Association source file (see ``fa_engines.py``), marks
+MemeTracker features of an empty columnar store as up to date (so that no
+database is needed), then computes all FA features with an increasing number
+of task processes (up to the number of tasks), and prints the wall time. With
+enough CPUs, it should come down to the time of the longest task
+(betweenness), which ``compute_features`` prints along with the sum of task
+durations.
+
+Usage: ``python benchmarks/feature_tasks.py [n_cues]`` (from the
+``benchmarks`` folder)
+
+"""
+
+
+import os
+import sys
+from tempfile import mkstemp, TemporaryDirectory
+from timeit import default_timer
+
+from brainscopypaste.conf import settings
+from brainscopypaste.columnar import ColumnarStore
+from brainscopypaste.featurestore import FeatureStore
+from brainscopypaste import load
+
+from fa_engines import write_source
+
+
+def main(n_cues=2000):
+    path = write_source(n_cues)
+    fd, features = mkstemp()
+    os.close(fd)
+    try:
+        with settings.override(('FA_SOURCES', [path]),
+                               ('FEATURES', features)), \
+                TemporaryDirectory() as tmpdir:
+            store = ColumnarStore(tmpdir)
+            FeatureStore(features).save({'frequency': {}, 'tokens': set()},
+                                        load._mt_digest(store))
+            for processes in [1, 2, 5]:
+                start = default_timer()
+                load.compute_features(processes=processes, store=store)
+                print('{:>2} processes: {:>8.2f} s'.format(
+                    processes, default_timer() - start))
+                # Make FA features stale again.
+                FeatureStore(features).save({'degree': {}}, '')
+    finally:
+        os.remove(path)
+        os.remove(features)
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:2]])
@@ -0,0 +1,85 @@
+"""Benchmark the MemeTracker line readers used by
+:class:`brainscopypaste.load.MemeTrackerParser`.
+
+Generates a synthetic MemeTracker file, then reads and classifies all its lines
+with each parsing engine (without touching the database), and prints the
+number of lines read per second.
+
+Usage: ``python benchmarks/load_engines.py [n_clusters]``
+
+"""
+
+
+import os
+import sys
+from tempfile import mkstemp
+from timeit import default_timer
+
+from brainscopypaste.load import MemeTrackerParser
+
+
+header = '''format:
+<ClSz>\t<TotFq>\t<Root>\t<ClusterId>
+\t<QtFq>\t<Urls>\t<QtStr>\t<QuteId>
+\t\t<Tm>\t<Fq>\t<UrlTy>\t<Url>
+
+
+'''
+
+
+def write_file(n_clusters, quotes=5, urls=10):
+    """Write a synthetic MemeTracker file with `n_clusters` clusters of
+    `quotes` quotes of `urls` urls each, and return its path and number of
+    lines."""
+
+    fd, filepath = mkstemp()
+    n_lines = header.count('\n')
+    with open(fd, 'w') as f:
+        f.write(header)
+        for c in range(n_clusters):
+            f.write('{}\t{}\tsome cluster root string\t{}\n'
+                    .format(quotes, quotes * urls, c))
+            for q in range(quotes):
+                f.write('\t{}\t{}\tthis is what quote number {} says '
+                        'about its cluster\t{}\n'
+                        .format(urls, urls, q, c * quotes + q))
+                for u in range(urls):
+                    f.write('\t\t2008-08-01 00:{:02}:{:02}\t1\tM\t'
+                            'http://example.com/blog/{}/{}/{}\n'
+                            .format(u, q, c, q, u))
+                f.write('\n')
+            n_lines += 1 + quotes * (urls + 2)
+    return filepath, n_lines
+
+
+def read_all(filepath, engine):
+    """Read and classify all lines of `filepath` with `engine`, returning the
+    number of lines read."""
+
+    parser = MemeTrackerParser(filepath, engine=engine)
+    n_lines = 0
+    with open(filepath, 'rb') as file:
+        parser._file = parser.engines[engine](file, 0)
+        while parser._read_record() is not None:
+            n_lines += 1
+    return n_lines
+
+
+def main(n_clusters=2000, repeats=3):
+    filepath, n_lines = write_file(n_clusters)
+    print('{} lines, {:.1f} MB'.format(
+        n_lines, os.path.getsize(filepath) / 2 ** 20))
+    try:
+        for engine in sorted(MemeTrackerParser.engines):
+            best = float('inf')
+            for _ in range(repeats):
+                start = default_timer()
+                assert read_all(filepath, engine) == n_lines
+                best = min(best, default_timer() - start)
+            print('{:>5}: {:>10,.0f} lines/s'.format(engine, n_lines / best))
+    finally:
+        os.remove(filepath)
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:2]])
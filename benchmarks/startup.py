@@ -0,0 +1,59 @@
+"""Benchmark the start-up time of :mod:`brainscopypaste.cli` commands.
+
+Runs ``brainscopypaste [command] --help`` in a fresh Python process for the
+main group and each of its subcommands (which imports the CLI module and the
+modules needed to build the command, but doesn't connect to the database),
+and prints the best wall time over a few runs, along with the bare Python
+start-up time for reference.
+
+Usage: ``python benchmarks/startup.py [repeats]`` (from the root of the
+repository)
+
+"""
+
+
+import subprocess
+import sys
+from timeit import default_timer
+
+import click
+
+from brainscopypaste.cli import cli
+
+
+launcher = 'from brainscopypaste.cli import cliobj; cliobj()'
+
+
+def commands(group, path=()):
+    """Iterate through the paths of all commands in click `group`."""
+
+    yield path
+    for name, command in sorted(group.commands.items()):
+        if isinstance(command, click.Group):
+            yield from commands(command, path + (name,))
+        else:
+            yield path + (name,)
+
+
+def best_time(args, repeats):
+    best = float('inf')
+    for _ in range(repeats):
+        start = default_timer()
+        subprocess.check_call([sys.executable] + args,
+                              stdout=subprocess.DEVNULL)
+        best = min(best, default_timer() - start)
+    return best
+
+
+def main(repeats=5):
+    print('{:>36}: {:>6.3f} s'.format('(python -c pass)',
+                                      best_time(['-c', 'pass'], repeats)))
+    for path in commands(cli):
+        duration = best_time(['-c', launcher] + list(path) + ['--help'],
+                             repeats)
+        print('{:>36}: {:>6.3f} s'.format(
+            ' '.join(('brainscopypaste',) + path), duration))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:2]])
@@ -0,0 +1,88 @@
+"""Benchmark sliding-window hamming distances in :mod:`brainscopypaste.utils`.
+
+Builds random clusters of lemma tuples (of 5 to 30 common words, like
+MemeTracker quotes) and computes the distance from every quote to every
+shorter or equally long quote of its cluster, as
+:meth:`~brainscopypaste.mine.ClusterMinerMixin.substitutions` does. It times
+the previous approach (`hamming()` on each of the `sublists()`),
+`subhamming()` on each pair, and `subhamming_batch()` on all the pairs of each
+cluster (all from :mod:`brainscopypaste.utils`), and prints the number of
+pairs processed per second. Caches are dropped before each run.
+
+Usage: ``python benchmarks/subhamming.py [n_clusters]``
+
+"""
+
+
+import sys
+import random
+from timeit import default_timer
+
+import numpy as np
+
+from brainscopypaste.utils import (hamming, sublists, subhamming,
+                                   subhamming_batch, Vocabulary)
+
+
+words = ('the a of to and in is it you that he was for on are with as his '
+         'they be at one have this from or had by word but what some we can '
+         'out other were all there when up use your how said an each she '
+         'which do their time if will way about many then them write would '
+         'like so these her long make thing see him two has look more day '
+         'could go come did number sound no most people my over know water '
+         'than call first who may down side been now find').split()
+
+
+def reference(s1, s2):
+    """Subhamming as computed before integer encoding."""
+
+    if len(s2) == 0:
+        return len(s1), 0
+    distances = [hamming(sub, s2) for sub in sublists(s1, len(s2))]
+    amin = int(np.argmin(distances))
+    return distances[amin], amin
+
+
+def clusters(n_clusters):
+    random.seed(0)
+    for _ in range(n_clusters):
+        quotes = [tuple(random.choice(words)
+                        for _ in range(random.randint(5, 30)))
+                  for _ in range(random.randint(2, 40))]
+        yield [(source, destination) for source in quotes
+               for destination in quotes
+               if source is not destination and
+               len(source) >= len(destination)]
+
+
+def main(n_clusters=200):
+    all_pairs = list(clusters(n_clusters))
+    n_pairs = sum(len(pairs) for pairs in all_pairs)
+    print('{:,} pairs in {:,} clusters'.format(n_pairs, n_clusters))
+
+    for function in [hamming, sublists, subhamming]:
+        function.drop_cache()
+    start = default_timer()
+    expected = [[reference(s1, s2) for s1, s2 in pairs]
+                for pairs in all_pairs]
+    print('{:>18}: {:>10,.0f} pairs/s'
+          .format('hamming/sublists', n_pairs / (default_timer() - start)))
+
+    subhamming.drop_cache()
+    start = default_timer()
+    single = [[subhamming(s1, s2) for s1, s2 in pairs] for pairs in all_pairs]
+    print('{:>18}: {:>10,.0f} pairs/s'
+          .format('subhamming', n_pairs / (default_timer() - start)))
+
+    vocabulary = Vocabulary()
+    start = default_timer()
+    batched = [subhamming_batch(pairs, vocabulary) for pairs in all_pairs]
+    print('{:>18}: {:>10,.0f} pairs/s'
+          .format('subhamming_batch', n_pairs / (default_timer() - start)))
+
+    assert single == expected
+    assert batched == expected
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:2]])
@@ -0,0 +1,59 @@
+"""Benchmark batched TreeTagger calls in :mod:`brainscopypaste.tagger`.
+
+Tags random sentences (of 5 to 20 common words, like MemeTracker quotes) one
+by one with a TreeTagger call each, then with
+:func:`~brainscopypaste.tagger.tag_batch` for a few batch sizes, and prints
+the number of sentences tagged per second. The persistent tag cache is
+disabled, so that every run tags all the sentences, and batched codings are
+checked to be the same as single-sentence ones. Needs TreeTagger to be
+installed (see :ref:`setup`).
+
+Usage: ``python benchmarks/tagging.py [n_sentences]``
+
+"""
+
+
+import sys
+import random
+from timeit import default_timer
+
+from brainscopypaste import tagger
+from brainscopypaste.conf import settings
+
+
+words = ('the a of to and in is it you that he was for on are with as his '
+         'they be at one have this from or had by word but what some we can '
+         'out other were all there when up use your how said an each she '
+         'which do their time if will way about many then them write would '
+         'like so these her long make thing see him two has look more day '
+         'could go come did number sound no most people my over know water '
+         'than call first who may down side been now find').split()
+
+
+def main(n_sentences=5000):
+    random.seed(0)
+    sentences = [' '.join(random.choice(words)
+                          for _ in range(random.randint(5, 20)))
+                 for _ in range(n_sentences)]
+
+    with settings.override(('TAG_CACHE', None)):
+        start = default_timer()
+        single = tuple(tagger._tag_text(sentence) for sentence in sentences)
+        print('{:>12}: {:>10,.0f} sentences/s'
+              .format('one by one', n_sentences / (default_timer() - start)))
+
+        for batch_size in [10, 100, 500, 2000]:
+            for function in [tagger.tag, tagger.tags, tagger.tokens,
+                             tagger.lemmas]:
+                function.drop_cache()
+            start = default_timer()
+            batched = tagger.tag_batch(sentences, batch_size=batch_size)
+            duration = default_timer() - start
+            print('{:>12}: {:>10,.0f} sentences/s'
+                  .format('batch {}'.format(batch_size),
+                          n_sentences / duration))
+            assert batched == single
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:2]])
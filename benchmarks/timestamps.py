@@ -0,0 +1,39 @@
+"""Benchmark the url timestamp decoders used by
+:class:`brainscopypaste.load.MemeTrackerParser`.
+
+Decodes random timestamps spread over a few months (as in the MemeTracker
+dataset) with each decoder, and prints the number of timestamps decoded per
+second.
+
+Usage: ``python benchmarks/timestamps.py [n_timestamps]``
+
+"""
+
+
+import sys
+import random
+from timeit import default_timer
+
+from brainscopypaste.load import MemeTrackerParser
+
+
+def main(n_timestamps=200000, repeats=3):
+    random.seed(0)
+    timestamps = ['2008-{:02}-{:02} {:02}:{:02}:{:02}'.format(
+        random.randint(8, 12), random.randint(1, 28), random.randint(0, 23),
+        random.randint(0, 59), random.randint(0, 59))
+        for _ in range(n_timestamps)]
+
+    for name, decode in sorted(MemeTrackerParser.timestamp_decoders.items()):
+        best = float('inf')
+        for _ in range(repeats):
+            start = default_timer()
+            for timestamp in timestamps:
+                decode(timestamp)
+            best = min(best, default_timer() - start)
+        print('{:>8}: {:>10,.0f} timestamps/s'
+              .format(name, n_timestamps / best))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:2]])
@@ -9,6 +9,10 @@ in the browser, you will only see docstrings for convenience functions in the
 module. The other docstrings appear in the source code, but are best explored
 by calling the tool with ``--help``.
 
+Modules that are slow to import (notebook tools, and the loading, filtering
+and database modules) are only imported by the commands that use them, so that
+``--help`` and small commands start quickly (see ``benchmarks/startup.py``).
+
 """
 
 
@@ -18,15 +22,10 @@ import logging
 import re
 
 import click
-import nbformat
-from traitlets.config import Config
-from nbconvert.exporters import Exporter
-
-from brainscopypaste.db import Base, Cluster, Substitution
-from brainscopypaste.utils import session_scope, init_db, mkdirp
-from brainscopypaste.load import (MemeTrackerParser, load_fa_features,
-                                  load_mt_frequency_and_tokens)
-from brainscopypaste.filter import filter_clusters
+
+from brainscopypaste.utils import (session_scope, init_db, mkdirp,
+                                   memoized_stats)
+from brainscopypaste.columnar import ColumnarStore
 from brainscopypaste.mine import (mine_substitutions_with_model, Time, Source,
                                   Past, Durl, Model)
 from brainscopypaste.conf import settings
@@ -41,8 +40,14 @@ logger = logging.getLogger(__name__)
               help='Set log level')
 @click.option('--log-file', default=None, type=click.Path(),
               help='Log to this file instead of stdout')
+@click.option('--store', default=None, type=click.Path(file_okay=False),
+              help='Use this columnar store directory instead of the '
+              'database for loading, filtering, mining and features')
+@click.option('--cache-stats', is_flag=True,
+              help='Print statistics on the memoization caches when the '
+              'command finishes')
 @click.pass_obj
-def cli(obj, echo_sql, log, log_file):
+def cli(obj, echo_sql, log, log_file, store, cache_stats):
     """BrainsCopyPaste analysis of the MemeTracker data."""
 
     # Configure logging and silence TreeTagger logs.
@@ -52,9 +57,50 @@ def cli(obj, echo_sql, log, log_file):
     logging.getLogger('TreeTagger').setLevel(logging.WARNING)
     logger.debug('Logging configured')
 
-    # Save config.
+    # Save config. The database is connected to by the commands that use it
+    # (see `_connect()`).
     obj['ECHO_SQL'] = echo_sql
-    obj['engine'] = init_db(obj['ECHO_SQL'])
+    obj['engine'] = None
+    if store is not None:
+        logger.info("Using columnar store in '%s'", store)
+        obj['store'] = ColumnarStore(store)
+    else:
+        obj['store'] = None
+
+    if cache_stats:
+        click.get_current_context().call_on_close(_echo_cache_stats)
+
+
+def _echo_cache_stats():
+    """Print the statistics of all :func:`~.utils.memoized` functions that
+    were called (see :func:`~.utils.memoized_stats`)."""
+
+    stats = [s for s in memoized_stats() if s['hits'] + s['misses'] > 0]
+    click.secho('Memoization caches', bold=True)
+    if len(stats) == 0:
+        click.echo('No memoized function was called')
+        return
+    click.echo('{:>12} {:>12} {:>10} {:>10} {:>10} {:>10}  {}'.format(
+        'hits', 'misses', 'evictions', 'size', 'maxsize', 'MB', 'function'))
+    for s in stats:
+        click.echo('{hits:>12,} {misses:>12,} {evictions:>10,} {size:>10,} '
+                   '{maxsize:>10} {mb:>10.1f}  {name}'.format(
+                       mb=s['bytes'] / 2 ** 20,
+                       **dict(s, maxsize='-' if s['maxsize'] is None
+                              else s['maxsize'])))
+
+
+def _connect(obj):
+    """Connect to the database for a command that uses it, unless a columnar
+    store is used instead.
+
+    This is not done by the main command group, so that ``--help`` and
+    commands which don't use the database don't wait for a connection.
+
+    """
+
+    if obj['store'] is None and obj['engine'] is None:
+        obj['engine'] = init_db(obj['ECHO_SQL'])
 
 
 @cli.group()
@@ -82,7 +128,14 @@ def confirm(fillin):
 def drop_all(obj):
     """Empty the whole database and all features."""
 
+    if obj['store'] is not None:
+        raise click.UsageError('Only the database can be dropped; remove the '
+                               'columnar store directory instead')
+
     if confirm('the whole database and all features'):
+        from brainscopypaste.db import Base
+
+        _connect(obj)
         logger.info('Emptying database')
         click.secho('Emptying database... ', nl=False)
 
@@ -99,11 +152,18 @@ def drop_all(obj):
 def drop_filtered(obj):
     """Drop filtered rows (Clusters, Quotes)."""
 
+    if obj['store'] is not None:
+        raise click.UsageError('Filtered rows can only be dropped from the '
+                               'database, not from a columnar store')
+
     click.secho('Dropping filtered rows will also drop any substitutions '
                 'mined beforehand', bold=True)
 
     if confirm('the filtered rows (clusters, quotes) and '
                'any mined substitutions attached to them'):
+        from brainscopypaste.db import Cluster
+
+        _connect(obj)
         logger.info('Dropping filtered rows (quotes and clusters) and '
                     'substitutions from database')
 
@@ -122,7 +182,14 @@ def drop_filtered(obj):
 def drop_substitutions(obj):
     """Drop Substitutions."""
 
+    if obj['store'] is not None:
+        raise click.UsageError('Substitutions can only be dropped from the '
+                               'database, not from a columnar store')
+
     if confirm('the mined substitutions'):
+        from brainscopypaste.db import Substitution
+
+        _connect(obj)
         logger.info('Dropping substitutions from database')
         click.secho('Dropping mined substitutions... ', nl=False)
 
@@ -138,14 +205,12 @@ def _drop_features():
     logger.info('Dropping computed features from filesystem')
     click.secho('Dropping computed features... ', nl=False)
 
-    for file in [settings.DEGREE, settings.PAGERANK, settings.BETWEENNESS,
-                 settings.CLUSTERING, settings.FREQUENCY, settings.TOKENS]:
-        if exists(file):
-            logger.debug("Dropping '%s'", basename(file))
-            remove(file)
-        else:
-            logger.debug("'%s' not present, no need to drop it",
-                         basename(file))
+    if exists(settings.FEATURES):
+        logger.debug("Dropping '%s'", basename(settings.FEATURES))
+        remove(settings.FEATURES)
+    else:
+        logger.debug("'%s' not present, no need to drop it",
+                     basename(settings.FEATURES))
 
     click.secho('OK', fg='green', bold=True)
     logger.info('Done dropping features')
@@ -164,24 +229,92 @@ def load():
 
 
 @load.command(name='memetracker')
+@click.option('--source', default=None,
+              type=click.Path(exists=True, dir_okay=False),
+              help='MemeTracker file to load, possibly compressed (.gz, .bz2 '
+              'or .xz); defaults to the MT_SOURCE setting')
 @click.option('--limit', default=None, type=int,
               help='Limit number of clusters processed')
-def load_memetracker(limit):
+@click.option('--flush-clusters', default=None, type=int,
+              help='Save to database every N clusters instead of at the end')
+@click.option('--flush-mb', default=None, type=float,
+              help='Save to database every M megabytes read instead of at '
+              'the end')
+@click.option('--jobs', default=1, type=click.IntRange(1),
+              help='Number of processes to parse with')
+@click.option('--engine', default='text', type=click.Choice(['text', 'mmap']),
+              help="How to read the file ('mmap' is faster)")
+@click.option('--resume', is_flag=True, default=False,
+              help='Resume an interrupted load from its last checkpoint '
+              '(needs --flush-clusters or --flush-mb)')
+@click.option('--append', is_flag=True, default=False,
+              help='Add the file to an already loaded database as a new dump')
+@click.pass_obj
+def load_memetracker(obj, source, limit, flush_clusters, flush_mb, jobs,
+                     engine, resume, append):
     """Load MemeTracker data into SQL."""
 
+    from brainscopypaste.load import MemeTrackerParser
+
+    _connect(obj)
     logger.info('Starting load of memetracker data into database')
-    MemeTrackerParser(settings.MT_SOURCE, line_count=settings.MT_LENGTH,
-                      limit=limit).parse()
+    MemeTrackerParser(source or settings.MT_SOURCE,
+                      limit=limit, flush_clusters=flush_clusters,
+                      flush_megabytes=flush_mb, jobs=jobs,
+                      engine=engine, resume=resume, append=append,
+                      store=obj['store']).parse()
     logger.info('Done loading memetracker data into database')
 
 
+@load.command(name='tags')
+@click.option('--jobs', default=1, type=click.IntRange(1),
+              help='Number of processes to tag with')
+@click.pass_obj
+def load_tags(obj, jobs):
+    """Store POS tags, tokens and lemmas of quotes in SQL."""
+
+    if obj['store'] is not None:
+        raise click.UsageError('Tags can only be stored in the database, '
+                               'not in a columnar store')
+
+    from brainscopypaste.load import load_quote_tags
+
+    _connect(obj)
+    logger.info('Starting tagging of memetracker quotes')
+    load_quote_tags(jobs=jobs)
+    logger.info('Done tagging memetracker quotes')
+
+
 @load.command(name='features')
-def load_features():
-    """Compute features and save them to pickle."""
+@click.option('--fa-engine', default='sparse',
+              type=click.Choice(['sparse', 'networkx']),
+              help="How to compute FreeAssociation graph features ('sparse' "
+              "is faster)")
+@click.option('--jobs', default=1, type=click.IntRange(1),
+              help='Number of processes to count MemeTracker frequencies '
+              'and compute FreeAssociation betweenness with')
+@click.option('--betweenness-pivots', default=None, type=click.IntRange(1),
+              help='Estimate FreeAssociation betweenness from K sampled '
+              'source words instead of computing it exactly')
+@click.option('--seed', default=0, type=int,
+              help='Seed for sampling betweenness pivots')
+@click.option('--force', is_flag=True, default=False,
+              help='Recompute features even if they are up to date')
+@click.option('--processes', default=None, type=click.IntRange(1),
+              help='Number of processes to run feature computation tasks '
+              'with (defaults to the number of CPUs)')
+@click.pass_obj
+def load_features(obj, fa_engine, jobs, betweenness_pivots, seed, force,
+                  processes):
+    """Compute features and save them to the feature store."""
+
+    from brainscopypaste.load import compute_features
 
+    _connect(obj)
     logger.info('Starting computation of features')
-    load_mt_frequency_and_tokens()
-    load_fa_features()
+    compute_features(engine=fa_engine, jobs=jobs, pivots=betweenness_pivots,
+                     seed=seed, store=obj['store'], force=force,
+                     processes=processes)
     logger.info('Done computing and saving features')
 
 
@@ -193,11 +326,17 @@ def filter():
 @filter.command(name='memetracker')
 @click.option('--limit', default=None, type=int,
               help='Limit number of clusters processed')
-def filter_memetracker(limit):
+@click.option('--dump', default=None, type=int,
+              help='Only filter clusters from this dump')
+@click.pass_obj
+def filter_memetracker(obj, limit, dump):
     """Filter MemeTracker data."""
 
+    from brainscopypaste.filter import filter_clusters
+
+    _connect(obj)
     logger.info('Starting filtering of memetracker data')
-    filter_clusters(limit=limit)
+    filter_clusters(limit=limit, dump=dump, store=obj['store'])
     logger.info('Done filtering memetracker data')
 
 
@@ -215,7 +354,11 @@ def mine():
                 type=click.IntRange(1, settings.MT_FILTER_MIN_TOKENS // 2))
 @click.option('--limit', default=None, type=int,
               help='Limit number of clusters processed')
-def mine_substitutions(time, source, past, durl, max_distance, limit):
+@click.option('--dump', default=None, type=int,
+              help='Only mine clusters from this dump')
+@click.pass_obj
+def mine_substitutions(obj, time, source, past, durl, max_distance, limit,
+                       dump):
     """Mine the database for substitutions."""
 
     time, source, past, durl = map(lambda s: s.split('.')[1],
@@ -223,12 +366,14 @@ def mine_substitutions(time, source, past, durl, max_distance, limit):
     model = Model(time=Time[time], source=Source[source], past=Past[past],
                   durl=Durl[durl], max_distance=max_distance)
 
+    _connect(obj)
     logger.info('Starting substitution mining in memetracker data')
     if limit is not None:
         logger.info('Substitution mining is limited to %s clusters', limit)
     logger.info('Substitution model is %s', model)
 
-    mine_substitutions_with_model(model, limit=limit)
+    mine_substitutions_with_model(model, limit=limit, dump=dump,
+                                  store=obj['store'])
     logger.info('Done mining substitutions in memetracker data')
 
 
@@ -255,6 +400,10 @@ def variant(time, source, past, durl, max_distance, notebook_path):
                                             notebook=notebook_file)
     _, variant_file = split(variant_path)
 
+    import nbformat
+    from traitlets.config import Config
+    from nbconvert.exporters import Exporter
+
     # Read the source notebook and generate the appropriate variant.
     if not exists(notebook_path):
         raise Exception("Couldn't find notebook '{}'".format(notebook_path))
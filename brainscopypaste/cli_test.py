@@ -0,0 +1,23 @@
+import os
+from tempfile import TemporaryDirectory
+
+import pytest
+from click.testing import CliRunner
+
+from brainscopypaste.cli import cli
+
+
+@pytest.mark.parametrize('command', [['drop', 'all'],
+                                     ['drop', 'filtered'],
+                                     ['drop', 'substitutions'],
+                                     ['load', 'tags']])
+def test_database_only_commands_reject_store(command):
+    with TemporaryDirectory() as tmpdir:
+        store = os.path.join(tmpdir, 'store')
+        result = CliRunner().invoke(cli, ['--store', store] + command,
+                                    obj={})
+        assert result.exit_code == 2
+        assert 'columnar store' in result.output
+        # Nothing was asked, nor touched.
+        assert 'Are you sure' not in result.output
+        assert os.listdir(store) == []
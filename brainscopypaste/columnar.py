@@ -0,0 +1,609 @@
+"""Columnar file storage for clusters, quotes and substitutions.
+
+This module defines :class:`ColumnarStore`, an alternative to the PostgreSQL
+database for exploratory runs on a single machine. It stores
+:class:`~.db.Cluster`\ s, :class:`~.db.Quote`\ s (with their urls) and
+:class:`~.db.Substitution`\ s in a directory of NumPy `.npy` files, one per
+column, which are memory-mapped when read. Scanning a column (e.g. to count
+quotes or sum url frequencies) therefore doesn't copy it into memory, and
+doesn't need a database server.
+
+Each call to :meth:`ColumnarStore.save` or
+:meth:`ColumnarStore.save_substitutions` writes a new *part* of the
+corresponding tables, i.e. a directory holding a file for each column of the
+saved rows. Variable-length columns (strings, and the url lists of quotes) are
+stored as a flat array of values and an array of offsets into it. Parts are
+written to a temporary directory first, and renamed when complete. Each
+quotes part records the name of the clusters part saved with it, so that the
+two tables are paired correctly even if a save was interrupted between them.
+
+The :mod:`.load`, :mod:`.filter` and :mod:`.mine` stages (and the MemeTracker
+frequency feature) accept a `store` argument to work against a
+:class:`ColumnarStore` instead of the database; they get transient (i.e. not
+attached to any session) model instances from
+:meth:`ColumnarStore.clusters`, :meth:`ColumnarStore.quotes` and
+:meth:`ColumnarStore.substitutions`.
+
+"""
+
+
+import os
+import logging
+import shutil
+
+import numpy as np
+
+
+logger = logging.getLogger(__name__)
+
+
+class ColumnarStore:
+
+    """Store clusters, quotes and substitutions in memory-mappable columnar
+    files in directory `path`.
+
+    The directory is created if it doesn't exist. Use :meth:`save` and
+    :meth:`save_substitutions` to add data to the store, :meth:`scan` to read
+    memory-mapped columns, and :meth:`clusters`, :meth:`quotes` and
+    :meth:`substitutions` to get model instances back.
+
+    Note that quotes must be saved in the same call to :meth:`save` as the
+    clusters they belong to (which is what :class:`~.load.MemeTrackerParser`
+    and :func:`~.filter.filter_clusters` do), since :meth:`clusters` attaches
+    quotes to clusters part by part.
+
+    Parameters
+    ----------
+    path : str
+        Path to the directory holding the store.
+
+    """
+
+    #: Fixed-size columns of each table, with their NumPy dtypes.
+    fixed_columns = {
+        'clusters': (('id', 'int64'), ('sid', 'int64'),
+                     ('filtered', 'bool'), ('dump', 'int32')),
+        'quotes': (('id', 'int64'), ('cluster_id', 'int64'),
+                   ('sid', 'int64'), ('filtered', 'bool')),
+        'substitutions': (('id', 'int64'), ('source_id', 'int64'),
+                          ('destination_id', 'int64'),
+                          ('occurrence', 'int32'), ('start', 'int32'),
+                          ('position', 'int32')),
+    }
+
+    #: Variable-length string columns of each table, each stored as a flat
+    #: `uint8` array of UTF-8 data (`<name>.data.npy`) and an `int64` array of
+    #: offsets into it (`<name>.offsets.npy`).
+    string_columns = {
+        'clusters': ('source',),
+        'quotes': ('string',),
+        'substitutions': ('model',),
+    }
+
+    #: Url columns of quotes, with their NumPy dtypes (`None` for strings).
+    #: All of them are indexed by the `urls.offsets.npy` array of each quotes
+    #: part.
+    url_columns = (('url_timestamps', 'datetime64[us]'),
+                   ('url_frequencies', 'int32'),
+                   ('url_url_types', 'U1'),
+                   ('url_urls', None))
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+
+    def __repr__(self):
+        return 'ColumnarStore({!r})'.format(self.path)
+
+    def save(self, clusters, quotes):
+        """Save `clusters` and `quotes` to a new part of the store.
+
+        Parameters
+        ----------
+        clusters : iterable of :class:`~.db.Cluster`\ s
+            Clusters to save.
+        quotes : iterable of :class:`~.db.Quote`\ s
+            Quotes to save (with their urls). Clusters they reference should
+            be in `clusters`.
+
+        """
+
+        clusters = list(clusters)
+        quotes = list(quotes)
+        logger.debug('Saving %s clusters and %s quotes to columnar store',
+                     len(clusters), len(quotes))
+        cluster_part = self._write_part('clusters', clusters)
+        self._write_part('quotes', quotes, cluster_part=cluster_part)
+
+    def save_substitutions(self, substitutions):
+        """Save `substitutions` to a new part of the store.
+
+        Substitutions get consecutive ids following those already in the
+        store.
+
+        Parameters
+        ----------
+        substitutions : iterable of :class:`~.db.Substitution`\ s
+            Substitutions to save; their source and destination quotes should
+            be in the store.
+
+        """
+
+        substitutions = list(substitutions)
+        logger.debug('Saving %s substitutions to columnar store',
+                     len(substitutions))
+        next_id = self.max('substitutions', 'id')
+        next_id = 0 if next_id is None else next_id + 1
+        for i, substitution in enumerate(substitutions):
+            substitution.id = next_id + i
+            substitution.source_id = substitution.source.id
+            substitution.destination_id = substitution.destination.id
+        self._write_part('substitutions', substitutions)
+
+    def parts(self, table):
+        """Get the sorted list of part directories of `table`."""
+
+        directory = os.path.join(self.path, table)
+        if not os.path.isdir(directory):
+            return []
+        return [os.path.join(directory, name)
+                for name in sorted(os.listdir(directory))
+                if name.startswith('part-')]
+
+    def scan(self, table, *names, parts=None):
+        """Iterate through the parts of `table`, yielding memory-mapped
+        columns.
+
+        Parameters
+        ----------
+        table : str
+            Table to scan (`'clusters'`, `'quotes'` or `'substitutions'`).
+        names : strs
+            Names of the columns to load. String columns (and `url_urls`)
+            are returned as a `(data, offsets)` tuple of arrays; url columns
+            come with their `'urls.offsets'` array, which is added to the
+            result.
+        parts : list of strs, optional
+            Part directories to scan (as returned by :meth:`parts`); defaults
+            to all the parts of `table`.
+
+        Yields
+        ------
+        columns : dict
+            Arrays of the requested columns in a part, by column name.
+
+        """
+
+        if parts is None:
+            parts = self.parts(table)
+        for part in parts:
+            yield self._read_part(table, part, names)
+
+    def count(self, table, filtered=None, dump=None):
+        """Count the rows of `table`, optionally only those with `filtered`
+        status (for clusters and quotes) and in dump `dump` (for
+        clusters)."""
+
+        names = ['id']
+        if filtered is not None:
+            names.append('filtered')
+        if dump is not None:
+            names.append('dump')
+        return sum(int(self._mask(columns, filtered, dump).sum())
+                   for columns in self.scan(table, *names))
+
+    def max(self, table, name, filtered=None):
+        """Get the largest value of column `name` in `table` (optionally only
+        for rows with `filtered` status), or `None` if there are no such
+        rows."""
+
+        names = [name] if filtered is None else [name, 'filtered']
+        maximum = None
+        for columns in self.scan(table, *names):
+            values = columns[name][self._mask(columns, filtered, None)]
+            if len(values) > 0:
+                part_maximum = int(values.max())
+                maximum = (part_maximum if maximum is None
+                           else max(maximum, part_maximum))
+        return maximum
+
+    def quote_counts(self):
+        """Iterate through the parts of the quotes table, yielding ids,
+        cluster ids, sids, sizes (number of urls) and frequencies (sum of url
+        frequencies) of quotes as arrays.
+
+        Yields
+        ------
+        counts : dict
+            Arrays `'id'`, `'cluster_id'`, `'sid'`, `'size'` and
+            `'frequency'` for a part.
+
+        """
+
+        for columns in self.scan('quotes', 'id', 'cluster_id', 'sid',
+                                 'url_frequencies'):
+            offsets = columns['urls.offsets']
+            cumulated = np.concatenate([[0], np.cumsum(
+                columns['url_frequencies'], dtype='int64')])
+            yield {'id': columns['id'], 'cluster_id': columns['cluster_id'],
+                   'sid': columns['sid'], 'size': np.diff(offsets),
+                   'frequency': cumulated[offsets[1:]] -
+                   cumulated[offsets[:-1]]}
+
+    def quote_strings(self, filtered=None, parts=None):
+        """Iterate through the parts of the quotes table (or only `parts`),
+        yielding the strings and frequencies (sum of url frequencies) of
+        quotes, optionally only those with `filtered` status.
+
+        Yields
+        ------
+        strings : list of strs
+            Strings of the quotes in a part.
+        frequencies : list of ints
+            Frequencies of the quotes in a part.
+
+        """
+
+        names = ['string', 'url_frequencies']
+        if filtered is not None:
+            names.append('filtered')
+        for columns in self.scan('quotes', *names, parts=parts):
+            offsets = columns['urls.offsets']
+            cumulated = np.concatenate([[0], np.cumsum(
+                columns['url_frequencies'], dtype='int64')])
+            frequencies = cumulated[offsets[1:]] - cumulated[offsets[:-1]]
+            indices = np.flatnonzero(self._mask(columns, filtered, None))
+            yield ([_string(columns['string'], i) for i in indices],
+                   frequencies[indices].tolist())
+
+    def clusters(self, filtered=None, dump=None, limit=None):
+        """Iterate through the clusters of the store, with their quotes.
+
+        Clusters and quotes are transient :class:`~.db.Cluster` and
+        :class:`~.db.Quote` instances (not attached to any session), on which
+        e.g. :meth:`~.filter.ClusterFilterMixin.filter` and
+        :meth:`~.mine.ClusterMinerMixin.substitutions` work as with instances
+        from the database.
+
+        Parameters
+        ----------
+        filtered : bool, optional
+            If not `None`, only get clusters with this `filtered` status.
+        dump : int, optional
+            If not `None`, only get clusters from this dump.
+        limit : int, optional
+            If not `None`, stop after `limit` clusters.
+
+        Yields
+        ------
+        cluster : :class:`~.db.Cluster`
+
+        """
+
+        from brainscopypaste.db import Cluster
+
+        seen = 0
+        cluster_parts = self.parts('clusters')
+        quote_parts = dict((self._cluster_part(part), part)
+                           for part in self.parts('quotes'))
+        for cluster_part in cluster_parts:
+            columns = self._read_part('clusters', cluster_part,
+                                      ['id', 'sid', 'filtered', 'dump',
+                                       'source'])
+            indices = np.flatnonzero(self._mask(columns, filtered, dump))
+            if len(indices) == 0:
+                continue
+
+            quotes = {}
+            quote_part = quote_parts.get(os.path.basename(cluster_part))
+            if quote_part is None:
+                logger.warning("Clusters part '%s' has no quotes part (was "
+                               "a save interrupted?)", cluster_part)
+            else:
+                for quote in self._quotes(quote_part):
+                    quotes.setdefault(quote.cluster_id, []).append(quote)
+
+            for i in indices:
+                if limit is not None and seen >= limit:
+                    return
+                cluster = Cluster(id=int(columns['id'][i]),
+                                  sid=int(columns['sid'][i]),
+                                  filtered=bool(columns['filtered'][i]),
+                                  dump=int(columns['dump'][i]),
+                                  source=_string(columns['source'], i))
+                for quote in quotes.get(cluster.id, []):
+                    cluster.quotes.append(quote)
+                seen += 1
+                yield cluster
+
+    def quotes(self, filtered=None):
+        """Iterate through the quotes of the store (optionally only those
+        with `filtered` status), as transient :class:`~.db.Quote`\ s (without
+        their clusters)."""
+
+        for part in self.parts('quotes'):
+            for quote in self._quotes(part, filtered):
+                yield quote
+
+    def substitutions(self, model=None):
+        """Iterate through the substitutions of the store (optionally only
+        those mined with `model`), as transient :class:`~.db.Substitution`\ s
+        whose source and destination are transient :class:`~.db.Quote`\ s
+        from the store."""
+
+        from brainscopypaste.db import Substitution, ModelType
+
+        parts = [self._read_part('substitutions', part,
+                                 [name for name, _
+                                  in self.fixed_columns['substitutions']] +
+                                 ['model'])
+                 for part in self.parts('substitutions')]
+        model_type = ModelType()
+        models = [[model_type.process_result_value(_string(part['model'], i),
+                                                   None)
+                   for i in range(len(part['id']))]
+                  for part in parts]
+        if model is not None:
+            keep = [[m == model for m in part_models]
+                    for part_models in models]
+        else:
+            keep = [[True] * len(part_models) for part_models in models]
+
+        quote_ids = set()
+        for part, part_keep in zip(parts, keep):
+            quote_ids.update(part['source_id'][part_keep].tolist())
+            quote_ids.update(part['destination_id'][part_keep].tolist())
+        quotes = {}
+        for quote_part in self.parts('quotes'):
+            for quote in self._quotes(quote_part, ids=quote_ids):
+                quotes[quote.id] = quote
+
+        for part, part_models, part_keep in zip(parts, models, keep):
+            for i in np.flatnonzero(part_keep):
+                yield Substitution(
+                    id=int(part['id'][i]),
+                    source=quotes[int(part['source_id'][i])],
+                    destination=quotes[int(part['destination_id'][i])],
+                    occurrence=int(part['occurrence'][i]),
+                    start=int(part['start'][i]),
+                    position=int(part['position'][i]),
+                    model=part_models[i])
+
+    def count_substitutions(self, model=None, dump=None):
+        """Count the substitutions of the store (optionally only those mined
+        with `model`, and whose source quote is in a cluster of dump `dump`).
+
+        Only the `model` and `source_id` columns are scanned, and only the
+        `id`, `dump` and `cluster_id` columns of clusters and quotes if
+        `dump` is not `None`: no :class:`~.db.Substitution` or
+        :class:`~.db.Quote` is built.
+
+        """
+
+        from brainscopypaste.db import ModelType
+
+        source_ids = None
+        if dump is not None:
+            cluster_ids = [columns['id'][columns['dump'] == dump]
+                           for columns in self.scan('clusters', 'id', 'dump')]
+            cluster_ids = np.concatenate([np.array([], dtype='int64')] +
+                                         cluster_ids)
+            source_ids = [columns['id'][_isin(columns['cluster_id'],
+                                              cluster_ids)]
+                          for columns in self.scan('quotes', 'id',
+                                                   'cluster_id')]
+            source_ids = np.concatenate([np.array([], dtype='int64')] +
+                                        source_ids)
+
+        # Parse each distinct model string once.
+        model_type = ModelType()
+        matches = {}
+        count = 0
+        for columns in self.scan('substitutions', 'model', 'source_id'):
+            mask = self._mask(columns, None, None)
+            if model is not None:
+                for i in range(len(mask)):
+                    string = _string(columns['model'], i)
+                    if string not in matches:
+                        matches[string] = model_type.process_result_value(
+                            string, None) == model
+                    mask[i] = matches[string]
+            if source_ids is not None:
+                mask &= _isin(columns['source_id'], source_ids)
+            count += int(mask.sum())
+        return count
+
+    def _quotes(self, part, filtered=None, ids=None):
+        """Iterate through the quotes in quotes part `part` (optionally only
+        those with `filtered` status, or with an id in `ids`), as transient
+        :class:`~.db.Quote`\ s."""
+
+        from brainscopypaste.db import Quote
+
+        columns = self._read_part('quotes', part,
+                                  [name for name, _
+                                   in self.fixed_columns['quotes']] +
+                                  ['string'] +
+                                  [name for name, _ in self.url_columns])
+        mask = self._mask(columns, filtered, None)
+        if ids is not None:
+            mask &= _isin(columns['id'], ids)
+        offsets = columns['urls.offsets']
+        urls_data, urls_offsets = columns['url_urls']
+        for i in np.flatnonzero(mask):
+            start, end = offsets[i], offsets[i + 1]
+            yield Quote(
+                id=int(columns['id'][i]),
+                cluster_id=int(columns['cluster_id'][i]),
+                sid=int(columns['sid'][i]),
+                filtered=bool(columns['filtered'][i]),
+                string=_string(columns['string'], i),
+                url_timestamps=columns['url_timestamps'][start:end].tolist(),
+                url_frequencies=columns['url_frequencies'][start:end]
+                .tolist(),
+                url_url_types=columns['url_url_types'][start:end].tolist(),
+                url_urls=[bytes(urls_data[urls_offsets[j]:
+                                          urls_offsets[j + 1]])
+                          .decode('utf-8') for j in range(start, end)])
+
+    @classmethod
+    def _mask(cls, columns, filtered, dump):
+        """Get the boolean mask of rows in `columns` with `filtered` status
+        and in dump `dump` (either being ignored if `None`)."""
+
+        mask = np.ones(cls._n_rows(columns), dtype=bool)
+        if filtered is not None:
+            mask &= columns['filtered'] == filtered
+        if dump is not None:
+            mask &= columns['dump'] == dump
+        return mask
+
+    @staticmethod
+    def _n_rows(columns):
+        """Get the number of rows of a part from its `columns` (see
+        :meth:`_read_part`).
+
+        Url columns have one value per url, not per row, so the length is
+        read from the `'id'` column, or else from the url or string offsets.
+
+        """
+
+        if 'id' in columns:
+            return len(columns['id'])
+        if 'urls.offsets' in columns:
+            return len(columns['urls.offsets']) - 1
+        for name in sorted(columns):
+            if isinstance(columns[name], tuple):
+                return len(columns[name][1]) - 1
+        return len(columns[sorted(columns)[0]])
+
+    def _cluster_part(self, quote_part):
+        """Get the name of the clusters part saved along with quotes part
+        `quote_part`.
+
+        Stores written before quotes parts recorded it pair parts with the
+        same name.
+
+        """
+
+        try:
+            with open(os.path.join(quote_part, 'cluster_part')) as file:
+                return file.read()
+        except FileNotFoundError:
+            return os.path.basename(quote_part)
+
+    def _write_part(self, table, objects, cluster_part=None):
+        """Write the columns of `objects` to a new part of `table`, and
+        return its name.
+
+        For quotes, `cluster_part` is the name of the clusters part saved
+        with them, which is recorded in the part (see :meth:`_cluster_part`).
+
+        """
+
+        directory = os.path.join(self.path, table)
+        os.makedirs(directory, exist_ok=True)
+        parts = self.parts(table)
+        name = 'part-{:05}'.format(
+            0 if len(parts) == 0
+            else int(os.path.basename(parts[-1])[5:]) + 1)
+        tmp = os.path.join(directory, '.tmp-' + name)
+        if os.path.exists(tmp):
+            # Left over by an interrupted save.
+            shutil.rmtree(tmp)
+        os.makedirs(tmp)
+
+        for column, dtype in self.fixed_columns[table]:
+            values = [getattr(obj, column) for obj in objects]
+            if column == 'dump':
+                values = [0 if value is None else value for value in values]
+            np.save(os.path.join(tmp, column + '.npy'),
+                    np.array(values, dtype=dtype))
+        for column in self.string_columns[table]:
+            if column == 'model':
+                values = [str(obj.model) for obj in objects]
+            else:
+                values = [getattr(obj, column) for obj in objects]
+            _save_strings(os.path.join(tmp, column), values)
+
+        if table == 'quotes':
+            with open(os.path.join(tmp, 'cluster_part'), 'w') as file:
+                file.write(cluster_part)
+            lengths = [len(obj.url_timestamps or []) for obj in objects]
+            np.save(os.path.join(tmp, 'urls.offsets.npy'),
+                    np.concatenate([[0], np.cumsum(lengths, dtype='int64')]))
+            for column, dtype in self.url_columns:
+                values = [value for obj in objects
+                          for value in (getattr(obj, column) or [])]
+                if dtype is None:
+                    _save_strings(os.path.join(tmp, column), values)
+                else:
+                    np.save(os.path.join(tmp, column + '.npy'),
+                            np.array(values, dtype=dtype))
+
+        os.rename(tmp, os.path.join(directory, name))
+        return name
+
+    def _read_part(self, table, part, names):
+        """Memory-map the columns `names` of part directory `part` of
+        `table`."""
+
+        columns = {}
+        for name in names:
+            if (name in self.string_columns[table] or name == 'url_urls'):
+                columns[name] = (_load(os.path.join(part, name + '.data.npy')),
+                                 _load(os.path.join(part,
+                                                    name + '.offsets.npy')))
+            else:
+                columns[name] = _load(os.path.join(part, name + '.npy'))
+            if name.startswith('url_'):
+                columns['urls.offsets'] = _load(os.path.join(
+                    part, 'urls.offsets.npy'))
+        return columns
+
+
+def _save_strings(path, values):
+    """Save the list of `str` `values` as a flat array of UTF-8 data
+    (`path.data.npy`) and an array of offsets into it
+    (`path.offsets.npy`)."""
+
+    encoded = [value.encode('utf-8') for value in values]
+    np.save(path + '.data.npy',
+            np.frombuffer(b''.join(encoded), dtype='uint8'))
+    np.save(path + '.offsets.npy',
+            np.concatenate([[0], np.cumsum([len(data) for data in encoded],
+                                           dtype='int64')]))
+
+
+def _isin(values, ids):
+    """Get the boolean mask of `values` (an integer array) that are in the set
+    of `ids`.
+
+    This is :func:`numpy.isin`, which our pinned NumPy doesn't have, done with
+    a binary search in the sorted `ids`.
+
+    """
+
+    ids = np.sort(np.fromiter(ids, dtype='int64', count=len(ids)))
+    if len(ids) == 0:
+        return np.zeros(len(values), dtype=bool)
+    positions = np.minimum(np.searchsorted(ids, values), len(ids) - 1)
+    return ids[positions] == values
+
+
+def _string(column, i):
+    """Decode the `i`-th string of string column `column`, a `(data,
+    offsets)` tuple."""
+
+    data, offsets = column
+    return bytes(data[offsets[i]:offsets[i + 1]]).decode('utf-8')
+
+
+def _load(path):
+    """Memory-map the `.npy` file at `path` (empty arrays, which can't be
+    memory-mapped, are loaded normally)."""
+
+    try:
+        return np.load(path, mmap_mode='r')
+    except ValueError:
+        return np.load(path)
@@ -0,0 +1,251 @@
+import os
+from tempfile import mkstemp, TemporaryDirectory
+from datetime import datetime, timedelta
+
+import pytest
+
+from brainscopypaste.db import Cluster, Quote, Url, Substitution
+from brainscopypaste.columnar import ColumnarStore
+from brainscopypaste.load import MemeTrackerParser
+from brainscopypaste.load_test import content, contents_errored
+from brainscopypaste.mine import Model, Time, Source, Past, Durl
+
+
+@pytest.yield_fixture
+def store():
+    with TemporaryDirectory() as path:
+        yield ColumnarStore(path)
+
+
+@pytest.yield_fixture
+def memetracker_file():
+    fd, filepath = mkstemp()
+    with open(fd, 'w') as tmp:
+        tmp.write(content)
+
+    yield filepath
+    os.remove(filepath)
+
+
+def make_objects():
+    c0 = Cluster(id=0, sid=10, filtered=False, source='test', dump=0)
+    c1 = Cluster(id=1, sid=11, filtered=True, source='tëst', dump=1)
+    q0 = Quote(id=0, cluster_id=0, sid=20, filtered=False,
+               string='Some quote with ünicode')
+    q1 = Quote(id=1, cluster_id=1, sid=21, filtered=True,
+               string='Some other quote')
+    q2 = Quote(id=2, cluster_id=1, sid=22, filtered=True, string='')
+    # Add urls in reverse order to check they are stored ordered.
+    for i in range(3)[::-1]:
+        q0.add_url(Url(timestamp=(datetime(year=2008, month=1, day=1) +
+                                  timedelta(days=i, microseconds=i)),
+                       frequency=i + 1, url_type='B',
+                       url='Url with " and \' {}'.format(i)))
+    q1.add_url(Url(timestamp=datetime(year=2008, month=2, day=1),
+                   frequency=5, url_type='M', url=''))
+    return [c0, c1], [q0, q1, q2]
+
+
+def test_store_save_scan(store):
+    assert store.parts('clusters') == []
+    assert store.count('quotes') == 0
+    assert store.max('clusters', 'id') is None
+
+    clusters, quotes = make_objects()
+    store.save(clusters, quotes)
+    store.save([Cluster(id=2, sid=12, filtered=False, source='test')], [])
+
+    assert len(store.parts('clusters')) == 2
+    assert len(store.parts('quotes')) == 2
+    columns = list(store.scan('clusters', 'id', 'filtered'))
+    assert [c['id'].tolist() for c in columns] == [[0, 1], [2]]
+    assert [c['filtered'].tolist() for c in columns] == [[False, True],
+                                                         [False]]
+
+    assert store.count('clusters') == 3
+    assert store.count('clusters', filtered=False) == 2
+    assert store.count('clusters', dump=0) == 2
+    assert store.count('clusters', filtered=True, dump=0) == 0
+    assert store.count('quotes', filtered=True) == 2
+    assert store.max('clusters', 'id') == 2
+    assert store.max('clusters', 'id', filtered=True) == 1
+    assert store.max('quotes', 'sid', filtered=False) == 20
+
+    counts = list(store.quote_counts())
+    assert counts[0]['id'].tolist() == [0, 1, 2]
+    assert counts[0]['size'].tolist() == [3, 1, 0]
+    assert counts[0]['frequency'].tolist() == [6, 5, 0]
+    assert counts[1]['size'].tolist() == []
+
+
+def test_store_clusters_quotes(store):
+    clusters, quotes = make_objects()
+    store.save(clusters, quotes)
+
+    c0, c1 = store.clusters()
+    assert (c0.id, c0.sid, c0.filtered, c0.source, c0.dump) == \
+        (0, 10, False, 'test', 0)
+    assert (c1.id, c1.sid, c1.filtered, c1.source, c1.dump) == \
+        (1, 11, True, 'tëst', 1)
+    assert c0.size == 1
+    assert c1.size == 2
+    assert c0.frequency == 6
+    assert c1.frequency == 5
+
+    q0 = c0.quotes.one()
+    assert q0.string == 'Some quote with ünicode'
+    assert q0.size == 3
+    assert q0.urls[0].timestamp == datetime(year=2008, month=1, day=1)
+    assert q0.urls[2].timestamp == datetime(year=2008, month=1, day=3,
+                                            microsecond=2)
+    assert q0.urls[1].frequency == 2
+    assert q0.urls[1].url_type == 'B'
+    assert q0.urls[1].url == 'Url with " and \' 1'
+
+    assert [c.id for c in store.clusters(filtered=True)] == [1]
+    assert [c.id for c in store.clusters(dump=0)] == [0]
+    assert [c.id for c in store.clusters(limit=1)] == [0]
+
+    q1, q2 = store.quotes(filtered=True)
+    assert q1.urls[0].url == ''
+    assert q1.frequency == 5
+    assert q2.string == ''
+    assert q2.size == 0
+    assert q2.urls == []
+
+
+def test_store_mask_rows(store, monkeypatch):
+    # Quotes parts hold more urls than quotes, so masks must not take their
+    # length from the first column read, which can be a url column.
+    clusters, quotes = make_objects()
+    store.save(clusters, quotes)
+    read_part = store._read_part
+
+    def read_url_columns_first(table, part, names):
+        columns = read_part(table, part, names)
+        return dict(sorted(columns.items(),
+                           key=lambda item: (not item[0].startswith('url'),
+                                             item[0])))
+
+    monkeypatch.setattr(store, '_read_part', read_url_columns_first)
+    assert list(store.quote_strings(filtered=True)) == \
+        [(['Some other quote', ''], [5, 0])]
+    assert [q.id for q in store.quotes(filtered=True)] == [1, 2]
+    assert [q.id for q in store.quotes(filtered=False)] == [0]
+
+
+def test_store_interrupted_save(store, monkeypatch):
+    clusters, quotes = make_objects()
+    write_part = store._write_part
+
+    def interrupted(table, objects, cluster_part=None):
+        if table == 'quotes':
+            raise KeyboardInterrupt
+        return write_part(table, objects)
+
+    # A save interrupted after its clusters part leaves no quotes part.
+    monkeypatch.setattr(store, '_write_part', interrupted)
+    with pytest.raises(KeyboardInterrupt):
+        store.save(clusters[:1], quotes[:1])
+    monkeypatch.undo()
+    assert len(store.parts('clusters')) == 1
+    assert len(store.parts('quotes')) == 0
+
+    # Later saves still attach quotes to their own clusters.
+    store.save(clusters[1:], quotes[1:])
+    assert len(store.parts('clusters')) == 2
+    assert len(store.parts('quotes')) == 1
+    c0, c1 = store.clusters()
+    assert (c0.id, c0.size) == (0, 0)
+    assert (c1.id, c1.size) == (1, 2)
+    assert [q.id for q in c1.quotes] == [1, 2]
+
+    # Ids of quotes can be selected.
+    assert [q.id for q in store._quotes(store.parts('quotes')[0],
+                                        ids={2, 5})] == [2]
+
+
+def test_store_substitutions(store):
+    clusters, quotes = make_objects()
+    store.save(clusters, quotes)
+    q0, q1, q2 = quotes
+    model1 = Model(Time.discrete, Source.majority, Past.last_bin, Durl.all, 1)
+    model2 = Model(Time.discrete, Source.majority, Past.all, Durl.all, 1)
+
+    store.save_substitutions([
+        Substitution(source=q0, destination=q1, occurrence=0, start=1,
+                     position=2, model=model1)])
+    store.save_substitutions([
+        Substitution(source=q1, destination=q2, occurrence=1, start=0,
+                     position=0, model=model2),
+        Substitution(source=q0, destination=q2, occurrence=2, start=3,
+                     position=4, model=model1)])
+
+    assert store.count('substitutions') == 3
+    s0, s1, s2 = store.substitutions()
+    assert [s.id for s in (s0, s1, s2)] == [0, 1, 2]
+    assert s0.source.string == 'Some quote with ünicode'
+    assert s0.destination.id == 1
+    assert (s0.occurrence, s0.start, s0.position) == (0, 1, 2)
+    assert s0.model == model1
+    assert s1.model == model2
+    assert s2.source.urls[2].frequency == 3
+
+    assert [s.id for s in store.substitutions(model=model1)] == [0, 2]
+    assert [s.id for s in store.substitutions(model=model2)] == [1]
+
+    assert store.count_substitutions() == 3
+    assert store.count_substitutions(model=model1) == 2
+    assert store.count_substitutions(model=model2) == 1
+    assert store.count_substitutions(dump=0) == 2
+    assert store.count_substitutions(model=model1, dump=1) == 0
+    assert store.count_substitutions(model=model2, dump=1) == 1
+
+
+@pytest.mark.parametrize('kwargs', [{}, {'flush_clusters': 1},
+                                    {'engine': 'mmap'}])
+def test_parser_store(store, memetracker_file, kwargs):
+    MemeTrackerParser(memetracker_file, store=store, **kwargs).parse()
+
+    assert store.count('clusters') == 2
+    assert store.count('quotes') == 3
+    c3, c4 = sorted(store.clusters(), key=lambda c: c.sid)
+    assert c3.sid == 36543
+    assert c3.size == 2
+    assert c3.frequency == 5
+    assert c3.urls[0].url == 'some-url-with-"-and-\'-1'
+    assert c4.quotes.one().string == 'yes we can do this'
+
+    # Appending shifts ids as in the database.
+    parser = MemeTrackerParser(memetracker_file, store=store, append=True,
+                               **kwargs)
+    parser.parse()
+    assert parser.dump == 1
+    assert parser.cluster_id_offset == 43113
+    assert parser.quote_id_offset == 950239
+    assert store.count('clusters', dump=1) == 2
+    assert store.max('quotes', 'id') == 950239 + 950238
+
+
+@pytest.mark.parametrize('error', contents_errored.keys())
+def test_parser_store_errored(store, error):
+    fd, filepath = mkstemp()
+    with open(fd, 'w') as tmp:
+        tmp.write(contents_errored[error])
+
+    try:
+        with pytest.raises(ValueError) as excinfo:
+            MemeTrackerParser(filepath, store=store).parse()
+        assert error in str(excinfo.value)
+    finally:
+        os.remove(filepath)
+
+
+def test_parser_store_options(store):
+    with pytest.raises(ValueError) as excinfo:
+        MemeTrackerParser('file', store=store, jobs=2)
+    assert 'columnar store' in str(excinfo.value)
+    with pytest.raises(ValueError) as excinfo:
+        MemeTrackerParser('file', store=store, resume=True,
+                          flush_clusters=1)
+    assert 'columnar store' in str(excinfo.value)
@@ -8,6 +8,7 @@ fixtures and how to use them in test code.
 """
 
 
+import os
 from datetime import datetime, timedelta
 
 import pytest
@@ -18,6 +19,20 @@ from brainscopypaste.db import Base, Session, Cluster, Quote, Url, Substitution
 from brainscopypaste.mine import Model, Time, Source, Past, Durl
 
 
+@pytest.yield_fixture(autouse=True)
+def tag_cache():
+    """Point the persistent tag cache to an empty temporary file for each
+    test, so that tests neither read nor fill the real cache."""
+
+    from brainscopypaste.conf import settings
+    with settings.file_override('TAG_CACHE'):
+        path = settings.TAG_CACHE
+        yield
+    for suffix in ['-wal', '-shm']:
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+
+
 @pytest.yield_fixture
 def tmpdb():
     """Get a handle to an empty temporary database that is wiped on
@@ -8,8 +8,11 @@ exceptions around them.
 :class:`Cluster` and :class:`Quote` represent respectively an individual
 cluster or quote from the MemeTracker data set. :class:`Url` represents a quote
 occurrence, and those are stored as attributes of :class:`Quote`\ s (as opposed
-to in their own table). :class:`Substitution` represents an individual
+to in their own table), and can be added to quotes in bulk through a
+:class:`UrlBuffer`. :class:`Substitution` represents an individual
 substitution mined with a given substitution :class:`~.mine.Model`.
+:class:`LoadCheckpoint` records the progress of a MemeTracker load, so it can
+be resumed if interrupted.
 
 Each model (except :class:`Url`, which doesn't have its own table) inherits the
 :class:`BaseMixin`, which defines the table name, `id` field, and provides a
@@ -24,23 +27,30 @@ also inherit functionality from the :mod:`.mine`, :mod:`.filter` and
 :mod:`.features` modules, which you can inspect for more details.
 
 Finally, this module defines :func:`save_by_copy`, a useful function to
-efficiently import clusters and quotes in bulk into the database.
+efficiently import clusters and quotes in bulk into the database, either in
+PostgreSQL's text COPY format or in its binary COPY format (which PostgreSQL
+doesn't need to parse), and :func:`add_missing_columns`, which upgrades tables
+created before a column was added to a model.
 
 """
 
 
 import re
-from io import StringIO
+from itertools import chain
+from datetime import datetime
+import struct
 import logging
 
 import click
-from sqlalchemy import Column, Integer, String, Boolean, ForeignKey, cast
+from sqlalchemy import (Column, Integer, BigInteger, String, Boolean,
+                        ForeignKey, cast, inspect)
 from sqlalchemy.orm import relationship, sessionmaker
+from sqlalchemy.schema import CreateColumn
 from sqlalchemy.ext.declarative import declarative_base, declared_attr
 from sqlalchemy.types import DateTime, Enum, TypeDecorator
-from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.dialects.postgresql import ARRAY, JSON
 
-from brainscopypaste.utils import cache, session_scope
+from brainscopypaste.utils import cache, session_scope, execute_raw
 from brainscopypaste.filter import ClusterFilterMixin
 from brainscopypaste.mine import (SubstitutionValidatorMixin,
                                   ClusterMinerMixin, Model, Time, Source,
@@ -120,21 +130,39 @@ class Cluster(Base, BaseMixin, ClusterFilterMixin, ClusterMinerMixin):
     #: Source data set from which this cluster originated. Currently this is
     #: always `memetracker`.
     source = Column(String, nullable=False)
+    #: Number of the data set dump (i.e. file) from which this cluster
+    #: originated: `0` for the first file loaded, and one more for each file
+    #: added afterwards (see :class:`~.load.MemeTrackerParser`'s `append`).
+    dump = Column(Integer, default=0, server_default='0', nullable=False)
     #: List of :class:`Quote`\ s in this cluster (this is a dynamic
     #: relationship on which you can run queries).
     quotes = relationship('Quote', back_populates='cluster', lazy='dynamic',
                           cascade='all, delete-orphan', passive_deletes=True)
 
     #: Tuple of column names that are used by :meth:`format_copy`.
-    format_copy_columns = ('id', 'sid', 'filtered', 'source')
+    format_copy_columns = ('id', 'sid', 'filtered', 'source', 'dump')
 
     def format_copy(self):
         """Create a string representing the cluster in a
         :meth:`cursor.copy_from` or :func:`_copy` call."""
 
         base = ('{cluster.id}\t{cluster.sid}\t{cluster.filtered}\t'
-                '{cluster.source}')
-        return base.format(cluster=self)
+                '{cluster.source}\t{dump}')
+        return base.format(cluster=self,
+                           dump=0 if self.dump is None else self.dump)
+
+    def format_copy_binary(self):
+        """Create a `bytes` tuple representing the cluster in PostgreSQL's
+        binary COPY format, for a :func:`_copy_binary` call.
+
+        Columns are the same as for :meth:`format_copy`.
+
+        """
+
+        return (_binary_tuple_header(len(self.format_copy_columns)) +
+                _binary_integer(self.id) + _binary_integer(self.sid) +
+                _binary_boolean(self.filtered) + _binary_text(self.source) +
+                _binary_integer(0 if self.dump is None else self.dump))
 
     @cache
     def size(self):
@@ -274,6 +302,18 @@ class Quote(Base, BaseMixin):
     url_url_types = Column(ArrayOfEnum(url_type), default=[], nullable=False)
     #: List of `str`\ s representing the URIs of the children urls.
     url_urls = Column(ARRAY(String), default=[], nullable=False)
+    #: List of TreeTagger POS tags of the tokens in :attr:`string`, stored
+    #: by :func:`~.load.load_quote_tags` (`None` if the quote was not
+    #: tagged); read by :attr:`tags`.
+    string_tags = Column(ARRAY(String), nullable=True)
+    #: List of the tokens in :attr:`string`, stored by
+    #: :func:`~.load.load_quote_tags` (`None` if the quote was not tagged);
+    #: read by :attr:`tokens`.
+    string_tokens = Column(ARRAY(String), nullable=True)
+    #: List of the lemmas in :attr:`string`, stored by
+    #: :func:`~.load.load_quote_tags` (`None` if the quote was not tagged);
+    #: read by :attr:`lemmas`.
+    string_lemmas = Column(ARRAY(String), nullable=True)
     #: List of :class:`Substitution`\ s for which this quote is the source
     #: (this is a dynamic relationship on which you can run queries).
     substitutions_source = relationship(
@@ -290,7 +330,8 @@ class Quote(Base, BaseMixin):
     #: Tuple of column names that are used by :meth:`format_copy`.
     format_copy_columns = ('id', 'cluster_id', 'sid', 'filtered', 'string',
                            'url_timestamps', 'url_frequencies',
-                           'url_url_types', 'url_urls')
+                           'url_url_types', 'url_urls', 'string_tags',
+                           'string_tokens', 'string_lemmas')
 
     def format_copy(self):
         """Create a string representing the quote and all its children urls in
@@ -314,17 +355,55 @@ class Quote(Base, BaseMixin):
         parts.append('{' +
                      ', '.join(map('{}'.format, url_types)) +
                      '}')
-        # Two levels of escaping backslashes and double quotes too here.
-        # (See http://www.postgresql.org/docs/9.5/static/arrays.html).
-        urls = [url.url.replace('\\', '\\\\').replace('"', '\\"')
-                for url in self.urls]
-        parts.append(
-            "{" +
-            ', '.join(map('"{}"'.format, urls)).replace('\\', '\\\\') +
-            "}"
-        )
+        parts.append(_copy_text_array([url.url for url in self.urls]))
+        for values in [self.string_tags, self.string_tokens,
+                       self.string_lemmas]:
+            parts.append('\\N' if values is None
+                         else _copy_text_array(values))
         return '\t'.join(parts)
 
+    def format_copy_binary(self, url_type_oid):
+        """Create a `bytes` tuple representing the quote and all its children
+        urls in PostgreSQL's binary COPY format, for a :func:`_copy_binary`
+        call.
+
+        Columns are the same as for :meth:`format_copy`, and urls are also
+        sorted by timestamp. Arrays are encoded directly from the `url_*`
+        attributes, without creating any :class:`Url`.
+
+        Parameters
+        ----------
+        url_type_oid : int
+            PostgreSQL oid of the :data:`url_type` enum type, as returned by
+            :func:`_url_type_oid`.
+
+        """
+
+        timestamps = self.url_timestamps or []
+        frequencies = self.url_frequencies or []
+        url_types = self.url_url_types or []
+        urls = self.url_urls or []
+        order = sorted(range(len(timestamps)), key=timestamps.__getitem__)
+        if order != list(range(len(order))):
+            timestamps = [timestamps[i] for i in order]
+            frequencies = [frequencies[i] for i in order]
+            url_types = [url_types[i] for i in order]
+            urls = [urls[i] for i in order]
+
+        return (_binary_tuple_header(len(self.format_copy_columns)) +
+                _binary_integer(self.id) + _binary_integer(self.cluster_id) +
+                _binary_integer(self.sid) + _binary_boolean(self.filtered) +
+                _binary_text(self.string) +
+                _binary_timestamp_array(timestamps) +
+                _binary_integer_array(frequencies) +
+                _binary_text_array(url_types, url_type_oid) +
+                _binary_text_array(urls, _VARCHAR_OID) +
+                b''.join([_BINARY_NULL if values is None
+                          else _binary_text_array(values, _VARCHAR_OID)
+                          for values in [self.string_tags,
+                                         self.string_tokens,
+                                         self.string_lemmas]]))
+
     @cache
     def size(self):
         """Number of urls in the quote.
@@ -373,6 +452,10 @@ class Quote(Base, BaseMixin):
     def tags(self):
         """List of TreeTagger POS tags of the tokens in the quote's :attr:`string`.
 
+        Read from :attr:`string_tags` if the quote was tagged by
+        :func:`~.load.load_quote_tags`, and computed with TreeTagger
+        otherwise.
+
         Raises
         ------
         ValueError
@@ -380,6 +463,8 @@ class Quote(Base, BaseMixin):
 
         """
 
+        if self.string_tags is not None:
+            return tuple(self.string_tags)
         if self.string is None:
             raise ValueError('No string defined on this quote yet, '
                              "tags doesn't make sense.")
@@ -390,6 +475,10 @@ class Quote(Base, BaseMixin):
     def tokens(self):
         """List of the tokens in the quote's :attr:`string`.
 
+        Read from :attr:`string_tokens` if the quote was tagged by
+        :func:`~.load.load_quote_tags`, and computed with TreeTagger
+        otherwise.
+
         Raises
         ------
         ValueError
@@ -397,6 +486,8 @@ class Quote(Base, BaseMixin):
 
         """
 
+        if self.string_tokens is not None:
+            return tuple(self.string_tokens)
         if self.string is None:
             raise ValueError('No string defined on this quote yet, '
                              "tokens doesn't make sense.")
@@ -407,6 +498,10 @@ class Quote(Base, BaseMixin):
     def lemmas(self):
         """List of the lemmas in the quote's :attr:`string`.
 
+        Read from :attr:`string_lemmas` if the quote was tagged by
+        :func:`~.load.load_quote_tags`, and computed with TreeTagger
+        otherwise.
+
         Raises
         ------
         ValueError
@@ -414,6 +509,8 @@ class Quote(Base, BaseMixin):
 
         """
 
+        if self.string_lemmas is not None:
+            return tuple(self.string_lemmas)
         if self.string is None:
             raise ValueError('No string defined on this quote yet, '
                              "lemmas doesn't make sense.")
@@ -454,13 +551,7 @@ class Quote(Base, BaseMixin):
 
         """
 
-        if 'urls' in self.__dict__:
-            raise SealedException('self.urls has already been accessed, '
-                                  'cannot add more urls')
-        self.url_timestamps = (self.url_timestamps or []) + [url.timestamp]
-        self.url_frequencies = (self.url_frequencies or []) + [url.frequency]
-        self.url_url_types = (self.url_url_types or []) + [url.url_type]
-        self.url_urls = (self.url_urls or []) + [url.url]
+        self.add_urls([url])
 
     def add_urls(self, urls):
         """Add a list of :class:`Url`\ s to the quote.
@@ -469,9 +560,15 @@ class Quote(Base, BaseMixin):
         want to persist this to the database, you should do it inside a session
         and commit afterwards (e.g. using :func:`~.utils.session_scope`).
 
+        The `url_*` columns of the quote are extended once for all the urls,
+        so adding many urls this way is much faster than adding them one by
+        one with :meth:`add_url`. If you don't have :class:`Url` instances at
+        hand, accumulate url fields in a :class:`UrlBuffer` and pass that
+        instead, to avoid creating :class:`Url`\ s altogether.
+
         Parameters
         ----------
-        urls : list of :class:`Url`\ s
+        urls : list of :class:`Url`\ s, or :class:`UrlBuffer`
             The urls to add to the quote.
 
         Raises
@@ -483,8 +580,72 @@ class Quote(Base, BaseMixin):
 
         """
 
+        if not isinstance(urls, UrlBuffer):
+            urls = UrlBuffer(urls)
+        if len(urls) == 0:
+            return
+
+        if 'urls' in self.__dict__:
+            raise SealedException('self.urls has already been accessed, '
+                                  'cannot add more urls')
+        # Assign new lists (instead of extending the existing ones in place)
+        # so SQLAlchemy sees the change.
+        self.url_timestamps = (self.url_timestamps or []) + urls.timestamps
+        self.url_frequencies = (self.url_frequencies or []) + urls.frequencies
+        self.url_url_types = (self.url_url_types or []) + urls.url_types
+        self.url_urls = (self.url_urls or []) + urls.urls
+
+
+class UrlBuffer:
+
+    """Accumulate the fields of urls column by column, to add them to a
+    :class:`Quote` in one go with :meth:`Quote.add_urls`.
+
+    This is used by :class:`~.load.MemeTrackerParser` to build quotes with many
+    urls without creating intermediary :class:`Url` instances, and without
+    extending the quote's `url_*` columns once per url.
+
+    Parameters
+    ----------
+    urls : iterable of :class:`Url`\ s, optional
+        Urls to start the buffer with.
+
+    Attributes
+    ----------
+    timestamps : list of :class:`~datetime.datetime`\ s
+        Url timestamps.
+    frequencies : list of ints
+        Url frequencies.
+    url_types : list of :data:`url_type`\ s
+        Url types.
+    urls : list of strs
+        Url URIs.
+
+    """
+
+    def __init__(self, urls=()):
+        self.timestamps = []
+        self.frequencies = []
+        self.url_types = []
+        self.urls = []
+        self.extend(urls)
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def append(self, timestamp, frequency, url_type, url):
+        """Add the fields of a single url to the buffer."""
+
+        self.timestamps.append(timestamp)
+        self.frequencies.append(frequency)
+        self.url_types.append(url_type)
+        self.urls.append(url)
+
+    def extend(self, urls):
+        """Add an iterable of :class:`Url`\ s to the buffer."""
+
         for url in urls:
-            self.add_url(url)
+            self.append(url.timestamp, url.frequency, url.url_type, url.url)
 
 
 class Url:
@@ -653,7 +814,217 @@ class Substitution(Base, BaseMixin, SubstitutionValidatorMixin,
                 self.destination.lemmas[self.position])
 
 
-def _copy(string, table, columns):
+class LoadCheckpoint(Base, BaseMixin):
+
+    """Represent a batch of clusters and quotes saved to the database while
+    loading a MemeTracker file, to be able to resume the load if it is
+    interrupted.
+
+    Checkpoints are saved by :class:`~.load.MemeTrackerParser` in the same
+    transaction as the batch they describe, so the last checkpoint for a file
+    always matches what was saved from that file. They are deleted once the
+    load is finished and checked.
+
+    """
+
+    #: Absolute path of the file being loaded.
+    filename = Column(String, nullable=False)
+    #: Byte offset in the file of the first cluster that was not saved yet.
+    offset = Column(BigInteger, nullable=False)
+    #: Number of clusters read up to :attr:`offset`.
+    clusters_read = Column(Integer, nullable=False)
+    #: Number of quotes read up to :attr:`offset`.
+    quotes_read = Column(Integer, nullable=False)
+    #: Number of lines read up to :attr:`offset`.
+    lines_read = Column(Integer, nullable=False)
+    #: Dump number given to the clusters loaded from the file.
+    dump = Column(Integer, nullable=False)
+    #: Offset added to cluster ids from the file.
+    cluster_id_offset = Column(Integer, nullable=False)
+    #: Offset added to quote ids from the file.
+    quote_id_offset = Column(Integer, nullable=False)
+    #: Counts to check the clusters and quotes of this batch against, in the
+    #: format of `MemeTrackerParser._checks` (JSON turns keys into strings).
+    checks = Column(JSON, nullable=False)
+
+
+#: Signature, flags and header extension of PostgreSQL's binary COPY format
+#: (see `PostgreSQL's documentation
+#: <https://www.postgresql.org/docs/9.5/static/sql-copy.html#AEN74312>`_).
+_BINARY_COPY_HEADER = b'PGCOPY\n\xff\r\n\x00' + struct.pack('>ii', 0, 0)
+#: Trailer of PostgreSQL's binary COPY format.
+_BINARY_COPY_TRAILER = struct.pack('>h', -1)
+#: Origin of PostgreSQL's binary timestamps (which count microseconds).
+_BINARY_EPOCH = datetime(2000, 1, 1)
+#: PostgreSQL oids of the `int4`, `timestamp` and `varchar` types.
+_INT4_OID = 23
+_TIMESTAMP_OID = 1114
+_VARCHAR_OID = 1043
+#: Packer for the 4-byte lengths of binary COPY fields.
+_pack_length = struct.Struct('>i').pack
+#: Binary COPY `NULL` field.
+_BINARY_NULL = _pack_length(-1)
+
+
+def _binary_tuple_header(count):
+    """Encode the start of a binary COPY tuple of `count` fields."""
+    return struct.pack('>h', count)
+
+
+def _binary_integer(value):
+    """Encode an `int` as a binary COPY `integer` field."""
+    return struct.pack('>ii', 4, value)
+
+
+def _binary_boolean(value):
+    """Encode a `bool` as a binary COPY `boolean` field."""
+    return b'\x00\x00\x00\x01\x01' if value else b'\x00\x00\x00\x01\x00'
+
+
+def _binary_text(value):
+    """Encode a `str` as a binary COPY text (or `varchar`, or enum)
+    field."""
+    data = value.encode('utf-8')
+    return _pack_length(len(data)) + data
+
+
+def _binary_array(oid, count, elements):
+    """Encode a one-dimensional binary COPY array field of `count` elements
+    of type `oid`, from the already encoded (`bytes`) `elements`."""
+
+    if count == 0:
+        return struct.pack('>iiii', 12, 0, 0, oid)
+    return (struct.pack('>iiiiii', 20 + len(elements), 1, 0, oid, count, 1) +
+            elements)
+
+
+def _binary_integer_array(values):
+    """Encode a list of `int`\ s as a binary COPY `integer[]` field."""
+
+    count = len(values)
+    elements = [None] * (2 * count)
+    elements[::2] = [4] * count
+    elements[1::2] = values
+    return _binary_array(_INT4_OID, count,
+                         struct.pack('>{}i'.format(2 * count), *elements))
+
+
+def _binary_timestamp_array(values):
+    """Encode a list of naive :class:`~datetime.datetime`\ s as a binary
+    COPY `timestamp[]` field."""
+
+    count = len(values)
+    elements = [None] * (2 * count)
+    elements[::2] = [8] * count
+    microseconds = []
+    for value in values:
+        delta = value - _BINARY_EPOCH
+        microseconds.append((delta.days * 86400 + delta.seconds) * 1000000 +
+                            delta.microseconds)
+    elements[1::2] = microseconds
+    return _binary_array(_TIMESTAMP_OID, count,
+                         struct.pack('>' + 'iq' * count, *elements))
+
+
+def _binary_text_array(values, oid):
+    """Encode a list of `str`\ s as a binary COPY array field of text-like
+    type `oid` (e.g. `varchar[]`, or an array of enums)."""
+
+    return _binary_array(oid, len(values),
+                         b''.join([_pack_length(len(data)) + data
+                                   for data in [value.encode('utf-8')
+                                                for value in values]]))
+
+
+def _copy_text_array(values):
+    """Format a list of `str`\ s as a text array for a :func:`_copy` call."""
+
+    # Two levels of escaping backslashes and double quotes here.
+    # (See http://www.postgresql.org/docs/9.5/static/arrays.html).
+    escaped = [value.replace('\\', '\\\\').replace('"', '\\"')
+               for value in values]
+    return ("{" +
+            ', '.join(map('"{}"'.format, escaped)).replace('\\', '\\\\') +
+            "}")
+
+
+def _url_type_oid(session):
+    """Get the PostgreSQL oid of the :data:`url_type` enum type, needed to
+    encode arrays of url types in the binary COPY format."""
+
+    return session.execute("SELECT '{}'::regtype::oid"
+                           .format(url_type.name)).scalar()
+
+
+class _IterableReader:
+
+    """Read-only file-like object over an iterable of `bytes` (or `str`)
+    chunks.
+
+    Chunks are only pulled from the iterable as they are read, so data can be
+    streamed to :meth:`cursor.copy_expert` without being joined in memory
+    first, and memory use doesn't depend on how much data is streamed.
+
+    Parameters
+    ----------
+    chunks : iterable of bytes or str
+        Data to read.
+    empty : bytes or str, optional
+        Empty value of the same type as the chunks; defaults to `b''`, use
+        `''` for `str` chunks.
+
+    """
+
+    def __init__(self, chunks, empty=b''):
+        self._chunks = iter(chunks)
+        self._empty = empty
+        self._buffer = empty
+        self._position = 0
+
+    def read(self, size=-1):
+        """Read at most `size` bytes (or characters; all the remaining data if
+        `size` is negative or `None`); an empty result means the end was
+        reached."""
+
+        if size is None or size < 0:
+            data = self._buffer[self._position:] + \
+                self._empty.join(self._chunks)
+            self._buffer = self._empty
+            self._position = 0
+            return data
+
+        parts = []
+        length = 0
+        while length < size:
+            if self._position >= len(self._buffer):
+                try:
+                    self._buffer = next(self._chunks)
+                except StopIteration:
+                    break
+                self._position = 0
+            part = self._buffer[self._position:
+                                self._position + size - length]
+            self._position += len(part)
+            parts.append(part)
+            length += len(part)
+        return self._empty.join(parts)
+
+
+class _Counter:
+
+    """Iterable wrapper counting the items iterated in `iterable`."""
+
+    def __init__(self, iterable):
+        self.iterable = iterable
+        self.count = 0
+
+    def __iter__(self):
+        for item in self.iterable:
+            self.count += 1
+            yield item
+
+
+def _copy(string, table, columns, session=None):
     """Execute a PostgreSQL COPY command.
 
     COPY is one of the fastest methods to import data in bulk into PostgreSQL.
@@ -662,12 +1033,16 @@ def _copy(string, table, columns):
 
     Parameters
     ----------
-    string : file-like object
+    string : file-like object or iterable of str
         Contents of the data to import into the database, formatted for the
         COPY command (see `PostgreSQL's documentation
         <https://www.postgresql.org/docs/9.5/static/sql-copy.html>`_ for more
         details). Can be an :class:`io.StringIO` if you don't want to use a
-        real file in the filesystem.
+        real file in the filesystem, or any iterable of rows (without their
+        trailing newline, e.g. a generator of :meth:`Quote.format_copy`
+        results), which are then streamed to PostgreSQL as they are produced
+        (through :class:`_IterableReader`) instead of being held in
+        memory.
     table : str
         Name of the table into which the data is imported.
     columns : list of str
@@ -676,6 +1051,9 @@ def _copy(string, table, columns):
         :meth:`Cluster.format_copy` you can use the corresponding
         :attr:`Quote.format_copy_columns` or
         :attr:`Cluster.format_copy_columns` for this parameter.
+    session : :class:`~sqlalchemy.orm.session.Session`, optional
+        Session in which to execute the command; if `None` (default), the
+        command is executed and committed in its own session.
 
     See Also
     --------
@@ -683,45 +1061,200 @@ def _copy(string, table, columns):
 
     """
 
-    string.seek(0)
-    with session_scope() as session:
-        cursor = session.connection().connection.cursor()
+    if session is None:
+        with session_scope() as session:
+            _copy(string, table, columns, session=session)
+        return
+
+    cursor = session.connection().connection.cursor()
+    if hasattr(string, 'read'):
+        string.seek(0)
         cursor.copy_from(string, table, columns=columns)
+    else:
+        rows = _IterableReader((row + '\n' for row in string), empty='')
+        cursor.copy_expert('COPY {} ({}) FROM STDIN'
+                           .format(table, ', '.join(columns)),
+                           rows, size=2 ** 16)
+
 
+def _copy_binary(rows, table, columns, session=None):
+    """Execute a PostgreSQL COPY command in binary format.
 
-def save_by_copy(clusters, quotes):
-    """Import a list of clusters and a list of quotes into the database.
+    This is the same as :func:`_copy`, except that rows are already encoded in
+    PostgreSQL's binary COPY format, which the server doesn't need to parse.
+    Rows are streamed to the raw psycopg2 :meth:`cursor.copy_expert` as they
+    are read, between the format's header and trailer.
+
+    Parameters
+    ----------
+    rows : iterable of bytes
+        Rows to import into the database (e.g. a generator, which is consumed
+        as the rows are sent), each one encoded by
+        :meth:`Quote.format_copy_binary` or :meth:`Cluster.format_copy_binary`
+        (or in the same way).
+    table : str
+        Name of the table into which the data is imported.
+    columns : list of str
+        List of the column names encoded in each row.
+    session : :class:`~sqlalchemy.orm.session.Session`, optional
+        Session in which to execute the command; if `None` (default), the
+        command is executed and committed in its own session.
+
+    See Also
+    --------
+    _copy, save_by_copy
+
+    """
+
+    if session is None:
+        with session_scope() as session:
+            _copy_binary(rows, table, columns, session=session)
+        return
+
+    data = _IterableReader(chain([_BINARY_COPY_HEADER], rows,
+                                 [_BINARY_COPY_TRAILER]))
+    cursor = session.connection().connection.cursor()
+    cursor.copy_expert('COPY {} ({}) FROM STDIN WITH (FORMAT binary)'
+                       .format(table, ', '.join(columns)),
+                       data, size=2 ** 16)
+
+
+def save_by_copy(clusters, quotes, echo=True, session=None, binary=False):
+    """Import clusters and quotes into the database.
 
     This function uses PostgreSQL's COPY command to bulk import clusters and
-    quotes, and prints its progress to stdout.
+    quotes, and prints its progress to stdout (unless `echo` is `False`).
+    Clusters and quotes are formatted one at a time as PostgreSQL reads them,
+    so no formatted copy of the whole data is held in memory.
 
     Parameters
     ----------
-    clusters : list of :class:`Cluster`\ s
-        List of clusters to import in the database.
-    quotes : list of :class:`Quote`\ s
-        List of quotes to import in the database. Any clusters they reference
-        should be in the `clusters` parameter.
+    clusters : iterable of :class:`Cluster`\ s
+        Clusters to import in the database (e.g. a list or a generator).
+    quotes : iterable of :class:`Quote`\ s
+        Quotes to import in the database, iterated after `clusters` is
+        exhausted. Any clusters they reference should be in the `clusters`
+        parameter.
+    echo : bool, optional
+        If `False`, don't print progress to stdout (progress is still logged);
+        useful when importing many small batches. Defaults to `True`.
+    session : :class:`~sqlalchemy.orm.session.Session`, optional
+        Session in which to import the data, e.g. to import it in the same
+        transaction as other changes; if `None` (default), clusters and quotes
+        are each imported and committed in their own session.
+    binary : bool, optional
+        If `True`, use PostgreSQL's binary COPY format (with
+        :meth:`Cluster.format_copy_binary` and
+        :meth:`Quote.format_copy_binary`) instead of its text format, which
+        saves PostgreSQL from parsing the text back. Defaults to `False`.
 
     See Also
     --------
-    .load.MemeTrackerParser.parse
+    .load.MemeTrackerParser.parse, save_rows_by_copy
+
+    """
+
+    if not binary:
+        save_rows_by_copy((cluster.format_copy() for cluster in clusters),
+                          (quote.format_copy() for quote in quotes),
+                          echo=echo, session=session)
+        return
+
+    if session is None:
+        with session_scope() as oid_session:
+            url_type_oid = _url_type_oid(oid_session)
+    else:
+        url_type_oid = _url_type_oid(session)
+    save_rows_by_copy((cluster.format_copy_binary() for cluster in clusters),
+                      (quote.format_copy_binary(url_type_oid)
+                       for quote in quotes),
+                      echo=echo, session=session, binary=True)
+
+
+def save_rows_by_copy(cluster_rows, quote_rows, echo=True, session=None,
+                      binary=False):
+    """Import cluster rows and quote rows into the database.
+
+    This is the same as :func:`save_by_copy`, except that clusters and quotes
+    have already been formatted with :meth:`Cluster.format_copy` and
+    :meth:`Quote.format_copy` (which is useful when they were parsed in
+    another process).
+
+    Parameters
+    ----------
+    cluster_rows : iterable of str or bytes
+        Formatted clusters to import in the database, streamed to PostgreSQL
+        as they are iterated.
+    quote_rows : iterable of str or bytes
+        Formatted quotes to import in the database, iterated after
+        `cluster_rows` is exhausted. Any clusters they reference should be in
+        the `cluster_rows` parameter.
+    echo : bool, optional
+        If `False`, don't print progress to stdout (progress is still logged).
+        Defaults to `True`.
+    session : :class:`~sqlalchemy.orm.session.Session`, optional
+        Session in which to import the data; if `None` (default), clusters and
+        quotes are each imported and committed in their own session.
+    binary : bool, optional
+        If `True`, rows are `bytes` encoded with
+        :meth:`Cluster.format_copy_binary` and
+        :meth:`Quote.format_copy_binary`, and are imported with
+        :func:`_copy_binary`. Defaults to `False`.
+
+    See Also
+    --------
+    save_by_copy, .load.MemeTrackerParser._parse_parallel
 
     """
 
     # Order the objects inserted so the engine bulks them together.
-    logger.debug("Saving %s clusters with 'copy_from'", len(clusters))
-    click.echo('Saving clusters... ', nl=False)
-    objects = StringIO()
-    objects.writelines([cluster.format_copy() + '\n' for cluster in clusters])
-    _copy(objects, Cluster.__tablename__, Cluster.format_copy_columns)
-    objects.close()
-    click.secho('OK', fg='green', bold=True)
-
-    logger.debug("Saving %s quotes with 'copy_from'", len(quotes))
-    click.echo('Saving quotes... ', nl=False)
-    objects = StringIO()
-    objects.writelines([quote.format_copy() + '\n' for quote in quotes])
-    _copy(objects, Quote.__tablename__, Quote.format_copy_columns)
-    objects.close()
-    click.secho('OK', fg='green', bold=True)
+    copy = _copy_binary if binary else _copy
+    for name, model, rows in [('clusters', Cluster, cluster_rows),
+                              ('quotes', Quote, quote_rows)]:
+        logger.debug("Saving %s with %s COPY", name,
+                     'binary' if binary else 'text')
+        if echo:
+            click.echo('Saving {}... '.format(name), nl=False)
+        counter = _Counter(rows)
+        copy(counter, model.__tablename__, model.format_copy_columns,
+             session=session)
+        logger.debug('Saved %s %s', counter.count, name)
+        if echo:
+            click.secho('OK', fg='green', bold=True)
+
+
+def add_missing_columns(engine):
+    """Add the columns defined in the models but missing from existing
+    tables.
+
+    :meth:`~sqlalchemy.schema.MetaData.create_all` creates missing tables but
+    leaves existing ones untouched, so a database created before a new
+    column was added (e.g. :attr:`Quote.string_tokens` or
+    :attr:`Cluster.dump`) is upgraded here with `ALTER TABLE` statements.
+    Only nullable columns and columns with a server default can be added this
+    way, so that existing rows stay valid.
+
+    Parameters
+    ----------
+    engine : :class:`sqlalchemy.engine.Engine`
+        The engine connected to the database to upgrade.
+
+    """
+
+    inspector = inspect(engine)
+    for table in Base.metadata.sorted_tables:
+        existing = set(column['name']
+                       for column in inspector.get_columns(table.name))
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            if not column.nullable and column.server_default is None:
+                logger.warning("Can't add missing column '%s' to table '%s' "
+                               "(it is not nullable and has no server "
+                               "default)", column.name, table.name)
+                continue
+            logger.info("Adding missing column '%s' to table '%s'",
+                        column.name, table.name)
+            execute_raw(engine, 'ALTER TABLE {} ADD COLUMN {};'.format(
+                table.name, CreateColumn(column).compile(
+                    dialect=engine.dialect)))
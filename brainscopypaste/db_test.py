@@ -8,9 +8,10 @@ from datetime import datetime, timedelta
 from sqlalchemy.exc import DataError
 import pytest
 
-from brainscopypaste.utils import session_scope
-from brainscopypaste.db import (Cluster, Quote, Url, Substitution,
-                                SealedException)
+from brainscopypaste.utils import session_scope, execute_raw
+from brainscopypaste.db import (Session, Cluster, Quote, Url, UrlBuffer,
+                                Substitution, SealedException, save_by_copy,
+                                add_missing_columns, _IterableReader, _copy)
 from brainscopypaste.mine import Model, Past, Source, Time, Durl
 
 
@@ -41,7 +42,7 @@ def test_cluster(some_clusters):
         assert session.query(Cluster).filter_by(sid=0).one().urls == []
 
         assert session.query(Cluster).get(1).format_copy() == \
-            '1\t0\tFalse\ttest'
+            '1\t0\tFalse\ttest\t0'
 
 
 def test_quote(some_quotes):
@@ -106,7 +107,33 @@ def test_quote(some_quotes):
         q0 = session.query(Quote).filter_by(sid=0).one()
         assert q0.format_copy() == ('{}'.format(q0.id) +
                                     "\t1\t0\tFalse\tSome quote to "
-                                    "tokenize 0\t{}\t{}\t{}\t{}")
+                                    "tokenize 0\t{}\t{}\t{}\t{}"
+                                    "\t\\N\t\\N\t\\N")
+
+
+def test_quote_stored_tags(some_quotes):
+    """Check :class:`~.db.Quote` reads tags, tokens and lemmas from its
+    `string_*` columns when they are set."""
+
+    with session_scope() as session:
+        quote = session.query(Quote).filter_by(sid=6).one()
+        quote.string_tags = ['XX', 'YY']
+        quote.string_tokens = ['stored', 'tokens']
+        quote.string_lemmas = ['store', 'token']
+
+    with session_scope() as session:
+        quote = session.query(Quote).filter_by(sid=6).one()
+        assert quote.tags == ('XX', 'YY')
+        assert quote.tokens == ('stored', 'tokens')
+        assert quote.lemmas == ('store', 'token')
+        assert quote.format_copy().endswith(
+            '\t{"XX", "YY"}\t{"stored", "tokens"}\t{"store", "token"}')
+
+    # Even without a string.
+    quote = Quote(string_tags=[], string_tokens=[], string_lemmas=[])
+    assert quote.tags == ()
+    assert quote.tokens == ()
+    assert quote.lemmas == ()
 
 
 def test_quote_add_url_sealed(some_quotes):
@@ -138,6 +165,162 @@ def test_quote_add_urls_sealed(some_quotes):
             q.add_urls([u1, u2])
 
 
+def test_quote_add_urls_buffer(some_quotes):
+    """Check adding :class:`~.db.Url`\ s to a :class:`~.db.Quote` through a
+    :class:`~.db.UrlBuffer`."""
+
+    basedate = datetime(year=2008, month=1, day=1)
+    buffer = UrlBuffer([Url(timestamp=basedate + timedelta(days=2),
+                            frequency=1, url_type='B', url='some url 1')])
+    buffer.append(basedate, 3, 'M', 'some url 2')
+    assert len(buffer) == 2
+
+    with session_scope() as session:
+        q = session.query(Quote).filter_by(sid=0).one()
+        q.add_urls(UrlBuffer())
+        q.add_urls(buffer)
+        q.add_url(Url(timestamp=basedate + timedelta(days=1), frequency=2,
+                      url_type='B', url='some url 3'))
+
+    with session_scope() as session:
+        q = session.query(Quote).filter_by(sid=0).one()
+        assert q.size == 3
+        assert q.frequency == 6
+        assert [url.url for url in q.urls] == ['some url 2', 'some url 3',
+                                               'some url 1']
+        assert [url.url_type for url in q.urls] == ['M', 'B', 'B']
+        # Adding no urls to a sealed quote is fine.
+        q.add_urls([])
+
+
+@pytest.mark.parametrize('binary', [False, True])
+def test_save_by_copy(tmpdb, binary):
+    """Check :func:`~.db.save_by_copy` in text and binary COPY formats."""
+
+    basedate = datetime(year=2008, month=1, day=1, microsecond=5)
+    clusters = [Cluster(id=i, sid=10 + i, filtered=bool(i), source='test',
+                        dump=i) for i in range(2)]
+    strings = ['Some \\ quote with "quotes" and \'quotes\'', 'Ünïcödé quote']
+    quotes = [Quote(id=i, cluster_id=i, sid=20 + i, filtered=bool(i),
+                    string=string) for i, string in enumerate(strings)]
+    quotes[0].string_tags = ['SYM', "''"]
+    quotes[0].string_tokens = ['\\', '"quotes"']
+    quotes[0].string_lemmas = ['\\', 'ü']
+    quotes[0].add_urls([
+        Url(timestamp=basedate + timedelta(days=1), frequency=2, url_type='M',
+            url='Url with \\ and " and \' and ü'),
+        Url(timestamp=basedate - timedelta(days=3000), frequency=1,
+            url_type='B', url='Url, with {braces}'),
+    ])
+    # Generators are streamed.
+    save_by_copy(iter(clusters), (quote for quote in quotes), echo=False,
+                 binary=binary)
+
+    with session_scope() as session:
+        c0, c1 = session.query(Cluster).order_by(Cluster.id).all()
+        assert (c0.sid, c0.filtered, c0.source, c0.dump) == \
+            (10, False, 'test', 0)
+        assert (c1.sid, c1.filtered, c1.dump) == (11, True, 1)
+        q0, q1 = session.query(Quote).order_by(Quote.id).all()
+        assert (q0.cluster_id, q0.sid, q0.filtered, q0.string) == \
+            (0, 20, False, strings[0])
+        assert (q1.cluster_id, q1.sid, q1.filtered, q1.string) == \
+            (1, 21, True, strings[1])
+        # Urls are saved sorted by timestamp.
+        assert q0.url_timestamps == [basedate - timedelta(days=3000),
+                                     basedate + timedelta(days=1)]
+        assert q0.url_frequencies == [1, 2]
+        assert q0.url_url_types == ['B', 'M']
+        assert q0.url_urls == ['Url, with {braces}',
+                               'Url with \\ and " and \' and ü']
+        assert q1.url_timestamps == []
+        assert q1.url_frequencies == []
+        assert q1.url_url_types == []
+        assert q1.url_urls == []
+        assert q0.string_tags == ['SYM', "''"]
+        assert q0.string_tokens == ['\\', '"quotes"']
+        assert q0.string_lemmas == ['\\', 'ü']
+        assert q1.string_tags is None
+        assert q1.string_tokens is None
+        assert q1.string_lemmas is None
+
+
+def test_copy_iterable(tmpdb):
+    """Check :func:`~.db._copy` streams rows from an iterable."""
+
+    def rows():
+        for i in range(10000):
+            yield '{}\t{}\tFalse\ttest\t0'.format(i, i)
+
+    _copy(rows(), 'cluster', Cluster.format_copy_columns)
+    with session_scope() as session:
+        assert session.query(Cluster).count() == 10000
+        assert session.query(Cluster).get(9999).sid == 9999
+
+
+def test_add_missing_columns(some_quotes):
+    """Check :func:`~.db.add_missing_columns` adds nullable columns to
+    existing tables."""
+
+    engine = Session.kw['bind']
+    execute_raw(engine, 'ALTER TABLE quote DROP COLUMN string_tags;')
+    execute_raw(engine, 'ALTER TABLE quote DROP COLUMN string_lemmas;')
+    add_missing_columns(engine)
+    # Nothing left to add.
+    add_missing_columns(engine)
+
+    with session_scope() as session:
+        assert session.query(Quote).count() == 10
+        quote = session.query(Quote).filter_by(sid=0).one()
+        assert quote.string_tags is None
+        quote.string_tags = ['NN']
+        quote.string_lemmas = ['quote']
+    with session_scope() as session:
+        quote = session.query(Quote).filter_by(sid=0).one()
+        assert quote.string_tags == ['NN']
+        assert quote.string_lemmas == ['quote']
+
+
+def test_add_missing_columns_upgrade(some_quotes):
+    """Check :func:`~.db.add_missing_columns` upgrades a cluster table from
+    before :attr:`~.db.Cluster.dump` existed."""
+
+    engine = Session.kw['bind']
+    execute_raw(engine, 'ALTER TABLE cluster DROP COLUMN dump;')
+    add_missing_columns(engine)
+
+    with session_scope() as session:
+        assert session.query(Cluster).count() == 5
+        assert set(dump for (dump,) in session.query(Cluster.dump)) == {0}
+        session.add(Cluster(sid=5, source='test', dump=1))
+    with session_scope() as session:
+        assert session.query(Cluster).filter_by(dump=1).one().sid == 5
+    execute_raw(engine, "INSERT INTO cluster (sid, filtered, source) "
+                "VALUES (6, false, 'test');")
+    with session_scope() as session:
+        assert session.query(Cluster).filter_by(sid=6).one().dump == 0
+
+
+def test_iterable_reader():
+    """Check :class:`~.db._IterableReader` reads chunks across
+    boundaries."""
+
+    reader = _IterableReader([b'abc', b'', b'defgh', b'i'])
+    assert reader.read(2) == b'ab'
+    assert reader.read(4) == b'cdef'
+    assert reader.read(0) == b''
+    assert reader.read() == b'ghi'
+    assert reader.read(10) == b''
+
+    reader = _IterableReader(iter([b'abc', b'de']))
+    assert reader.read(10) == b'abcde'
+    assert reader.read(10) == b''
+
+    reader = _IterableReader(['ab', 'c'], empty='')
+    assert reader.read(2) == 'ab'
+    assert reader.read() == 'c'
+
+
 def test_url(some_urls):
     """Test base functionality of :class:`~.db.Url`."""
 
@@ -170,7 +353,8 @@ def test_url(some_urls):
              '\t1\t0\tFalse\tSome quote to tokenize 0\t'
              '{2008-01-01 00:00:00, 2008-01-11 00:00:00}\t'
              '{2, 2}\t{B, B}\t'
-             '{"Url with \\\\" and \' 0", "Url with \\\\" and \' 10"}')
+             '{"Url with \\\\" and \' 0", "Url with \\\\" and \' 10"}'
+             '\t\\N\t\\N\t\\N')
 
     with pytest.raises(DataError):
         with session_scope() as session:
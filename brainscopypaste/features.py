@@ -16,9 +16,9 @@ import warnings
 import functools
 
 import numpy as np
-from nltk.corpus import cmudict, wordnet
 
-from brainscopypaste.utils import is_int, memoized, unpickle
+from brainscopypaste.utils import is_int, memoized
+from brainscopypaste.featurestore import FeatureStore
 from brainscopypaste.conf import settings
 
 
@@ -38,6 +38,8 @@ def _get_pronunciations():
 
     """
 
+    from nltk.corpus import cmudict
+
     logger.debug('Loading CMU data')
     return cmudict.dict()
 
@@ -110,6 +112,32 @@ def _get_clearpond():
             'phonological': clearpond_phonological}
 
 
+@memoized
+def _get_feature(name):
+    """Get computed feature `name` from the feature store at
+    :data:`~.settings.FEATURES`, as a :class:`~.featurestore.FeatureView`.
+
+    The feature is memory-mapped, so this is cheap and shares feature values
+    between processes. It is still :func:`~.utils.memoized` since it is
+    called so often.
+
+    Raises
+    ------
+    Exception
+        If the feature has not been computed yet (see :mod:`.cli` for how to
+        compute features).
+
+    """
+
+    logger.debug("Loading feature '%s'", name)
+
+    store = FeatureStore(settings.FEATURES)
+    if name not in store:
+        raise Exception("Feature '{}' has not been computed, run "
+                        "`brainscopypaste load features`".format(name))
+    return store.feature(name)
+
+
 class SubstitutionFeaturesMixin:
 
     """Mixin for :class:`~.db.Substitution`\ s adding feature-related
@@ -169,7 +197,7 @@ class SubstitutionFeaturesMixin:
         'orthographic_density':   ('tokens', np.log),
     }
 
-    @memoized
+    @memoized(maxsize=2 ** 16)
     def _substitution_features(self, name):
         """Compute feature `name` for source and destination words of this
         substitution.
@@ -205,7 +233,7 @@ class SubstitutionFeaturesMixin:
         feature = self._transformed_feature(name)
         return feature(word1), feature(word2)
 
-    @memoized
+    @memoized(maxsize=2 ** 16)
     def source_destination_features(self, name, sentence_relative=None):
         """Compute the feature values for all words in source and destination
         sentences of this substitution, possibly sentence-relative.
@@ -275,7 +303,7 @@ class SubstitutionFeaturesMixin:
 
         return source_features, destination_features
 
-    @memoized
+    @memoized(maxsize=2 ** 16)
     def features(self, name, sentence_relative=None):
         """Compute feature `name` for source and destination words of this
         substitution, possibly sentence-relative.
@@ -325,7 +353,7 @@ class SubstitutionFeaturesMixin:
 
         return feature1, feature2
 
-    @memoized
+    @memoized(maxsize=2 ** 16)
     def _source_destination_components(self, n, pca, feature_names):
         """Compute the `n`-th component of pca for all words in source and
         destination sentences of this substitution.
@@ -379,7 +407,7 @@ class SubstitutionFeaturesMixin:
 
         return source_components, destination_components
 
-    @memoized
+    @memoized(maxsize=2 ** 16)
     def components(self, n, pca, feature_names, sentence_relative=None):
         """Compute the `n`-th components of `pca` for source and destination
         words of this substitution, possibly sentence-relative.
@@ -456,7 +484,7 @@ class SubstitutionFeaturesMixin:
             warnings.simplefilter('ignore', category=RuntimeWarning)
             return np.nanmean([func(word) for word in func()])
 
-    @memoized
+    @memoized(maxsize=2 ** 16)
     def _average(self, func, source_synonyms):
         """Compute the average value of `func` over the words it codes, or over
         the synonyms of this substitution's source word.
@@ -505,7 +533,7 @@ class SubstitutionFeaturesMixin:
         else:
             return self._static_average(func)
 
-    @memoized
+    @memoized(maxsize=2 ** 16)
     def feature_average(self, name, source_synonyms=False,
                         sentence_relative=None):
         """Compute the average of feature `name` over all coded words or over
@@ -562,7 +590,7 @@ class SubstitutionFeaturesMixin:
 
         return avg
 
-    @memoized
+    @memoized(maxsize=2 ** 16)
     def component_average(self, n, pca, feature_names,
                           source_synonyms=False, sentence_relative=None):
         """Compute the average, over all coded words or synonyms of this
@@ -782,6 +810,8 @@ class SubstitutionFeaturesMixin:
         """Get the set of synonyms of `word` through WordNet, excluding `word`
         itself; empty if nothing is found."""
 
+        from nltk.corpus import wordnet
+
         # wordnet.synsets() lemmatizes words, so we might as well control it.
         # This also lets us check the lemma is present in the generated
         # synonym list further down.
@@ -825,13 +855,15 @@ class SubstitutionFeaturesMixin:
     def _letters_count(cls, word=None):
         """#letters"""
         if word is None:
-            return unpickle(settings.TOKENS)
+            return _get_feature('tokens').keys()
         return len(word)
 
     @classmethod
     @memoized
     def _synonyms_count(cls, word=None):
         """<#synonyms>"""
+        from nltk.corpus import wordnet
+
         if word is None:
             return set(word.lower()
                        for synset in wordnet.all_synsets()
@@ -855,7 +887,7 @@ class SubstitutionFeaturesMixin:
     @memoized
     def _degree(cls, word=None):
         """degree"""
-        degree = unpickle(settings.DEGREE)
+        degree = _get_feature('degree')
         if word is None:
             return degree.keys()
         return degree.get(word, np.nan)
@@ -864,7 +896,7 @@ class SubstitutionFeaturesMixin:
     @memoized
     def _pagerank(cls, word=None):
         """pagerank"""
-        pagerank = unpickle(settings.PAGERANK)
+        pagerank = _get_feature('pagerank')
         if word is None:
             return pagerank.keys()
         return pagerank.get(word, np.nan)
@@ -873,7 +905,7 @@ class SubstitutionFeaturesMixin:
     @memoized
     def _betweenness(cls, word=None):
         """betweenness"""
-        betweenness = unpickle(settings.BETWEENNESS)
+        betweenness = _get_feature('betweenness')
         if word is None:
             return betweenness.keys()
         return betweenness.get(word, np.nan)
@@ -882,7 +914,7 @@ class SubstitutionFeaturesMixin:
     @memoized
     def _clustering(cls, word=None):
         """clustering"""
-        clustering = unpickle(settings.CLUSTERING)
+        clustering = _get_feature('clustering')
         if word is None:
             return clustering.keys()
         return clustering.get(word, np.nan)
@@ -891,7 +923,7 @@ class SubstitutionFeaturesMixin:
     @memoized
     def _frequency(cls, word=None):
         """frequency"""
-        frequency = unpickle(settings.FREQUENCY)
+        frequency = _get_feature('frequency')
         if word is None:
             return frequency.keys()
         return frequency.get(word, np.nan)
@@ -3,18 +3,16 @@
 """
 
 
-from os.path import exists
-import pickle
-
 import pytest
 import numpy as np
 from sklearn.decomposition import PCA
 
 from brainscopypaste.db import Quote, Substitution
 from brainscopypaste.features import (_get_pronunciations, _get_aoa,
-                                      _get_clearpond,
+                                      _get_clearpond, _get_feature,
                                       SubstitutionFeaturesMixin)
-from brainscopypaste.utils import is_int, unpickle
+from brainscopypaste.featurestore import FeatureStore
+from brainscopypaste.utils import is_int
 from brainscopypaste.conf import settings
 
 
@@ -59,8 +57,12 @@ def test_get_clearpond():
     assert clearpond is _get_clearpond()
 
 
+def computed(name):
+    return name in FeatureStore(settings.FEATURES)
+
+
 def drop_caches():
-    unpickle.drop_cache()
+    _get_feature.drop_cache()
     _get_pronunciations.drop_cache()
     _get_aoa.drop_cache()
     _get_clearpond.drop_cache()
@@ -117,14 +119,14 @@ def test_letters_count():
 
 def test_letters_count_none():
     drop_caches()
-    with settings.file_override('TOKENS'):
-        with open(settings.TOKENS, 'wb') as f:
-            pickle.dump({'these', 'are', 'tokens'}, f)
+    with settings.file_override('FEATURES'):
+        FeatureStore(settings.FEATURES).save(
+            {'tokens': {'these', 'are', 'tokens'}}, '')
         assert SubstitutionFeaturesMixin.\
             _letters_count() == {'these', 'are', 'tokens'}
 
 
-@pytest.mark.skipif(not exists(settings.TOKENS),
+@pytest.mark.skipif(not computed('tokens'),
                     reason='missing computed feature')
 def test_letters_count_none_with_computed():
     drop_caches()
@@ -176,7 +178,7 @@ def test_aoa_none():
         assert set(SubstitutionFeaturesMixin._aoa()) == {'have', 'tell'}
 
 
-@pytest.mark.skipif(not exists(settings.DEGREE),
+@pytest.mark.skipif(not computed('degree'),
                     reason='missing computed feature')
 def test_degree():
     drop_caches()
@@ -187,13 +189,13 @@ def test_degree():
 
 def test_degree_none():
     drop_caches()
-    with settings.file_override('DEGREE'):
-        with open(settings.DEGREE, 'wb') as f:
-            pickle.dump({'dog': 2, 'cat': 3}, f)
+    with settings.file_override('FEATURES'):
+        FeatureStore(settings.FEATURES).save(
+            {'degree': {'dog': 2, 'cat': 3}}, '')
         assert set(SubstitutionFeaturesMixin._degree()) == {'dog', 'cat'}
 
 
-@pytest.mark.skipif(not exists(settings.DEGREE),
+@pytest.mark.skipif(not computed('degree'),
                     reason='missing computed feature')
 def test_degree_none_with_computed():
     drop_caches()
@@ -203,7 +205,7 @@ def test_degree_none_with_computed():
                 word in ['%', '!'])
 
 
-@pytest.mark.skipif(not exists(settings.PAGERANK),
+@pytest.mark.skipif(not computed('pagerank'),
                     reason='missing computed feature')
 def test_pagerank():
     drop_caches()
@@ -216,13 +218,13 @@ def test_pagerank():
 
 def test_pagerank_none():
     drop_caches()
-    with settings.file_override('PAGERANK'):
-        with open(settings.PAGERANK, 'wb') as f:
-            pickle.dump({'dog': 2, 'cat': 3}, f)
+    with settings.file_override('FEATURES'):
+        FeatureStore(settings.FEATURES).save(
+            {'pagerank': {'dog': 2, 'cat': 3}}, '')
         assert set(SubstitutionFeaturesMixin._pagerank()) == {'dog', 'cat'}
 
 
-@pytest.mark.skipif(not exists(settings.PAGERANK),
+@pytest.mark.skipif(not computed('pagerank'),
                     reason='missing computed feature')
 def test_pagerank_none_with_computed():
     drop_caches()
@@ -232,7 +234,7 @@ def test_pagerank_none_with_computed():
                 word in ['%', '!'])
 
 
-@pytest.mark.skipif(not exists(settings.BETWEENNESS),
+@pytest.mark.skipif(not computed('betweenness'),
                     reason='missing computed feature')
 def test_betweenness():
     drop_caches()
@@ -245,13 +247,13 @@ def test_betweenness():
 
 def test_betweenness_none():
     drop_caches()
-    with settings.file_override('BETWEENNESS'):
-        with open(settings.BETWEENNESS, 'wb') as f:
-            pickle.dump({'dog': 2, 'cat': 3}, f)
+    with settings.file_override('FEATURES'):
+        FeatureStore(settings.FEATURES).save(
+            {'betweenness': {'dog': 2, 'cat': 3}}, '')
         assert set(SubstitutionFeaturesMixin._betweenness()) == {'dog', 'cat'}
 
 
-@pytest.mark.skipif(not exists(settings.BETWEENNESS),
+@pytest.mark.skipif(not computed('betweenness'),
                     reason='missing computed feature')
 def test_betweenness_none_with_computed():
     drop_caches()
@@ -261,7 +263,7 @@ def test_betweenness_none_with_computed():
                 word in ['%', '!'])
 
 
-@pytest.mark.skipif(not exists(settings.CLUSTERING),
+@pytest.mark.skipif(not computed('clustering'),
                     reason='missing computed feature')
 def test_clustering():
     drop_caches()
@@ -274,13 +276,13 @@ def test_clustering():
 
 def test_clustering_none():
     drop_caches()
-    with settings.file_override('CLUSTERING'):
-        with open(settings.CLUSTERING, 'wb') as f:
-            pickle.dump({'dog': 2, 'cat': 3}, f)
+    with settings.file_override('FEATURES'):
+        FeatureStore(settings.FEATURES).save(
+            {'clustering': {'dog': 2, 'cat': 3}}, '')
         assert set(SubstitutionFeaturesMixin._clustering()) == {'dog', 'cat'}
 
 
-@pytest.mark.skipif(not exists(settings.CLUSTERING),
+@pytest.mark.skipif(not computed('clustering'),
                     reason='missing computed feature')
 def test_clustering_none_with_computed():
     drop_caches()
@@ -290,7 +292,7 @@ def test_clustering_none_with_computed():
                 word in ['%', '!'])
 
 
-@pytest.mark.skipif(not exists(settings.FREQUENCY),
+@pytest.mark.skipif(not computed('frequency'),
                     reason='missing computed feature')
 def test_frequency():
     drop_caches()
@@ -301,13 +303,13 @@ def test_frequency():
 
 def test_frequency_none():
     drop_caches()
-    with settings.file_override('FREQUENCY'):
-        with open(settings.FREQUENCY, 'wb') as f:
-            pickle.dump({'dog': 2, 'cat': 3}, f)
+    with settings.file_override('FEATURES'):
+        FeatureStore(settings.FEATURES).save(
+            {'frequency': {'dog': 2, 'cat': 3}}, '')
         assert set(SubstitutionFeaturesMixin._frequency()) == {'dog', 'cat'}
 
 
-@pytest.mark.skipif(not exists(settings.FREQUENCY),
+@pytest.mark.skipif(not computed('frequency'),
                     reason='missing computed feature')
 def test_frequency_none_with_computed():
     drop_caches()
@@ -564,7 +566,7 @@ def test_features(normal_substitution):
                                sentence_relative='median')[1])
 
 
-@pytest.mark.skipif(not exists(settings.DEGREE),
+@pytest.mark.skipif(not computed('degree'),
                     reason='missing computed feature')
 def test_features_degree(normal_substitution):
     drop_caches()
@@ -578,7 +580,7 @@ def test_features_degree(normal_substitution):
          np.log(0.0008477769404672192) - (-6.9263737004221797))
 
 
-@pytest.mark.skipif(not exists(settings.PAGERANK),
+@pytest.mark.skipif(not computed('pagerank'),
                     reason='missing computed feature')
 def test_features_pagerank(normal_substitution):
     drop_caches()
@@ -597,7 +599,7 @@ def test_features_pagerank(normal_substitution):
                (6.421655879054584e-05 / 8.739354974404687e-05)) < 1e-15
 
 
-@pytest.mark.skipif(not exists(settings.BETWEENNESS),
+@pytest.mark.skipif(not computed('betweenness'),
                     reason='missing computed feature')
 def test_features_betweenness(normal_substitution):
     drop_caches()
@@ -612,7 +614,7 @@ def test_features_betweenness(normal_substitution):
         np.log(0.0003369277738594168) - (-7.3319337537445257)
 
 
-@pytest.mark.skipif(not exists(settings.CLUSTERING),
+@pytest.mark.skipif(not computed('clustering'),
                     reason='missing computed feature')
 def test_features_clustering(normal_substitution):
     drop_caches()
@@ -626,7 +628,7 @@ def test_features_clustering(normal_substitution):
         np.log(0.0037154495910700605) - (-6.2647504887460004)
 
 
-@pytest.mark.skipif(not exists(settings.FREQUENCY),
+@pytest.mark.skipif(not computed('frequency'),
                     reason='missing computed feature')
 def test_features_frequency(normal_substitution):
     drop_caches()
@@ -883,9 +885,9 @@ def test_component():
     pca.fit(np.array([[1, 0, 0, 0], [-1, 0, 0, 0],
                       [0, 1, 0, 0], [0, -1, 0, 0],
                       [0, 0, 1, 0], [0, 0, -1, 0]]))
-    with settings.file_override('TOKENS'):
-        with open(settings.TOKENS, 'wb') as f:
-            pickle.dump({'these', 'are', 'tokens'}, f)
+    with settings.file_override('FEATURES'):
+        FeatureStore(settings.FEATURES).save(
+            {'tokens': {'these', 'are', 'tokens'}}, '')
 
         c0 = SubstitutionFeaturesMixin._component(0, pca, features)
         c1 = SubstitutionFeaturesMixin._component(1, pca, features)
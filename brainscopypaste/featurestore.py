@@ -0,0 +1,327 @@
+"""Memory-mapped storage for computed word features.
+
+This module defines :class:`FeatureStore`, which keeps the word features
+computed by :func:`~.load.load_fa_features` and
+:func:`~.load.load_mt_frequency_and_tokens` in a single file (see
+:data:`~.settings.FEATURES`): a sorted vocabulary of all the words coded by
+any feature, and one array per feature aligned on that vocabulary. Arrays are
+memory-mapped when read, so that opening the store costs next to nothing and
+all processes reading features share a single copy of them (through the page
+cache) instead of each unpickling whole dicts.
+
+The store also records, for each feature, a digest of the inputs the feature
+was computed from (see :func:`input_digest`), which lets the loaders skip
+features that are up to date and recompute those whose inputs changed.
+
+The file starts with :attr:`FeatureStore.magic`, followed by the offset of a
+JSON header at the end of the file. The header holds the format version, the
+positions of the vocabulary and feature arrays (each aligned on
+:attr:`FeatureStore.alignment` bytes), and the feature digests. Files are
+written to a temporary file which then replaces the previous version, so
+readers never see a partially written store.
+
+"""
+
+
+from bisect import bisect_left
+from collections.abc import Mapping
+from hashlib import sha1
+import json
+import logging
+import os
+import struct
+from tempfile import mkstemp
+
+import numpy as np
+
+
+logger = logging.getLogger(__name__)
+
+
+def input_digest(paths=(), params=()):
+    """Compute a digest of the contents of files `paths` and of the values in
+    `params` (using their `repr`), to identify the inputs a feature was
+    computed from."""
+
+    digest = sha1()
+    for path in paths:
+        digest.update(path.encode('utf-8'))
+        with open(path, 'rb') as file:
+            for chunk in iter(lambda: file.read(2**20), b''):
+                digest.update(chunk)
+    for param in params:
+        digest.update(repr(param).encode('utf-8'))
+    return digest.hexdigest()
+
+
+class FeatureStore:
+
+    """Read and write the features stored in file `path`.
+
+    A missing or empty file is an empty store. Use :meth:`feature` to get a
+    memory-mapped feature, :meth:`save` to add or replace features, and
+    :meth:`is_fresh` to check if features were computed from given inputs.
+
+    Parameters
+    ----------
+    path : str
+        Path to the store file.
+
+    Raises
+    ------
+    ValueError
+        If `path` exists but is not a feature store, or was written with
+        another format version.
+
+    """
+
+    #: First bytes of a feature store file.
+    magic = b'BCPFEATS'
+
+    #: Version of the file format.
+    format_version = 1
+
+    #: Alignment (in bytes) of arrays in the file.
+    alignment = 64
+
+    def __init__(self, path):
+        self.path = path
+        self.header = {'format': self.format_version, 'vocabulary': None,
+                       'features': {}}
+
+        if not os.path.exists(path) or os.path.getsize(path) == 0:
+            return
+        with open(path, 'rb') as file:
+            prefix = file.read(len(self.magic) + 8)
+            if prefix[:len(self.magic)] != self.magic:
+                raise ValueError("'{}' is not a feature store".format(path))
+            header_offset, = struct.unpack('<Q', prefix[len(self.magic):])
+            file.seek(header_offset)
+            self.header = json.loads(file.read().decode('utf-8'))
+        if self.header['format'] != self.format_version:
+            raise ValueError("Feature store '{}' has format version {}, "
+                             'expected version {}'
+                             .format(path, self.header['format'],
+                                     self.format_version))
+
+    def __repr__(self):
+        return 'FeatureStore({!r})'.format(self.path)
+
+    def __contains__(self, name):
+        return name in self.header['features']
+
+    def names(self):
+        """Get the sorted list of names of stored features."""
+
+        return sorted(self.header['features'].keys())
+
+    def digest(self, name):
+        """Get the input digest recorded for feature `name`, or `None` if the
+        feature is not stored."""
+
+        if name not in self:
+            return None
+        return self.header['features'][name]['digest']
+
+    def is_fresh(self, names, digest):
+        """Check that all features in `names` are stored and were computed
+        from inputs with digest `digest`."""
+
+        return all(self.digest(name) == digest for name in names)
+
+    def vocabulary(self):
+        """Get the sorted vocabulary of the store, as a :class:`Strings`
+        sequence."""
+
+        vocabulary = self.header['vocabulary']
+        if vocabulary is None:
+            return Strings(np.zeros(0, dtype='uint8'),
+                           np.zeros(1, dtype='int64'))
+        return Strings(self._array(vocabulary['data'], 'uint8'),
+                       self._array(vocabulary['offsets'], 'int64'))
+
+    def feature(self, name):
+        """Get feature `name` as a :class:`FeatureView`.
+
+        Raises
+        ------
+        KeyError
+            If feature `name` is not stored.
+
+        """
+
+        if name not in self:
+            raise KeyError("Feature '{}' is not in {}".format(name, self))
+        info = self.header['features'][name]
+        return FeatureView(self.vocabulary(),
+                           self._array(info['values'], info['dtype']))
+
+    def save(self, features, digest):
+        """Save `features`, computed from inputs with digest `digest`, to the
+        store, keeping the other features already stored.
+
+        Parameters
+        ----------
+        features : dict
+            Association of feature names to their values. Values are either
+            dicts of words to numbers (stored as `float64`, words not in the
+            dict getting `nan`) or sets of words (stored as `bool`).
+        digest : str
+            Digest of the inputs `features` were computed from (see
+            :func:`input_digest`).
+
+        """
+
+        logger.debug('Saving features %s to %s', sorted(features.keys()),
+                     self)
+
+        # Gather all features in memory to rebuild the shared vocabulary.
+        all_features = {}
+        digests = {}
+        for name in self.names():
+            if name not in features:
+                view = self.feature(name)
+                all_features[name] = (dict(view.items())
+                                      if view.values.dtype != bool
+                                      else set(view))
+                digests[name] = self.digest(name)
+        for name, values in features.items():
+            all_features[name] = values
+            digests[name] = digest
+
+        words = sorted(set(word for values in all_features.values()
+                           for word in values))
+        index = dict((word, i) for i, word in enumerate(words))
+        encoded = [word.encode('utf-8') for word in words]
+
+        arrays = [
+            ('vocabulary.data',
+             np.frombuffer(b''.join(encoded), dtype='uint8')),
+            ('vocabulary.offsets',
+             np.concatenate([[0], np.cumsum([len(data) for data in encoded],
+                                            dtype='int64')]).astype('int64')),
+        ]
+        for name, values in sorted(all_features.items()):
+            if isinstance(values, (set, frozenset)):
+                array = np.zeros(len(words), dtype=bool)
+                array[[index[word] for word in values]] = True
+            else:
+                array = np.full(len(words), np.nan)
+                array[[index[word] for word in values.keys()]] = \
+                    list(values.values())
+            arrays.append((name, array))
+
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp = mkstemp(dir=directory, prefix='.features-')
+        try:
+            with open(fd, 'wb') as file:
+                file.write(self.magic + struct.pack('<Q', 0))
+                positions = {}
+                for name, array in arrays:
+                    file.write(b'\0' * (-file.tell() % self.alignment))
+                    positions[name] = {'offset': file.tell(),
+                                       'count': len(array)}
+                    file.write(array.tobytes())
+
+                header_offset = file.tell()
+                header = {
+                    'format': self.format_version,
+                    'vocabulary': {'data': positions['vocabulary.data'],
+                                   'offsets': positions['vocabulary.offsets']},
+                    'features': dict(
+                        (name, {'dtype': array.dtype.name,
+                                'values': positions[name],
+                                'digest': digests[name]})
+                        for name, array in arrays[2:])
+                }
+                file.write(json.dumps(header, sort_keys=True)
+                           .encode('utf-8'))
+                file.seek(len(self.magic))
+                file.write(struct.pack('<Q', header_offset))
+            # mkstemp creates files readable by their owner only; give the
+            # store the permissions of any other file created by the user.
+            umask = os.umask(0)
+            os.umask(umask)
+            os.chmod(tmp, 0o666 & ~umask)
+            os.replace(tmp, self.path)
+        except:
+            os.remove(tmp)
+            raise
+
+        self.header = header
+
+    def _array(self, position, dtype):
+        """Memory-map the array at `position` (a dict with `offset` and
+        `count` keys) in the store file."""
+
+        if position['count'] == 0:
+            return np.zeros(0, dtype=dtype)
+        return np.memmap(self.path, dtype=dtype, mode='r',
+                         offset=position['offset'],
+                         shape=(position['count'],))
+
+
+class Strings:
+
+    """Read-only sequence of the strings stored as UTF-8 `data` with
+    `offsets` (the string at index `i` spans `data[offsets[i]:offsets[i +
+    1]]`), decoded on access."""
+
+    def __init__(self, data, offsets):
+        self.data = data
+        self.offsets = offsets
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        return bytes(self.data[self.offsets[i]:self.offsets[i + 1]])\
+            .decode('utf-8')
+
+
+class FeatureView(Mapping):
+
+    """Read-only mapping of words to feature values, backed by a sorted
+    `vocabulary` (a :class:`Strings`) and an array of `values` aligned on it.
+
+    Words with value `nan` (for numeric features) or `False` (for sets of
+    words) are not in the mapping. Words are looked up by binary search in
+    the vocabulary, so no index needs to be built in memory.
+
+    """
+
+    def __init__(self, vocabulary, values):
+        self.vocabulary = vocabulary
+        self.values = values
+        if values.dtype == bool:
+            self._present = values
+        else:
+            self._present = ~np.isnan(values)
+        self._length = None
+
+    def _index(self, word):
+        i = bisect_left(self.vocabulary, word)
+        if (i < len(self.vocabulary) and self.vocabulary[i] == word and
+                self._present[i]):
+            return i
+        return None
+
+    def __getitem__(self, word):
+        i = self._index(word)
+        if i is None:
+            raise KeyError(word)
+        return self.values[i].item()
+
+    def __contains__(self, word):
+        return self._index(word) is not None
+
+    def __iter__(self):
+        for i in np.flatnonzero(self._present):
+            yield self.vocabulary[i]
+
+    def __len__(self):
+        if self._length is None:
+            self._length = int(np.count_nonzero(self._present))
+        return self._length
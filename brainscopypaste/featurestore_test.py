@@ -0,0 +1,127 @@
+import os
+from tempfile import mkstemp, TemporaryDirectory
+
+import pytest
+import numpy as np
+
+from brainscopypaste.featurestore import FeatureStore, input_digest
+
+
+@pytest.yield_fixture
+def path():
+    with TemporaryDirectory() as tmpdir:
+        yield os.path.join(tmpdir, 'features.store')
+
+
+def test_empty_store(path):
+    store = FeatureStore(path)
+    assert store.names() == []
+    assert 'degree' not in store
+    assert store.digest('degree') is None
+    assert not store.is_fresh(['degree'], 'abc')
+    assert len(store.vocabulary()) == 0
+    with pytest.raises(KeyError):
+        store.feature('degree')
+
+    # An empty file is an empty store.
+    fd, empty = mkstemp()
+    os.close(fd)
+    assert FeatureStore(empty).names() == []
+    os.remove(empty)
+
+
+def test_store_save_feature(path):
+    FeatureStore(path).save({'degree': {'dog': 2, 'cat': 3.5, 'éte': .25},
+                             'tokens': {'dog', 'zèbre'}}, 'abc')
+
+    store = FeatureStore(path)
+    assert store.names() == ['degree', 'tokens']
+    assert store.digest('degree') == 'abc'
+    assert store.is_fresh(['degree', 'tokens'], 'abc')
+    assert not store.is_fresh(['degree', 'tokens'], 'def')
+    assert list(store.vocabulary()[i] for i in range(4)) == \
+        ['cat', 'dog', 'zèbre', 'éte']
+
+    degree = store.feature('degree')
+    assert isinstance(degree.values, np.memmap)
+    assert dict(degree) == {'dog': 2, 'cat': 3.5, 'éte': .25}
+    assert len(degree) == 3
+    assert degree['éte'] == .25
+    assert 'zèbre' not in degree
+    assert 'wickiup' not in degree
+    assert degree.get('zèbre') is None
+    with pytest.raises(KeyError):
+        degree['zèbre']
+
+    tokens = store.feature('tokens')
+    assert set(tokens) == {'dog', 'zèbre'}
+    assert 'cat' not in tokens
+    assert len(tokens) == 2
+
+
+@pytest.mark.parametrize('umask,mode', [(0o022, 0o644), (0o077, 0o600),
+                                        (0o002, 0o664)])
+def test_store_save_mode(path, umask, mode):
+    previous = os.umask(umask)
+    try:
+        FeatureStore(path).save({'degree': {'dog': 2}}, 'abc')
+    finally:
+        os.umask(previous)
+    assert os.stat(path).st_mode & 0o777 == mode
+
+
+def test_store_save_merge(path):
+    FeatureStore(path).save({'degree': {'dog': 2}, 'tokens': {'dog'}}, 'abc')
+    FeatureStore(path).save({'frequency': {'cat': 4}, 'tokens': set()},
+                            'def')
+
+    store = FeatureStore(path)
+    assert store.names() == ['degree', 'frequency', 'tokens']
+    assert store.digest('degree') == 'abc'
+    assert store.digest('frequency') == 'def'
+    assert store.digest('tokens') == 'def'
+    assert dict(store.feature('degree')) == {'dog': 2}
+    assert dict(store.feature('frequency')) == {'cat': 4}
+    assert set(store.feature('tokens')) == set()
+
+    # Views opened before a save still read the previous version.
+    degree = store.feature('degree')
+    store.save({'degree': {'dog': 5}}, 'ghi')
+    assert dict(degree) == {'dog': 2}
+    assert dict(FeatureStore(path).feature('degree')) == {'dog': 5}
+
+
+def test_store_errors(path):
+    with open(path, 'wb') as f:
+        f.write(b'not a feature store')
+    with pytest.raises(ValueError) as excinfo:
+        FeatureStore(path)
+    assert 'not a feature store' in str(excinfo.value)
+
+    os.remove(path)
+    store = FeatureStore(path)
+    store.save({'degree': {'dog': 2}}, 'abc')
+    store.format_version = 2
+    with pytest.raises(ValueError) as excinfo:
+        store.__init__(path)
+    assert 'format version 1' in str(excinfo.value)
+
+    # Failed saves leave the store untouched.
+    store = FeatureStore(path)
+    with pytest.raises(ValueError):
+        store.save({'degree': {'dog': 3}, 'frequency': {'dog': 'many'}},
+                   'def')
+    assert dict(FeatureStore(path).feature('degree')) == {'dog': 2}
+    assert os.listdir(os.path.dirname(path)) == ['features.store']
+
+
+def test_input_digest(path):
+    with open(path, 'w') as f:
+        f.write('some content')
+    digest = input_digest([path], (None, 0))
+    assert digest == input_digest([path], (None, 0))
+    assert digest != input_digest([path], (None, 1))
+    assert digest != input_digest([path])
+    with open(path, 'w') as f:
+        f.write('other content')
+    assert digest != input_digest([path], (None, 0))
@@ -9,6 +9,7 @@ utility functions are also defined.
 
 
 from datetime import timedelta
+from contextlib import closing
 import logging
 
 import click
@@ -29,7 +30,7 @@ class AlreadyFiltered(Exception):
     filtered."""
 
 
-def filter_clusters(limit=None):
+def filter_clusters(limit=None, dump=None, store=None, flush_clusters=1000):
     """Filter the whole MemeTracker dataset by copying all valid
     :class:`~.db.Cluster`\ s and :class:`~.db.Quote`\ s and setting their
     `filtered` attributes to `True`.
@@ -37,25 +38,39 @@ def filter_clusters(limit=None):
     Iterate through all the MemeTracker :class:`~.db.Cluster`\ s, and filter
     each of them to see if it's worth keeping. If a :class:`~.db.Cluster` is to
     be kept, the function creates a copy of it and all of its kept
-    :class:`~.db.Quote`\ s, marking them as filtered. Progress of this
-    operation is printed to stdout.
+    :class:`~.db.Quote`\ s, marking them as filtered. Kept clusters are saved
+    by chunks of `flush_clusters` as filtering goes, so that memory use
+    doesn't grow with the size of the dataset. Progress of this operation is
+    printed to stdout.
 
     Once the operation finishes, a VACUUM and an ANALYZE operation are run on
     the database so that it recomputes its optimisations.
 
+    If `store` is not `None`, clusters are read from and saved to that
+    :class:`~.columnar.ColumnarStore` instead of the database.
+
     Parameters
     ----------
     limit : int, optional
         If not `None`, stop filtering after `limit` clusters have been seen
         (useful for testing purposes).
+    dump : int, optional
+        If not `None`, only filter the :class:`~.db.Cluster`\ s of this dump
+        (see :attr:`~.db.Cluster.dump`), e.g. to filter a MemeTracker file
+        that was appended to an already filtered database.
+    store : :class:`~.columnar.ColumnarStore`, optional
+        If not `None`, filter the clusters of this store instead of those of
+        the database.
+    flush_clusters : int, optional
+        Number of kept clusters saved at a time; defaults to 1000.
 
     Raises
     ------
     AlreadyFiltered
         If there are already some filtered :class:`~.db.Cluster`\ s or
-        :class:`~.db.Quote`\ s stored in the database (indicating another
-        filtering operation has already been completed, or started and
-        aborted).
+        :class:`~.db.Quote`\ s stored in the database (or in dump `dump` if
+        it is not `None`), indicating another filtering operation has already
+        been completed, or started and aborted.
 
     """
 
@@ -64,49 +79,95 @@ def filter_clusters(limit=None):
     logger.info('Filtering memetracker clusters')
     if limit is not None:
         logger.info('Filtering is limited to %s clusters', limit)
+    if dump is not None:
+        logger.info('Filtering is restricted to dump #%s', dump)
 
-    click.echo('Filtering all clusters{}...'
-               .format('' if limit is None else ' (limit={})'.format(limit)))
+    click.echo('Filtering all clusters{}{}...'
+               .format('' if dump is None else ' of dump #{}'.format(dump),
+                       '' if limit is None else ' (limit={})'.format(limit)))
 
-    # Check this isn't already done.
-    with session_scope() as session:
+    # Offsets depend on what is in the database, which may have changed since
+    # they were last computed.
+    filter_cluster_offset.drop_cache()
+    filter_quote_offset.drop_cache()
 
-        if session.query(Cluster)\
-           .filter(Cluster.filtered.is_(True)).count() > 0:
+    # Check this isn't already done.
+    if store is not None:
+        if store.count('clusters', filtered=True, dump=dump) > 0:
             raise AlreadyFiltered('There are already some filtered '
                                   'clusters, aborting.')
-
-        query = session.query(Cluster.id)
-        if limit is not None:
-            query = query.limit(limit)
-        cluster_ids = [id for (id,) in query]
-
-    logger.info('Got %s clusters to filter', len(cluster_ids))
-
-    # Filter.
-    objects = {'clusters': [], 'quotes': []}
-
-    for cluster_id in ProgressBar()(cluster_ids):
+        count = store.count('clusters', filtered=False, dump=dump)
+        count = count if limit is None else min(limit, count)
+        clusters = store.clusters(filtered=False, dump=dump, limit=limit)
+    else:
         with session_scope() as session:
 
-            cluster = session.query(Cluster).get(cluster_id)
-            fcluster = cluster.filter()
+            filtered = session.query(Cluster)\
+                .filter(Cluster.filtered.is_(True))
+            if dump is not None:
+                filtered = filtered.filter(Cluster.dump == dump)
+            if filtered.count() > 0:
+                raise AlreadyFiltered('There are already some filtered '
+                                      'clusters, aborting.')
+
+            query = session.query(Cluster.id)\
+                .filter(Cluster.filtered.is_(False))
+            if dump is not None:
+                query = query.filter(Cluster.dump == dump)
+            if limit is not None:
+                query = query.limit(limit)
+            cluster_ids = [id for (id,) in query]
+        count = len(cluster_ids)
+        clusters = _get_clusters(cluster_ids)
+
+    logger.info('Got %s clusters to filter', count)
+
+    if store is not None:
+        logger.info('Saving filtered clusters to %s', store)
+    else:
+        logger.info('Saving filtered clusters to database')
+
+    def save(fclusters):
+        # Stream the quotes from their clusters.
+        fquotes = (fquote for fcluster in fclusters
+                   for fquote in fcluster.quotes)
+        if store is not None:
+            store.save(fclusters, fquotes)
+        else:
+            save_by_copy(fclusters, fquotes, echo=False)
+
+    # Filter, saving kept clusters by chunks.
+    fclusters = []
+    kept_clusters = 0
+    kept_quotes = 0
+
+    # Close the iterator even if filtering fails, so that the session it
+    # holds open is released.
+    with closing(clusters):
+        for cluster in ProgressBar(max_value=count)(clusters):
+            fcluster = cluster.filter(store=store)
 
             if fcluster is not None:
                 logger.debug('Cluster #%s is kept with %s quotes',
                              cluster.sid, fcluster.size)
-                objects['clusters'].append(fcluster)
-                objects['quotes'].extend(fcluster.quotes)
+                fclusters.append(fcluster)
+                kept_clusters += 1
+                kept_quotes += fcluster.size
+                if len(fclusters) >= flush_clusters:
+                    save(fclusters)
+                    fclusters = []
             else:
                 logger.debug('Cluster #%s is dropped', cluster.sid)
 
+    if len(fclusters) > 0:
+        save(fclusters)
+
     click.secho('OK', fg='green', bold=True)
     logger.info('Kept %s clusters and %s quotes after filtering',
-                len(objects['clusters']), len(objects['quotes']))
+                kept_clusters, kept_quotes)
 
-    # Save.
-    logger.info('Saving filtered clusters to database')
-    save_by_copy(**objects)
+    if store is not None:
+        return
 
     # Vacuum analyze.
     logger.info('Vacuuming and analyzing database')
@@ -115,6 +176,18 @@ def filter_clusters(limit=None):
     click.secho('OK', fg='green', bold=True)
 
 
+def _get_clusters(cluster_ids):
+    """Iterate through the :class:`~.db.Cluster`\ s with ids `cluster_ids`,
+    each one loaded in its own session (which stays open until the next
+    cluster is requested)."""
+
+    from brainscopypaste.db import Cluster
+
+    for cluster_id in cluster_ids:
+        with session_scope() as session:
+            yield session.query(Cluster).get(cluster_id)
+
+
 def _top_id(id):
     """Get the smallest power of ten three orders of magnitude greater than
     `id`.
@@ -128,34 +201,50 @@ def _top_id(id):
 
 
 @memoized
-def filter_cluster_offset():
+def filter_cluster_offset(store=None):
     """Get the offset to add to filtered :class:`~.db.Cluster` ids.
 
     A filtered :class:`~.db.Cluster`'s id will be its original
-    :class:`~.db.Cluster`'s id plus this offset.  The function is
-    :func:`~.utils.memoized` since it is called so often.
+    :class:`~.db.Cluster`'s id plus this offset, computed from the largest
+    unfiltered id (so that it stays the same after some clusters have been
+    filtered).  The function is :func:`~.utils.memoized` since it is called so
+    often.
+
+    If `store` is not `None`, the offset is computed from the clusters of that
+    :class:`~.columnar.ColumnarStore` instead of those of the database.
 
     """
 
     from brainscopypaste.db import Cluster
+    if store is not None:
+        return _top_id(store.max('clusters', 'id', filtered=False))
     with session_scope() as session:
-        maxid = session.query(func.max(Cluster.id)).scalar()
+        maxid = session.query(func.max(Cluster.id))\
+            .filter(Cluster.filtered.is_(False)).scalar()
         return _top_id(maxid)
 
 
 @memoized
-def filter_quote_offset():
+def filter_quote_offset(store=None):
     """Get the offset to add to filtered :class:`~.db.Quote` ids.
 
     A filtered :class:`~.db.Quote`'s id will be its original
-    :class:`~.db.Quote`'s id plus this offset.  The function is
-    :func:`~.utils.memoized` since it is called so often.
+    :class:`~.db.Quote`'s id plus this offset, computed from the largest
+    unfiltered id (so that it stays the same after some quotes have been
+    filtered).  The function is :func:`~.utils.memoized` since it is called so
+    often.
+
+    If `store` is not `None`, the offset is computed from the quotes of that
+    :class:`~.columnar.ColumnarStore` instead of those of the database.
 
     """
 
     from brainscopypaste.db import Quote
+    if store is not None:
+        return _top_id(store.max('quotes', 'id', filtered=False))
     with session_scope() as session:
-        maxid = session.query(func.max(Quote.id)).scalar()
+        maxid = session.query(func.max(Quote.id))\
+            .filter(Quote.filtered.is_(False)).scalar()
         return _top_id(maxid)
 
 
@@ -164,7 +253,7 @@ class ClusterFilterMixin:
     """Mixin for :class:`~.db.Cluster`\ s adding the :meth:`filter` method used
     in :func:`filter_clusters`."""
 
-    def filter(self):
+    def filter(self, store=None):
         """Filter this :class:`~.db.Cluster` and its children
         :class:`~.db.Quote`\ s to see if they're worth keeping.
 
@@ -188,6 +277,12 @@ class ClusterFilterMixin:
         database (the method does not do it for you), e.g. by running this
         method inside a :func:`~.utils.session_scope`.
 
+        Parameters
+        ----------
+        store : :class:`~.columnar.ColumnarStore`, optional
+            If not `None`, this cluster comes from that store, which is used to
+            compute the id offsets instead of the database.
+
         Returns
         -------
         cluster : :class:`~.db.Cluster` or None
@@ -207,7 +302,7 @@ class ClusterFilterMixin:
 
         min_tokens = settings.MT_FILTER_MIN_TOKENS
         max_span = timedelta(days=settings.MT_FILTER_MAX_DAYS)
-        fcluster = self.clone(id=filter_cluster_offset() + self.id,
+        fcluster = self.clone(id=filter_cluster_offset(store) + self.id,
                               filtered=True)
 
         # Examine each quote for min_tokens, max_days, and language.
@@ -235,7 +330,7 @@ class ClusterFilterMixin:
 
             logger.debug('Keeping quote #%s (cluster #%s)',
                          quote.sid, self.sid)
-            fquote = quote.clone(id=filter_quote_offset() + quote.id,
+            fquote = quote.clone(id=filter_quote_offset(store) + quote.id,
                                  cluster_id=fcluster.id, filtered=True)
             fcluster.quotes.append(fquote)
 
@@ -98,6 +98,39 @@ def test_filter_clusters_limit(filterable_cluster):
         assert fcluster.quotes.first().sid == 0
 
 
+def test_filter_clusters_flush(filterable_cluster, monkeypatch):
+    # Kept clusters are saved by chunks of flush_clusters.
+    from brainscopypaste import db
+
+    with session_scope() as session:
+        cluster = Cluster(sid=1, source='test')
+        cluster.quotes = [
+            Quote(sid=5, string='another string with enough words and no '
+                                'problems')
+        ]
+        cluster.quotes[0].add_urls([
+            Url(timestamp=datetime.utcnow(), frequency=2,
+                url_type='M', url='some-url')
+        ])
+        session.add(cluster)
+
+    saved = []
+    save_by_copy = db.save_by_copy
+
+    def counting_save_by_copy(clusters, quotes, **kwargs):
+        saved.append(len(clusters))
+        save_by_copy(clusters, quotes, **kwargs)
+
+    monkeypatch.setattr(db, 'save_by_copy', counting_save_by_copy)
+    filter_clusters(flush_clusters=1)
+    assert saved == [1, 1]
+    with session_scope() as session:
+        assert session.query(Cluster)\
+            .filter(Cluster.filtered.is_(True)).count() == 2
+        assert session.query(Quote)\
+            .filter(Quote.filtered.is_(True)).count() == 2
+
+
 def test_cluster_emptied(filterable_cluster):
     # Modify our cluster to make it bad.
     with session_scope() as session:
@@ -0,0 +1,154 @@
+import random
+
+import pytest
+import networkx as nx
+import numpy as np
+
+from brainscopypaste.graph import (SparseGraph, in_degree_centrality,
+                                   pagerank, clustering,
+                                   betweenness_centrality,
+                                   sampled_betweenness_centrality,
+                                   rank_correlation)
+
+
+edges = [('a', 'b', .5), ('b', 'c', .5), ('c', 'd', .5), ('c', 'e', .5),
+         ('a', 'd', 2), ('d', 'a', 1), ('c', 'b', .1), ('e', 'e', 3)]
+
+
+@pytest.fixture
+def random_edges():
+    rng = random.Random(0)
+    return [(rng.randrange(200), rng.randrange(200),
+             rng.choice([.01, .2, .5, 1.3])) for _ in range(2000)]
+
+
+def nx_digraph(edges):
+    digraph = nx.DiGraph()
+    digraph.add_weighted_edges_from(edges)
+    return digraph
+
+
+def nx_undirected(edges):
+    undirected = nx.Graph()
+    for u, v, weight in nx_digraph(edges).edges(data='weight'):
+        if undirected.has_edge(u, v):
+            weight += undirected[u][v]['weight']
+        undirected.add_edge(u, v, weight=weight)
+    return undirected
+
+
+def assert_close(result, expected, tol=1e-15):
+    assert set(result.keys()) == set(expected.keys())
+    for k, v in expected.items():
+        assert abs(result[k] - v) < tol
+
+
+def test_sparse_graph_from_edges():
+    graph = SparseGraph.from_edges(edges + [('a', 'b', .7)])
+    assert graph.nodes == ['a', 'b', 'c', 'd', 'e']
+    assert graph.index == {'a': 0, 'b': 1, 'c': 2, 'd': 3, 'e': 4}
+    assert len(graph) == 5
+    assert graph.directed
+    # Repeated edges keep their last weight.
+    assert graph.adjacency[0, 1] == .7
+    assert graph.adjacency[1, 0] == 0
+    assert graph.adjacency.nnz == 8
+
+    empty = SparseGraph.from_edges([])
+    assert len(empty) == 0
+    assert empty.adjacency.shape == (0, 0)
+
+
+def test_sparse_graph_inverse_undirected():
+    graph = SparseGraph.from_edges(edges)
+    inverse = graph.inverse()
+    assert inverse.adjacency[0, 3] == 1 / 2
+    assert graph.adjacency[0, 3] == 2
+
+    undirected = graph.undirected()
+    assert not undirected.directed
+    assert undirected.undirected() is undirected
+    assert (undirected.adjacency != undirected.adjacency.T).nnz == 0
+    assert undirected.adjacency[0, 3] == 3
+    assert undirected.adjacency[1, 2] == .6
+    assert undirected.adjacency[0, 1] == .5
+    assert undirected.adjacency[4, 4] == 3
+
+    assert graph.to_dict(np.arange(5)) == {'a': 0, 'b': 1, 'c': 2, 'd': 3,
+                                           'e': 4}
+
+
+def test_in_degree_centrality(random_edges):
+    for test_edges in [edges, random_edges]:
+        assert_close(in_degree_centrality(SparseGraph.from_edges(test_edges)),
+                     nx.in_degree_centrality(nx_digraph(test_edges)))
+
+
+def test_pagerank(random_edges):
+    for test_edges in [edges, random_edges]:
+        assert_close(pagerank(SparseGraph.from_edges(test_edges),
+                              max_iter=10000, tol=1e-15),
+                     nx.pagerank(nx_digraph(test_edges), max_iter=10000,
+                                 tol=1e-15))
+    assert pagerank(SparseGraph.from_edges([])) == {}
+
+    with pytest.raises(Exception) as excinfo:
+        pagerank(SparseGraph.from_edges(random_edges), max_iter=2)
+    assert 'failed to converge' in str(excinfo.value)
+
+
+def test_clustering(random_edges):
+    for test_edges in [edges, random_edges]:
+        assert_close(
+            clustering(SparseGraph.from_edges(test_edges).undirected()),
+            nx.clustering(nx_undirected(test_edges), weight='weight'))
+    # Chunking rows doesn't change results.
+    undirected = SparseGraph.from_edges(random_edges).undirected()
+    assert_close(clustering(undirected, chunk_size=7),
+                 clustering(undirected))
+    assert clustering(SparseGraph.from_edges([]).undirected()) == {}
+
+    with pytest.raises(ValueError):
+        clustering(SparseGraph.from_edges(edges))
+
+
+@pytest.mark.parametrize('jobs', [1, 2, 3])
+def test_betweenness_centrality(random_edges, jobs):
+    for test_edges in [edges, random_edges[:500]]:
+        assert_close(betweenness_centrality(SparseGraph.from_edges(test_edges),
+                                            jobs=jobs),
+                     nx.betweenness_centrality(nx_digraph(test_edges),
+                                               weight='weight'))
+    assert betweenness_centrality(SparseGraph.from_edges([]), jobs=jobs) == {}
+
+
+def test_sampled_betweenness_centrality(random_edges):
+    graph = SparseGraph.from_edges(random_edges[:500])
+    exact = betweenness_centrality(graph)
+
+    # Using all nodes as pivots gives the exact betweenness.
+    betweenness, errors = sampled_betweenness_centrality(graph, 10000)
+    assert_close(betweenness, exact)
+    assert set(errors.values()) == {0}
+
+    # Sampling is reproducible and independent of jobs.
+    betweenness, errors = sampled_betweenness_centrality(graph, 50, seed=1)
+    assert set(betweenness.keys()) == set(exact.keys())
+    assert_close(sampled_betweenness_centrality(graph, 50, seed=1, jobs=2)[0],
+                 betweenness)
+    assert sampled_betweenness_centrality(graph, 50, seed=2)[0] != \
+        betweenness
+
+    # Estimated errors are of the order of actual errors.
+    actual = np.sqrt(np.mean([(betweenness[k] - exact[k]) ** 2
+                              for k in exact]))
+    estimated = np.sqrt(np.mean([e ** 2 for e in errors.values()]))
+    assert estimated / 3 < actual < estimated * 3
+    assert rank_correlation(betweenness, exact) > .7
+
+
+def test_rank_correlation():
+    assert rank_correlation({'a': 1, 'b': 2, 'c': 3},
+                            {'a': 10, 'b': 20, 'c': 30, 'd': 0}) == 1
+    assert rank_correlation({'a': 1, 'b': 2, 'c': 3},
+                            {'a': 30, 'b': 20, 'c': 10}) == -1
@@ -3,9 +3,12 @@
 This module defines functions and classes to load and parse dataset files.
 :func:`load_fa_features` loads Free Association features (using
 :class:`FAFeatureLoader`) and :func:`load_mt_frequency_and_tokens` loads
-MemeTracker features. Both save their computed features to pickle files for
-later use in analyses. :class:`MemeTrackerParser` parses and loads the whole
-MemeTracker dataset into the database and is used by :mod:`.cli`.
+MemeTracker features. Both save their computed features to the
+:class:`~.featurestore.FeatureStore` at :data:`~.settings.FEATURES` for later
+use in analyses, and skip features that are already up to date.
+:func:`load_quote_tags` stores the TreeTagger tags of quotes in the database.
+:class:`MemeTrackerParser` parses and loads the whole MemeTracker dataset into
+the database and is used by :mod:`.cli`.
 
 """
 
@@ -14,15 +17,32 @@ from datetime import datetime
 import re
 from codecs import open
 import logging
-import pickle
-from collections import defaultdict
+from collections import Counter
+from contextlib import closing
+from multiprocessing import Pool
+from concurrent.futures import (ProcessPoolExecutor, Future, wait,
+                                FIRST_COMPLETED)
+from timeit import default_timer
+from hashlib import sha1
+import os
+import mmap
+import gzip
+import bz2
+import lzma
+from io import StringIO
 
 import click
 from progressbar import ProgressBar
-import networkx as nx
+import numpy as np
+from sqlalchemy import func
 
-from brainscopypaste.db import Session, Cluster, Quote, Url, save_by_copy
+from brainscopypaste.db import (Session, Cluster, Quote, UrlBuffer,
+                                LoadCheckpoint, save_by_copy,
+                                save_rows_by_copy, _copy, _copy_text_array,
+                                _url_type_oid)
 from brainscopypaste.utils import session_scope, execute_raw, cache
+from brainscopypaste import graph
+from brainscopypaste.featurestore import FeatureStore, input_digest
 from brainscopypaste.features import SubstitutionFeaturesMixin
 from brainscopypaste.conf import settings
 
@@ -30,95 +50,654 @@ from brainscopypaste.conf import settings
 logger = logging.getLogger(__name__)
 
 
-def load_fa_features():
+def compute_features(engine='sparse', jobs=1, pivots=None, seed=0,
+                     store=None, force=False, processes=None):
+    """Compute all MemeTracker and Free Association features concurrently,
+    and save them to the feature store.
+
+    This does the same as :func:`load_mt_frequency_and_tokens` followed by
+    :func:`load_fa_features`, but runs the independent tasks of
+    :data:`feature_tasks` (counting MemeTracker frequencies and tokens,
+    parsing the FA norms, then computing each FA feature on the parsed norms)
+    in a pool of `processes` worker processes (see :func:`_run_feature_task`),
+    so that the time taken is that of the longest chain of tasks instead of
+    the sum of all tasks. Features which are up to date are not recomputed
+    (unless `force` is `True`). The start and duration of each task are
+    printed to stdout, and the features are saved by the current process
+    once they are all computed.
+
+    Parameters
+    ----------
+    engine : str in {'sparse', 'networkx'}, optional
+        Graph engine used by the :class:`FAFeatureLoader`; defaults to
+        `'sparse'`.
+    jobs : int, optional
+        Number of worker processes counting MemeTracker frequencies and
+        computing betweenness with the `'sparse'` engine (in addition to the
+        task processes); defaults to 1.
+    pivots : int, optional
+        If not `None` (default), estimate betweenness from this number of
+        sampled source words instead of computing it exactly.
+    seed : int, optional
+        Seed for the sampling of `pivots`; defaults to 0.
+    store : :class:`~.columnar.ColumnarStore`, optional
+        If provided, read the filtered quotes from this store instead of the
+        database.
+    force : bool, optional
+        Recompute features even if they are up to date; defaults to `False`.
+    processes : int, optional
+        Number of processes running tasks; defaults to the number of CPUs (or
+        the number of tasks, if smaller). If 1, tasks are run one after the
+        other in the current process.
+
+    """
+
+    logger.info('Computing features')
+    click.echo('Computing features...')
+
+    # Only keep tasks leading to features that are not up to date.
+    features = FeatureStore(settings.FEATURES)
+    digests = {'frequency and tokens': _mt_digest(store),
+               'norms': _fa_digest(pivots, seed)}
+    tasks = {}
+    for task, names, source in [
+            ('frequency and tokens', ('frequency', 'tokens'), 'MemeTracker'),
+            ('norms', FAFeatureLoader.features, 'FreeAssociation')]:
+        if not force and features.is_fresh(names, digests[task]):
+            logger.info('%s features are up to date', source)
+            click.echo('{} features are already up to date'.format(source))
+            continue
+        for name, dependencies in feature_tasks.items():
+            if name == task or task in dependencies:
+                tasks[name] = dependencies
+    if len(tasks) == 0:
+        click.secho('OK', fg='green', bold=True)
+        return
+
+    if processes is None:
+        processes = min(len(tasks), os.cpu_count() or 1)
+    options = {'engine': engine, 'jobs': jobs, 'pivots': pivots,
+               'seed': seed, 'store': store}
+    logger.info('Running %s feature tasks with %s processes', len(tasks),
+                processes)
+
+    results = {}
+    running = {}
+    durations = {}
+    start = default_timer()
+    executor = None
+    if processes > 1:
+        # Don't share database connections with the workers.
+        bind = Session.kw.get('bind')
+        if bind is not None:
+            bind.dispose()
+        executor = ProcessPoolExecutor(processes)
+    try:
+        while len(tasks) > 0 or len(running) > 0:
+            # Start all tasks whose dependencies are computed.
+            ready = [task for task, dependencies in sorted(tasks.items())
+                     if all(dependency in results
+                            for dependency in dependencies)]
+            for task in ready:
+                inputs = dict((dependency, results[dependency])
+                              for dependency in tasks.pop(task))
+                click.echo('Started {}'.format(task))
+                if executor is None:
+                    future = Future()
+                    future.set_result(_run_feature_task(task, options,
+                                                        inputs))
+                else:
+                    future = executor.submit(_run_feature_task, task,
+                                             options, inputs)
+                running[future] = task
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                task = running.pop(future)
+                results[task], durations[task] = future.result()
+                logger.info("Task '%s' took %.2f s", task, durations[task])
+                click.echo('Finished {} in {:.2f} s'
+                           .format(task, durations[task]))
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    if results.get('betweenness', {}).get('error') is not None:
+        click.echo('Estimated FreeAssociation betweenness from {} pivots '
+                   '(median relative standard error: {:.1%})'
+                   .format(pivots, results['betweenness']['error']))
+
+    logger.debug('Saving features to the feature store')
+    if 'frequency and tokens' in results:
+        features.save(results['frequency and tokens'],
+                      digests['frequency and tokens'])
+    if 'norms' in results:
+        features.save(dict((name, results[name][name])
+                           for name in FAFeatureLoader.features),
+                      digests['norms'])
+
+    click.echo('Ran {} tasks in {:.2f} s (sum of task durations: {:.2f} s)'
+               .format(len(results), default_timer() - start,
+                       sum(durations.values())))
+    click.secho('OK', fg='green', bold=True)
+    logger.info('Done computing features')
+
+
+#: Tasks run by :func:`compute_features`, associating each task to the tasks
+#: whose results it needs (see :func:`_run_feature_task`).
+feature_tasks = {
+    'frequency and tokens': (),
+    'norms': (),
+    'degree': ('norms',),
+    'pagerank': ('norms',),
+    'betweenness': ('norms',),
+    'clustering': ('norms',),
+}
+
+
+def _run_feature_task(task, options, inputs):
+    """Run task `task` of :data:`feature_tasks`, with the keyword arguments
+    of :func:`compute_features` in `options`, and the results of the tasks it
+    depends on in `inputs`.
+
+    Returns
+    -------
+    result : dict
+        Results of the task: the `'frequency'` and `'tokens'` features for
+        `'frequency and tokens'`, the FA norms (as `'norms'`) for `'norms'`,
+        or the feature for FA features (along with its estimated `'error'`
+        for `'betweenness'`).
+    duration : float
+        Time taken by the task, in seconds.
+
+    """
+
+    start = default_timer()
+    if task == 'frequency and tokens':
+        result = _count_frequency_and_tokens(options['store'],
+                                             progress=False,
+                                             jobs=options['jobs'])
+    elif task == 'norms':
+        result = {'norms': FAFeatureLoader()._norms}
+    else:
+        loader = FAFeatureLoader(engine=options['engine'],
+                                 jobs=options['jobs'],
+                                 pivots=options['pivots'],
+                                 seed=options['seed'])
+        loader._norms = inputs['norms']['norms']
+        result = {task: getattr(loader, task)()}
+        if task == 'betweenness':
+            result['error'] = loader.betweenness_error
+    return result, default_timer() - start
+
+
+def load_fa_features(engine='sparse', jobs=1, pivots=None, seed=0,
+                     force=False):
     """Load the Free Association dataset and save all its computed features to
-    pickle files.
+    the feature store.
 
     FA degree, pagerank, betweenness, and clustering are computed using the
-    :class:`FAFeatureLoader` class, and saved respectively to
-    :data:`~.settings.DEGREE`, :data:`~.settings.PAGERANK`,
-    :data:`~.settings.BETWEENNESS` and :data:`~.settings.CLUSTERING`. Progress
-    is printed to stdout.
+    :class:`FAFeatureLoader` class, and saved as features `'degree'`,
+    `'pagerank'`, `'betweenness'` and `'clustering'` of the
+    :class:`~.featurestore.FeatureStore` at :data:`~.settings.FEATURES`, along
+    with a digest of the source files and of `pivots` and `seed`. If the
+    stored features were computed from the same inputs, nothing is
+    recomputed (unless `force` is `True`). Progress is printed to stdout. See
+    :func:`compute_features` to compute features concurrently.
+
+    Parameters
+    ----------
+    engine : str in {'sparse', 'networkx'}, optional
+        Graph engine used by the :class:`FAFeatureLoader`; defaults to
+        `'sparse'`.
+    jobs : int, optional
+        Number of worker processes computing betweenness with the `'sparse'`
+        engine; defaults to 1.
+    pivots : int, optional
+        If not `None` (default), estimate betweenness from this number of
+        sampled source words instead of computing it exactly, and print the
+        estimated error (see :meth:`FAFeatureLoader.betweenness`).
+    seed : int, optional
+        Seed for the sampling of `pivots`; defaults to 0.
+    force : bool, optional
+        Recompute features even if they are up to date; defaults to `False`.
 
     """
 
     logger.info('Computing FreeAssociation features')
     click.echo('Computing FreeAssociation features...')
 
-    loader = FAFeatureLoader()
-    degree = loader.degree()
-    logger.debug('Saving FreeAssociation degree to pickle')
-    with open(settings.DEGREE, 'wb') as f:
-        pickle.dump(degree, f)
-
-    pagerank = loader.pagerank()
-    logger.debug('Saving FreeAssociation pagerank to pickle')
-    with open(settings.PAGERANK, 'wb') as f:
-        pickle.dump(pagerank, f)
-
-    betweenness = loader.betweenness()
-    logger.debug('Saving FreeAssociation betweenness to pickle')
-    with open(settings.BETWEENNESS, 'wb') as f:
-        pickle.dump(betweenness, f)
-
-    clustering = loader.clustering()
-    logger.debug('Saving FreeAssociation clustering to pickle')
-    with open(settings.CLUSTERING, 'wb') as f:
-        pickle.dump(clustering, f)
+    store = FeatureStore(settings.FEATURES)
+    digest = _fa_digest(pivots, seed)
+    if not force and store.is_fresh(FAFeatureLoader.features, digest):
+        logger.info('FreeAssociation features are up to date')
+        click.secho('Already up to date', fg='green', bold=True)
+        return
+
+    loader = FAFeatureLoader(engine=engine, jobs=jobs, pivots=pivots,
+                             seed=seed)
+    features = {}
+    features['degree'] = loader.degree()
+    features['pagerank'] = loader.pagerank()
+    features['betweenness'] = loader.betweenness()
+    if loader.betweenness_error is not None:
+        click.echo('Estimated FreeAssociation betweenness from {} pivots '
+                   '(median relative standard error: {:.1%})'
+                   .format(pivots, loader.betweenness_error))
+    features['clustering'] = loader.clustering()
+
+    logger.debug('Saving FreeAssociation features to the feature store')
+    store.save(features, digest)
 
     click.secho('OK', fg='green', bold=True)
     logger.info('Done computing all FreeAssociation features')
 
 
-def load_mt_frequency_and_tokens():
+def load_mt_frequency_and_tokens(store=None, force=False, jobs=1):
     """Compute MemeTracker frequency codings and the list of available tokens.
 
     Iterate through the whole MemeTracker dataset loaded into the database to
-    count word frequency and make a list of tokens encountered. Frequency
-    codings are then saved to :data:`~.settings.FREQUENCY`, and the list of
-    tokens is saved to :data:`~.settings.TOKENS`. The MemeTracker dataset must
-    have been loaded and filtered previously, or an excetion will be raised
-    (see :ref:`usage` or :mod:`.cli` for more about that). Progress is printed
-    to stdout.
+    count word frequency and make a list of tokens encountered (see
+    :func:`_count_frequency_and_tokens`). Frequency codings and the set of
+    tokens are then saved as features `'frequency'` and `'tokens'` of the
+    :class:`~.featurestore.FeatureStore` at :data:`~.settings.FEATURES`,
+    along with a digest of the filtered quotes (see
+    :func:`_filtered_quotes_digest`). If the stored features were computed
+    from the same quotes, nothing is recomputed (unless `force` is `True`).
+    The MemeTracker dataset must have been loaded and filtered previously, or
+    an excetion will be raised (see :ref:`usage` or :mod:`.cli` for more
+    about that). Progress is printed to stdout.
+
+    Parameters
+    ----------
+    store : :class:`~.columnar.ColumnarStore`, optional
+        If provided, read the filtered quotes from this store instead of the
+        database.
+    force : bool, optional
+        Recompute features even if they are up to date; defaults to `False`.
+    jobs : int, optional
+        Number of worker processes counting frequencies; defaults to 1.
 
     """
 
     logger.info('Computing memetracker frequencies and token list')
     click.echo('Computing MemeTracker frequencies and token list...')
 
+    features = FeatureStore(settings.FEATURES)
+    digest = _mt_digest(store)
+    if not force and features.is_fresh(['frequency', 'tokens'], digest):
+        logger.info('Memetracker frequencies and token list are up to date')
+        click.secho('Already up to date', fg='green', bold=True)
+        return
+
+    logger.debug('Saving memetracker frequencies and token list to the '
+                 'feature store')
+    features.save(_count_frequency_and_tokens(store, jobs=jobs), digest)
+
+    click.secho('OK', fg='green', bold=True)
+    logger.info('Done computing memetracker frequencies and token list')
+
+
+def _count_frequency_and_tokens(store=None, progress=True, jobs=1,
+                                blocks_per_job=4, batch_size=10000):
+    """Count word frequencies and list the tokens of filtered quotes (from
+    the database, or from `store` if provided), showing a progress bar if
+    `progress` is `True`.
+
+    Filtered quotes are streamed in a single pass (see
+    :func:`_quote_batches`), reading only their strings and url frequencies,
+    and counted by batches (see :func:`_count_batch`). With several `jobs`,
+    quotes are split into blocks (of quote ids, or of store parts) counted by
+    :func:`_count_block` in worker processes, and the counts of all blocks
+    are merged.
+
+    Parameters
+    ----------
+    store : :class:`~.columnar.ColumnarStore`, optional
+        If provided, read the filtered quotes from this store instead of the
+        database.
+    progress : bool, optional
+        Whether to show a progress bar; defaults to `True`.
+    jobs : int, optional
+        Number of worker processes; defaults to 1, i.e. count in the current
+        process.
+    blocks_per_job : int, optional
+        Number of blocks of quotes per worker; defaults to 4.
+    batch_size : int, optional
+        Number of quotes fetched from the database and counted at a time;
+        defaults to 10000.
+
+    Returns
+    -------
+    features : dict
+        The `'frequency'` dict of word frequencies (counted on tokens or
+        lemmas, depending on the source type of the `'frequency'` feature in
+        :attr:`~.features.SubstitutionFeaturesMixin.__features__`) and the
+        `'tokens'` set.
+
+    Raises
+    ------
+    Exception
+        If there are no filtered quotes.
+
+    """
+
     # See if we should count frequency of tokens or lemmas.
     source_type, _ = SubstitutionFeaturesMixin.__features__['frequency']
     logger.info('Frequencies will be computed on %s', source_type)
 
-    with session_scope() as session:
-        quote_ids = session.query(Quote.id).filter(Quote.filtered.is_(True))
-
-        # Check we have filtered quotes.
-        if quote_ids.count() == 0:
+    # Check we have filtered quotes, and split them into blocks.
+    n_blocks = max(1, jobs * blocks_per_job)
+    if store is not None:
+        n_quotes = store.count('quotes', filtered=True)
+        if n_quotes == 0:
+            raise Exception('Found no filtered quotes, aborting.')
+        parts = store.parts('quotes')
+        blocks = [parts[i::n_blocks]
+                  for i in range(min(n_blocks, len(parts)))]
+    else:
+        with session_scope() as session:
+            n_quotes, min_id, max_id = session.query(
+                func.count(Quote.id), func.min(Quote.id),
+                func.max(Quote.id))\
+                .filter(Quote.filtered.is_(True)).one()
+        if n_quotes == 0:
             raise Exception('Found no filtered quotes, aborting.')
-        quote_ids = [id for (id,) in quote_ids]
+        bounds = np.linspace(min_id, max_id + 1, n_blocks + 1)\
+            .astype(int).tolist()
+        blocks = [(start, end) for start, end in zip(bounds[:-1], bounds[1:])
+                  if start < end]
+    logger.debug('Counting %s filtered quotes in %s blocks with %s jobs',
+                 n_quotes, len(blocks), jobs)
+
+    frequencies = Counter()
+    tokens = set()
+    bar = ProgressBar(max_value=n_quotes) if progress else None
+    counted = 0
+    args = [(source_type, store, block, batch_size) for block in blocks]
+    if jobs == 1:
+        results = map(_count_block, args)
+        pool = None
+    else:
+        # Don't share database connections with the workers.
+        bind = Session.kw.get('bind')
+        if bind is not None:
+            bind.dispose()
+        pool = Pool(jobs)
+        results = pool.imap_unordered(_count_block, args)
+    try:
+        for block_frequencies, block_tokens, block_count in results:
+            # Keep words with zero frequency, which `+=` would drop.
+            frequencies.update(block_frequencies)
+            tokens.update(block_tokens)
+            counted += block_count
+            if bar is not None:
+                bar.update(counted)
+    finally:
+        if pool is not None:
+            pool.terminate()
+    if bar is not None:
+        bar.finish()
+
+    return {'frequency': dict(frequencies), 'tokens': tokens}
+
+
+def _count_block(args):
+    """Count word frequencies and tokens of a block of filtered quotes (see
+    :func:`_quote_batches`), possibly in a worker process.
 
-    # Compute frequencies and token list.
-    frequencies = defaultdict(int)
+    Parameters
+    ----------
+    args : tuple
+        `(source_type, store, block, batch_size)`, where `source_type` is
+        `'tokens'` or `'lemmas'`, and the other items are passed on to
+        :func:`_quote_batches`.
+
+    Returns
+    -------
+    frequencies : :class:`collections.Counter`
+        Frequencies of the words in the block.
+    tokens : set
+        Tokens encountered in the block.
+    count : int
+        Number of quotes in the block.
+
+    """
+
+    source_type, store, block, batch_size = args
+    frequencies = Counter()
     tokens = set()
-    for quote_id in ProgressBar()(quote_ids):
-        with session_scope() as session:
-            quote = session.query(Quote).get(quote_id)
-            tokens.update(quote.tokens)
-            for word in getattr(quote, source_type):
-                frequencies[word] += quote.frequency
-    # Convert frequency back to a normal dict.
-    frequencies = dict(frequencies)
-
-    logger.debug('Saving memetracker frequencies to pickle')
-    with open(settings.FREQUENCY, 'wb') as f:
-        pickle.dump(frequencies, f)
-    logger.debug('Saving memetracker token list to pickle')
-    with open(settings.TOKENS, 'wb') as f:
-        pickle.dump(tokens, f)
+    count = 0
+    with closing(_quote_batches(store, block, batch_size)) as batches:
+        for batch in batches:
+            _count_batch(batch, source_type, frequencies, tokens)
+            count += len(batch)
+    return frequencies, tokens, count
+
+
+def _quote_batches(store, block, batch_size):
+    """Iterate through the filtered quotes of `block` in batches of (at
+    most) `batch_size` `(string, frequency, tokens, lemmas)` tuples.
+
+    If `store` is `None`, `block` is a `(start, end)` range of quote ids, and
+    quotes are streamed from a server-side cursor on the database with
+    :meth:`~sqlalchemy.orm.query.Query.yield_per`, loading only quote
+    strings, url frequencies, and the tokens and lemmas stored by
+    :func:`load_quote_tags` (which are `None` for untagged quotes).
+    Otherwise, `block` is a list of quote parts of `store` (see
+    :meth:`~.columnar.ColumnarStore.quote_strings`), which holds no tags.
+
+    """
+
+    if store is not None:
+        for strings, frequencies in store.quote_strings(filtered=True,
+                                                        parts=block):
+            for i in range(0, len(strings), batch_size):
+                yield [(string, frequency, None, None)
+                       for string, frequency
+                       in zip(strings[i:i + batch_size],
+                              frequencies[i:i + batch_size])]
+        return
+
+    start, end = block
+    with session_scope() as session:
+        query = session.query(Quote.string, Quote.url_frequencies,
+                              Quote.string_tokens, Quote.string_lemmas)\
+            .filter(Quote.filtered.is_(True))\
+            .filter(Quote.id >= start, Quote.id < end)\
+            .yield_per(batch_size)
+        batch = []
+        for string, url_frequencies, tokens, lemmas in query:
+            batch.append((string, sum(url_frequencies or []), tokens,
+                          lemmas))
+            if len(batch) == batch_size:
+                yield batch
+                batch = []
+        if len(batch) > 0:
+            yield batch
+
+
+def _count_batch(batch, source_type, frequencies, tokens):
+    """Count the words of a batch of `(string, frequency, tokens, lemmas)`
+    tuples into `frequencies` (a :class:`collections.Counter` of words in
+    `source_type`, `'tokens'` or `'lemmas'`) and `tokens` (a set).
+
+    Repeated strings in the batch are merged first, and the distinct strings
+    whose tokens and lemmas were not stored by :func:`load_quote_tags` are
+    tagged together with :func:`.tagger.tag_many`, so that the persistent
+    tag cache is queried once and TreeTagger called once for the batch.
+
+    """
+
+    from brainscopypaste import tagger
+
+    strings = Counter()
+    stored = {}
+    for string, frequency, string_tokens, string_lemmas in batch:
+        strings[string] += frequency
+        if string_tokens is not None and string_lemmas is not None:
+            stored[string] = {'tokens': string_tokens,
+                              'lemmas': string_lemmas}
+
+    missing = [string for string in strings if string not in stored]
+    if len(missing) > 0:
+        tagged = tagger.tag_many(missing, jobs=1, chunksize=len(missing))
+        for string, codings in zip(missing, tagged):
+            _, string_tokens, string_lemmas = tagger.parse(codings)
+            stored[string] = {'tokens': string_tokens,
+                              'lemmas': string_lemmas}
+
+    for string, frequency in strings.items():
+        tokens.update(stored[string]['tokens'])
+        for word in stored[string][source_type]:
+            frequencies[word] += frequency
+
+
+def load_quote_tags(jobs=1, batch_size=10000):
+    """Tag the strings of all quotes that were not tagged yet, and store
+    their POS tags, tokens and lemmas in the database.
+
+    Distinct strings of untagged quotes are streamed from a server-side
+    cursor, and each one is tagged once with TreeTagger, by batches spread
+    over `jobs` processes (see :func:`.tagger.tag_many`). Tags are copied
+    into a temporary table with :func:`~.db._copy` (see
+    :func:`_copy_quote_tags`), and then set on all quotes with the same string
+    in a single `UPDATE`, so that :attr:`~.db.Quote.tags`,
+    :attr:`~.db.Quote.tokens` and :attr:`~.db.Quote.lemmas` are read from the
+    database instead of being recomputed in every process. Quotes with stored
+    tags are left untouched, so an interrupted run can be started again.
+    Progress is printed to stdout.
+
+    Parameters
+    ----------
+    jobs : int, optional
+        Number of tagging processes; defaults to 1.
+    batch_size : int, optional
+        Number of strings fetched from the database and tagged at a time;
+        defaults to 10000.
+
+    """
+
+    logger.info('Tagging quote strings')
+    click.echo('Tagging quote strings...')
+
+    untagged = Quote.string_tokens.is_(None)
+    with session_scope() as session:
+        n_strings = session.query(func.count(Quote.string.distinct()))\
+            .filter(untagged).scalar()
+        if n_strings == 0:
+            logger.info('All quotes are already tagged')
+            click.secho('Already up to date', fg='green', bold=True)
+            return
+
+        logger.debug('Tagging %s distinct quote strings with %s jobs',
+                     n_strings, jobs)
+        session.execute('CREATE TEMPORARY TABLE quote_tags '
+                        '(string varchar, tags varchar[], '
+                        'tokens varchar[], lemmas varchar[]) '
+                        'ON COMMIT DROP')
+        strings = session.query(Quote.string).filter(untagged)\
+            .distinct().yield_per(batch_size)
+        bar = ProgressBar(max_value=n_strings)
+        tagged = 0
+        batch = []
+        for (string,) in strings:
+            batch.append(string)
+            if len(batch) == batch_size:
+                _copy_quote_tags(batch, jobs, session)
+                tagged += len(batch)
+                bar.update(tagged)
+                batch = []
+        if len(batch) > 0:
+            _copy_quote_tags(batch, jobs, session)
+        bar.finish()
+
+        logger.debug('Storing tags on quotes')
+        session.execute('ANALYZE quote_tags')
+        session.execute(
+            'UPDATE quote SET string_tags = quote_tags.tags, '
+            'string_tokens = quote_tags.tokens, '
+            'string_lemmas = quote_tags.lemmas '
+            'FROM quote_tags WHERE quote.string = quote_tags.string '
+            'AND quote.string_tokens IS NULL')
 
     click.secho('OK', fg='green', bold=True)
-    logger.info('Done computing memetracker frequencies and token list')
+    logger.info('Done tagging quote strings')
+
+
+def _copy_quote_tags(strings, jobs, session):
+    """Tag `strings` with `jobs` processes and copy their POS tags, tokens and
+    lemmas into the temporary `quote_tags` table of `session` (see
+    :func:`load_quote_tags`)."""
+
+    from brainscopypaste import tagger
+
+    rows = ('\t'.join([string.replace('\\', '\\\\')] +
+                      [_copy_text_array(values)
+                       for values in tagger.parse(codings)])
+            for string, codings in zip(strings,
+                                       tagger.tag_many(strings, jobs=jobs)))
+    _copy(rows, 'quote_tags', ('string', 'tags', 'tokens', 'lemmas'),
+          session=session)
+    # Each string is tagged once, so don't keep what a single job memoized.
+    for function in [tagger.tag, tagger.tags, tagger.tokens, tagger.lemmas]:
+        function.drop_cache()
+
+
+def _fa_digest(pivots, seed):
+    """Get the digest of the inputs of Free Association features: the FA
+    source files, and the betweenness `pivots` and `seed`."""
+
+    return input_digest(settings.FA_SOURCES, (pivots, seed))
+
+
+def _mt_digest(store=None):
+    """Get the digest of the inputs of MemeTracker features: the source type
+    of the `'frequency'` feature, the TreeTagger parameters (see
+    :func:`.tagger.parameters_digest`), and the filtered quotes (see
+    :func:`_filtered_quotes_digest`)."""
+
+    from brainscopypaste import tagger
+
+    source_type, _ = SubstitutionFeaturesMixin.__features__['frequency']
+    return input_digest(params=(source_type, tagger.parameters_digest(),
+                                _filtered_quotes_digest(store)))
+
+
+def _filtered_quotes_digest(store=None, batch_size=10000):
+    """Get a digest of the filtered quotes (from the database, or from `store`
+    if provided).
+
+    This hashes the ids, strings and (url) frequencies of all filtered
+    quotes, in order, along with their stored tokens and lemmas in the
+    database (see :func:`load_quote_tags`), so it changes whenever the quotes
+    the MemeTracker features are computed from change.
+
+    """
+
+    digest = sha1()
+
+    def update(*values):
+        digest.update(repr(values).encode('utf-8'))
+
+    if store is not None:
+        # Both iterate through the parts of the quotes table in order.
+        for columns, (strings, frequencies) in zip(
+                store.scan('quotes', 'id', 'filtered'),
+                store.quote_strings(filtered=True)):
+            ids = columns['id'][columns['filtered']].tolist()
+            for row in zip(ids, strings, frequencies):
+                update(*row)
+        return digest.hexdigest()
+
+    with session_scope() as session:
+        rows = session.query(Quote.id, Quote.string, Quote.url_frequencies,
+                             Quote.string_tokens, Quote.string_lemmas)\
+            .filter(Quote.filtered.is_(True))\
+            .order_by(Quote.id).yield_per(batch_size)
+        for row in rows:
+            update(*row)
+    return digest.hexdigest()
 
 
 class Parser:
@@ -136,6 +715,271 @@ class Parser:
             self._file.readline()
 
 
+class ByteRangeFile:
+
+    """Read decoded lines from a binary file, between two byte offsets.
+
+    Lines are split on `\\n` only, and :attr:`offset` always holds the byte
+    offset of the next line to be read, which lets :class:`MemeTrackerParser`
+    work on arbitrary slices of its source file.
+
+    Parameters
+    ----------
+    file : file object
+        Binary file to read lines from.
+    start : int
+        Byte offset of the first line to read (should be the start of a line).
+    end : int, optional
+        Byte offset at which to stop reading; if `None` (default), read until
+        the end of `file`.
+    encoding : str, optional
+        Encoding used to decode lines; defaults to `utf8`.
+
+    """
+
+    def __init__(self, file, start, end=None, encoding='utf8'):
+        self._file = file
+        self._file.seek(start)
+        self.offset = start
+        self.end = end
+        self.encoding = encoding
+
+    def close(self):
+        """Do nothing: the underlying file is closed by its owner; this only
+        mirrors :meth:`MmapRangeFile.close`."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def readline(self):
+        """Read and decode the next line, or return an empty string if the end
+        of the range was reached."""
+
+        if self.end is not None and self.offset >= self.end:
+            return ''
+        line = self._file.readline()
+        self.offset += len(line)
+        return line.decode(self.encoding)
+
+    def __iter__(self):
+        """Iterate over the remaining lines in the range."""
+
+        while True:
+            line = self.readline()
+            if not line:
+                return
+            yield line
+
+
+class MmapRangeFile:
+
+    """Read and classify MemeTracker lines from a memory-mapped binary file,
+    between two byte offsets.
+
+    This is the reader used by :class:`MemeTrackerParser` with
+    `engine='mmap'`. Instead of decoding each line and splitting it with
+    regular expressions (as :meth:`MemeTrackerParser._parse_line` does),
+    :meth:`read_record` classifies lines by their number of leading tabs
+    directly in the memory-mapped buffer, and splits them into fields as
+    `bytes`. Only the fields that end up stored as strings in the database
+    are decoded to `str`; numeric fields are kept as `bytes` (which
+    :func:`int` accepts), and all other fields are never decoded. Lines that
+    could be ambiguous at the byte level (those starting with a non-ASCII
+    character, or containing a carriage return) are handed over to
+    :meth:`MemeTrackerParser._parse_line`, so both readers classify lines in
+    exactly the same way.
+
+    :attr:`offset` always holds the byte offset of the next line to be read,
+    as in :class:`ByteRangeFile`. The memory map is released by :meth:`close`,
+    which is called automatically when the reader is used as a context
+    manager.
+
+    Parameters
+    ----------
+    file : file object
+        Binary file to read lines from.
+    start : int
+        Byte offset of the first line to read (should be the start of a line).
+    end : int, optional
+        Byte offset at which to stop reading; if `None` (default), read until
+        the end of `file`.
+    encoding : str, optional
+        Encoding used to decode lines; defaults to `utf8`.
+
+    """
+
+    #: Indices of the fields decoded to `str` for each type of line.
+    decoded_fields = {'cluster': (), 'quote': (3,), 'url': (2, 4, 5)}
+
+    #: Line types for each number of leading tabs.
+    tab_types = {1: 'quote', 2: 'url'}
+
+    #: ASCII bytes which, starting a line, make it a non-cluster line.
+    non_cluster_bytes = frozenset(b' \t\n\r\x0b\x0c\x1c\x1d\x1e\x1f+')
+
+    def __init__(self, file, start, end=None, encoding='utf8'):
+        if os.fstat(file.fileno()).st_size == 0:
+            # Empty files can't be memory-mapped, but bytes offer the same
+            # interface.
+            self._mmap = b''
+        else:
+            self._mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.offset = start
+        self.end = len(self._mmap) if end is None else end
+        self.encoding = encoding
+
+    def close(self):
+        """Release the memory map; the underlying file is left open."""
+
+        if isinstance(self._mmap, mmap.mmap):
+            self._mmap.close()
+        self._mmap = b''
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _next_line(self):
+        """Get the `(start, stop)` offsets of the next line (without its
+        `\\n`), and move :attr:`offset` to the following line."""
+
+        start = self.offset
+        stop = self._mmap.find(b'\n', start)
+        if stop == -1:
+            stop = len(self._mmap)
+            self.offset = stop
+        else:
+            self.offset = stop + 1
+        return start, stop
+
+    def readline(self):
+        """Read and decode the next line, or return an empty string if the end
+        of the range was reached."""
+
+        if self.offset >= self.end:
+            return ''
+        start = self.offset
+        self._next_line()
+        return self._mmap[start:self.offset].decode(self.encoding)
+
+    def read_record(self):
+        """Read and classify the next line.
+
+        Returns
+        -------
+        record : tuple or None
+            `(tipe, fields)` tuple in the format of
+            :meth:`MemeTrackerParser._parse_line`, except that only the fields
+            listed in :attr:`decoded_fields` are `str`s, and all others are
+            `bytes`; `None` if the end of the range was reached.
+
+        """
+
+        if self.offset >= self.end:
+            return None
+        buf = self._mmap
+        start, stop = self._next_line()
+
+        if start == stop:
+            # Empty line.
+            return None, []
+        if buf[start] >= 0x80 or buf.find(b'\r', start, stop) != -1:
+            return MemeTrackerParser._parse_line(
+                buf[start:self.offset].decode(self.encoding))
+
+        tabs = 0
+        while start + tabs < stop and buf[start + tabs] == 9:
+            tabs += 1
+        if tabs == 0:
+            tipe = (None if buf[start] in self.non_cluster_bytes
+                    else 'cluster')
+        else:
+            tipe = self.tab_types.get(tabs)
+        if tipe is None:
+            return None, []
+
+        # Splitting the line in one go is much faster than looking for each
+        # field in the buffer.
+        fields = buf[start:stop].split(b'\t')
+        for i in self.decoded_fields[tipe]:
+            if i < len(fields):
+                fields[i] = fields[i].decode(self.encoding)
+        return tipe, fields
+
+
+#: Format of timestamps in the MemeTracker dataset.
+MT_TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+_timestamp_regex = re.compile(r'(\d{4}-\d\d-\d\d) (\d\d):(\d\d):(\d\d)\Z',
+                              re.ASCII)
+
+# Year, month and day of the date prefixes already seen by
+# `decode_timestamp()`.
+_timestamp_dates = {}
+
+
+def decode_timestamp(string):
+    """Decode a MemeTracker timestamp (e.g. `'2008-08-01 00:24:08'`) into a
+    :class:`~datetime.datetime`, faster than
+    :meth:`~datetime.datetime.strptime` does.
+
+    Timestamps with the usual fixed layout are decoded by slicing out their
+    time fields directly, and the date prefix of each timestamp (which is
+    shared by a great many urls) is only decoded once. Anything else (e.g. a
+    malformed timestamp) falls back to :meth:`~datetime.datetime.strptime`, so
+    the result (or the error raised) is always the same as with
+    `datetime.strptime(string, MT_TIMESTAMP_FORMAT)`.
+
+    Parameters
+    ----------
+    string : str
+        The timestamp to decode.
+
+    Returns
+    -------
+    datetime.datetime
+        The decoded timestamp.
+
+    Raises
+    ------
+    ValueError
+        If `string` isn't a valid timestamp.
+
+    """
+
+    match = _timestamp_regex.match(string)
+    if match is not None:
+        date, hour, minute, second = match.groups()
+        try:
+            year, month, day = _timestamp_dates[date]
+        except KeyError:
+            try:
+                parsed = datetime.strptime(date, '%Y-%m-%d')
+            except ValueError:
+                return datetime.strptime(string, MT_TIMESTAMP_FORMAT)
+            year, month, day = _timestamp_dates[date] = \
+                parsed.year, parsed.month, parsed.day
+        try:
+            return datetime(year, month, day,
+                            int(hour), int(minute), int(second))
+        except ValueError:
+            # Out of range time fields; let strptime complain.
+            pass
+    return datetime.strptime(string, MT_TIMESTAMP_FORMAT)
+
+
+def _strptime_timestamp(string):
+    """Decode a MemeTracker timestamp with
+    :meth:`~datetime.datetime.strptime`."""
+
+    return datetime.strptime(string, MT_TIMESTAMP_FORMAT)
+
+
 class FAFeatureLoader(Parser):
 
     """Loader for the Free Association dataset and features.
@@ -149,11 +993,61 @@ class FAFeatureLoader(Parser):
     :meth:`clustering`). Use a single class instance to compute all FA
     features.
 
+    Parameters
+    ----------
+    engine : str in {'sparse', 'networkx'}, optional
+        How to compute graph features. With `'sparse'` (default), they are
+        computed by :mod:`.graph` on the CSR adjacency matrices of
+        :meth:`_sparse_norms_graph`, :meth:`_sparse_inverse_norms_graph` and
+        :meth:`_sparse_undirected_norms_graph`, which is much faster. With
+        `'networkx'`, they are computed by :mod:`networkx` on the graphs of
+        :meth:`_norms_graph`, :meth:`_inverse_norms_graph` and
+        :meth:`_undirected_norms_graph`. Both engines give the same results
+        (to floating point precision).
+    jobs : int, optional
+        Number of worker processes computing :meth:`betweenness` with the
+        `'sparse'` engine; defaults to 1, i.e. compute in the current process.
+    pivots : int, optional
+        If not `None` (default), :meth:`betweenness` is estimated from the
+        shortest paths starting at `pivots` sampled words, instead of all
+        words, which is much faster.
+    seed : int, optional
+        Seed for the sampling of `pivots`, so that approximate betweenness is
+        reproducible; defaults to 0.
+
+    Raises
+    ------
+    ValueError
+        If `engine` is unknown, or if `jobs` is set with the `'networkx'`
+        engine.
+
     """
 
     #: Size (in lines) of the header in files to be parsed.
     header_size = 4
 
+    #: Available graph engines.
+    engines = ('sparse', 'networkx')
+
+    #: Features computed by the loader, which are also the names of its
+    #: methods.
+    features = ('degree', 'pagerank', 'betweenness', 'clustering')
+
+    def __init__(self, engine='sparse', jobs=1, pivots=None, seed=0):
+        """Check the graph engine and jobs."""
+
+        if engine not in self.engines:
+            raise ValueError("Unknown graph engine: '{}'".format(engine))
+        if jobs > 1 and engine != 'sparse':
+            raise ValueError("Cannot compute features with several jobs with "
+                             "the '{}' engine".format(engine))
+        self.engine = engine
+        self.jobs = jobs
+        self.pivots = pivots
+        self.seed = seed
+        self.betweenness_errors = None
+        self.betweenness_error = None
+
     @cache
     def _norms(self):
         """Parse the Free Association Appendix A files into `self.norms`.
@@ -211,6 +1105,8 @@ class FAFeatureLoader(Parser):
 
         """
 
+        import networkx as nx
+
         logger.info('Computing FreeAssociation norms directed graph')
         graph = nx.DiGraph()
         graph.add_weighted_edges_from([(w1, w2, weight)
@@ -236,6 +1132,8 @@ class FAFeatureLoader(Parser):
 
         """
 
+        import networkx as nx
+
         logger.info('Computing FreeAssociation inverse norms directed graph')
         graph = nx.DiGraph()
         graph.add_weighted_edges_from(
@@ -262,6 +1160,8 @@ class FAFeatureLoader(Parser):
 
         """
 
+        import networkx as nx
+
         logger.info('Computing FreeAssociation norms undirected graph')
         graph = nx.Graph()
         for w1, w2, weight in self._norms_graph.edges_iter(data='weight'):
@@ -271,6 +1171,66 @@ class FAFeatureLoader(Parser):
             graph.add_edge(w1, w2, weight=weight)
         return graph
 
+    @cache
+    def _sparse_norms_graph(self):
+        """Get the Free Association weighted directed graph as a
+        :class:`~.graph.SparseGraph`.
+
+        Words are indexed in the same order as the nodes of
+        :meth:`_norms_graph`.
+
+        :func:`~.utils.memoized` for performance of the class.
+
+        Returns
+        -------
+        :class:`~.graph.SparseGraph`
+            The FA weighted directed graph.
+
+        """
+
+        logger.info('Computing FreeAssociation norms sparse directed graph')
+        return graph.SparseGraph.from_edges(
+            (w1, w2, weight) for w1, norm in self._norms.items()
+            for w2, _, weight in norm if weight != 0)
+
+    @cache
+    def _sparse_inverse_norms_graph(self):
+        """Get the Free Association directed graph with inverted weights as a
+        :class:`~.graph.SparseGraph` (see :meth:`_inverse_norms_graph`).
+
+        :func:`~.utils.memoized` for performance of the class.
+
+        Returns
+        -------
+        :class:`~.graph.SparseGraph`
+            The FA inversely weighted directed graph.
+
+        """
+
+        logger.info('Computing FreeAssociation inverse norms sparse directed '
+                    'graph')
+        return self._sparse_norms_graph.inverse()
+
+    @cache
+    def _sparse_undirected_norms_graph(self):
+        """Get the Free Association weighted undirected graph as a
+        :class:`~.graph.SparseGraph`.
+
+        As in :meth:`_undirected_norms_graph`, words connected in both
+        directions receive the sum of the two directed link weights.
+
+        :func:`~.utils.memoized` for performance of the class.
+
+        Returns
+        -------
+        :class:`~.graph.SparseGraph`
+            The FA weighted undirected graph.
+
+        """
+
+        logger.info('Computing FreeAssociation norms sparse undirected graph')
+        return self._sparse_norms_graph.undirected()
+
     @classmethod
     def _remove_zeros(self, feature):
         """Remove key-value pairs where value is zero, in dict `feature`.
@@ -303,7 +1263,11 @@ class FAFeatureLoader(Parser):
 
         # Assumes a directed unweighted graph.
         logger.info('Computing FreeAssociation degree')
-        degree = nx.in_degree_centrality(self._norms_graph)
+        if self.engine == 'sparse':
+            degree = graph.in_degree_centrality(self._sparse_norms_graph)
+        else:
+            import networkx as nx
+            degree = nx.in_degree_centrality(self._norms_graph)
         self._remove_zeros(degree)
         logger.info('Done computing FreeAssociation degree')
         return degree
@@ -322,8 +1286,13 @@ class FAFeatureLoader(Parser):
 
         # Assumes a directed weighted graph.
         logger.info('Computing FreeAssociation pagerank')
-        pagerank = nx.pagerank_scipy(self._norms_graph, max_iter=10000,
-                                     tol=1e-15, weight='weight')
+        if self.engine == 'sparse':
+            pagerank = graph.pagerank(self._sparse_norms_graph,
+                                      max_iter=10000, tol=1e-15)
+        else:
+            import networkx as nx
+            pagerank = nx.pagerank_scipy(self._norms_graph, max_iter=10000,
+                                         tol=1e-15, weight='weight')
         self._remove_zeros(pagerank)
         logger.info('Done computing FreeAssociation pagerank')
         return pagerank
@@ -339,13 +1308,49 @@ class FAFeatureLoader(Parser):
             stronger link is easier to cross). Words with betweenness zero are
             removed from the dict.
 
+        Notes
+        -----
+        If `self.pivots` is set, betweenness is estimated from that number of
+        sampled source words (see
+        :func:`~.graph.sampled_betweenness_centrality`). With the `'sparse'`
+        engine, the standard error of each word's estimate is then stored in
+        `self.betweenness_errors`, and their median relative to the estimates
+        in `self.betweenness_error`. Use :func:`~.graph.rank_correlation` to
+        compare the estimates to an exact computation.
+
         """
 
         # Assumes a directed weighted graph.
-        logger.info('Computing FreeAssociation betweenness '
-                    '(this might take a long time, e.g. 30 minutes)')
-        betweenness = nx.betweenness_centrality(self._inverse_norms_graph,
-                                                weight='weight')
+        if self.pivots is None:
+            logger.info('Computing FreeAssociation betweenness with %s jobs '
+                        '(this might take a long time, e.g. 30 minutes for '
+                        'one job)', self.jobs)
+        else:
+            logger.info('Estimating FreeAssociation betweenness from %s '
+                        'pivots (seed %s) with %s jobs', self.pivots,
+                        self.seed, self.jobs)
+
+        if self.engine == 'sparse' and self.pivots is not None:
+            betweenness, errors = graph.sampled_betweenness_centrality(
+                self._sparse_inverse_norms_graph, self.pivots,
+                seed=self.seed, jobs=self.jobs)
+            self.betweenness_errors = errors
+            relative_errors = [errors[word] / value
+                               for word, value in betweenness.items()
+                               if value != 0]
+            self.betweenness_error = (float(np.median(relative_errors))
+                                      if len(relative_errors) > 0 else 0.0)
+            logger.info('Median relative standard error of estimated '
+                        'FreeAssociation betweenness is %s',
+                        self.betweenness_error)
+        elif self.engine == 'sparse':
+            betweenness = graph.betweenness_centrality(
+                self._sparse_inverse_norms_graph, jobs=self.jobs)
+        else:
+            import networkx as nx
+            betweenness = nx.betweenness_centrality(
+                self._inverse_norms_graph, k=self.pivots, seed=self.seed,
+                weight='weight')
         self._remove_zeros(betweenness)
         logger.info('Done computing FreeAssociation betweenness')
         return betweenness
@@ -366,8 +1371,13 @@ class FAFeatureLoader(Parser):
 
         # Assumes an undirected weighted graph.
         logger.info('Computing FreeAssociation clustering')
-        clustering = nx.clustering(self._undirected_norms_graph,
-                                   weight='weight')
+        if self.engine == 'sparse':
+            clustering = graph.clustering(
+                self._sparse_undirected_norms_graph)
+        else:
+            import networkx as nx
+            clustering = nx.clustering(self._undirected_norms_graph,
+                                       weight='weight')
         self._remove_zeros(clustering)
         logger.info('Done computing FreeAssociation clustering')
         return clustering
@@ -381,38 +1391,219 @@ class MemeTrackerParser(Parser):
     internal work is done by the utility methods :meth:`_parse`,
     :meth:`_parse_cluster_block` and :meth:`_parse_line` (for actual parsing),
     :meth:`_handle_cluster`, :meth:`_handle_quote` and :meth:`_handle_url` (for
-    parsed data handling), and :meth:`_check` (for consistency checking).
+    parsed data handling), and :meth:`_check` (for consistency checking). When
+    parsing with several processes, :meth:`_cluster_ranges` splits the file
+    into blocks of clusters which are parsed by :func:`_parse_range` in worker
+    processes, and :meth:`_parse_parallel` saves their results.
 
     Parameters
     ----------
     filename : str
-        Path to the MemeTracker dataset file to parse.
-    line_count : int
-        Number of lines in `filename`, to help in showing a progress bar.
-        Should be computed beforehand with e.g. ``wc -l <filename>``, so python
-        doesn't need to load the complete file twice.
+        Path to the MemeTracker dataset file to parse. Files ending in `.gz`,
+        `.bz2` or `.xz` are decompressed on the fly as they are parsed (see
+        :attr:`decompressors`). Parsing progress is measured in bytes of
+        `filename` (compressed bytes for compressed files), so no line count
+        is needed beforehand.
     limit : int, optional
         If not `None` (default), stops the parsing once `limit` clusters have
         been read. Useful for testing purposes.
+    flush_clusters : int, optional
+        If not `None` (default), save parsed clusters and quotes to the
+        database every time `flush_clusters` clusters have been read, instead
+        of keeping them all in memory until the end of the parsing.
+    flush_megabytes : float, optional
+        If not `None` (default), save parsed clusters and quotes to the
+        database every time approximately `flush_megabytes` megabytes of the
+        source file have been read. Can be combined with `flush_clusters`, in
+        which case the first threshold reached triggers the save.
+    jobs : int, optional
+        Number of worker processes to parse the file with; defaults to 1, i.e.
+        parse serially in the current process. With more than one job, the file
+        is split into blocks of clusters, and each block is saved to the
+        database as soon as it has been parsed (so `flush_clusters` and
+        `flush_megabytes` are ignored). The resulting database is the same as
+        with serial parsing.
+    timestamp_decoder : str in {'fast', 'strptime'}, optional
+        How to decode url timestamps. With `'fast'` (default), use
+        :func:`decode_timestamp`; with `'strptime'`, use
+        :meth:`~datetime.datetime.strptime`. Both give the same results.
+    engine : str in {'text', 'mmap'}, optional
+        How to read the source file. With `'text'` (default), each line is
+        decoded then classified by :meth:`_parse_line` (reading through a
+        :class:`ByteRangeFile`). With `'mmap'`, the file is memory-mapped and
+        lines are classified at the byte level by a :class:`MmapRangeFile`,
+        decoding only the fields that are stored, which is faster. Both
+        engines give the same results. Compressed files can only be read with
+        `'text'`.
+    resume : bool, optional
+        If `True`, resume an interrupted parsing of `filename` from its last
+        :class:`~.db.LoadCheckpoint` (or from the start if there is none),
+        instead of parsing from the start; defaults to `False`. Checkpoints
+        are saved with each batch when `flush_clusters` or `flush_megabytes`
+        are set, so a parsing interrupted by a crash loses at most one batch.
+        Requires `flush_clusters` or `flush_megabytes`, and can't be used with
+        `limit` or `jobs`.
+    append : bool, optional
+        If `True`, add the clusters and quotes of `filename` to those already
+        in the database (e.g. to load a new MemeTracker dump), instead of
+        expecting an empty database; defaults to `False`. The new clusters get
+        the next dump number (`self.dump`, saved in :attr:`~.db.Cluster.dump`),
+        and cluster and quote ids from the file are shifted past the largest
+        unfiltered ids in the database (by `self.cluster_id_offset` and
+        `self.quote_id_offset`) to avoid collisions; the original ids are
+        kept in `sid`. The new clusters can then be filtered and mined on
+        their own by passing their dump number to
+        :func:`~.filter.filter_clusters` and
+        :func:`~.mine.mine_substitutions_with_model`.
+    store : :class:`~.columnar.ColumnarStore`, optional
+        If not `None`, save parsed clusters and quotes to this columnar store
+        instead of the database (and check them against it), so that no
+        database server is needed. Can't be used with `jobs` or `resume`.
+
+    Raises
+    ------
+    ValueError
+        If both `limit` and `jobs` (with `jobs > 1`) are set, if `engine` or
+        `timestamp_decoder` is unknown, if `resume` or `store` is used with
+        the wrong options, or if `filename` is compressed and `jobs > 1` or
+        `engine` is `'mmap'`.
 
     """
 
     #: Size (in lines) of the header in the MemeTracker file to be parsed.
     header_size = 6
 
-    def __init__(self, filename, line_count, limit=None):
+    #: Number of blocks the file is split into for each worker process, when
+    #: parsing with several jobs (more blocks balance the load better between
+    #: workers, fewer blocks mean less overhead).
+    blocks_per_job = 4
+
+    #: Query comparing the counts in the `check_cluster` and `check_quote`
+    #: temporary tables filled by :meth:`_check` to the counts in the
+    #: database, returning one `(kind, sid, field, expected, actual)` row per
+    #: difference (`expected` or `actual` is `None` for a quote that is
+    #: missing from the file or the database).
+    _check_query = """
+        WITH quote_counts AS (
+            SELECT quote.id, quote.sid, quote.cluster_id,
+                   coalesce(cardinality(quote.url_timestamps), 0) AS size,
+                   coalesce((SELECT sum(frequency)
+                             FROM unnest(quote.url_frequencies) AS frequency),
+                            0)::bigint AS frequency
+            FROM quote
+                JOIN check_cluster ON quote.cluster_id = check_cluster.id
+        ), cluster_counts AS (
+            SELECT check_cluster.id,
+                   coalesce(cluster.sid, check_cluster.id) AS sid,
+                   count(quote_counts.id) AS size,
+                   coalesce(sum(quote_counts.frequency), 0)::bigint
+                       AS frequency
+            FROM check_cluster
+                LEFT JOIN cluster ON cluster.id = check_cluster.id
+                LEFT JOIN quote_counts
+                    ON quote_counts.cluster_id = check_cluster.id
+            GROUP BY check_cluster.id, cluster.sid
+        ), mismatches AS (
+            SELECT 'Cluster' AS kind, cluster_counts.sid, 'size' AS field,
+                   check_cluster.size AS expected,
+                   cluster_counts.size AS actual
+            FROM check_cluster JOIN cluster_counts USING (id)
+            WHERE check_cluster.size != cluster_counts.size
+          UNION ALL
+            SELECT 'Cluster', cluster_counts.sid, 'frequency',
+                   check_cluster.frequency, cluster_counts.frequency
+            FROM check_cluster JOIN cluster_counts USING (id)
+            WHERE check_cluster.frequency != cluster_counts.frequency
+          UNION ALL
+            SELECT 'Quote', coalesce(quote_counts.sid, check_quote.id), 'size',
+                   check_quote.size, quote_counts.size
+            FROM check_quote FULL JOIN quote_counts USING (id)
+            WHERE check_quote.size IS DISTINCT FROM quote_counts.size
+          UNION ALL
+            SELECT 'Quote', quote_counts.sid, 'frequency',
+                   check_quote.frequency, quote_counts.frequency
+            FROM check_quote JOIN quote_counts USING (id)
+            WHERE check_quote.frequency != quote_counts.frequency
+        )
+        SELECT * FROM mismatches ORDER BY kind, sid, field
+    """
+
+    #: Functions opening a decompressed stream from a binary file object, for
+    #: each supported compressed file extension.
+    decompressors = {'.gz': gzip.open, '.bz2': bz2.open, '.xz': lzma.open}
+
+    #: Line reader classes for each parsing engine.
+    engines = {'text': ByteRangeFile, 'mmap': MmapRangeFile}
+
+    #: Url timestamp decoding functions.
+    timestamp_decoders = {'fast': decode_timestamp,
+                          'strptime': _strptime_timestamp}
+
+    def __init__(self, filename, limit=None, flush_clusters=None,
+                 flush_megabytes=None, jobs=1, engine='text',
+                 timestamp_decoder='fast', resume=False, append=False,
+                 store=None):
         """Setup parsing and tracking attributes."""
 
+        if limit is not None and jobs > 1:
+            raise ValueError('Cannot limit the number of clusters parsed '
+                             'when parsing with several jobs')
+        if engine not in self.engines:
+            raise ValueError("Unknown parsing engine: '{}'".format(engine))
+        if timestamp_decoder not in self.timestamp_decoders:
+            raise ValueError("Unknown timestamp decoder: '{}'"
+                             .format(timestamp_decoder))
+        extension = os.path.splitext(filename)[1]
+        self.compression = (extension if extension in self.decompressors
+                            else None)
+        if self.compression is not None and (jobs > 1 or engine == 'mmap'):
+            raise ValueError("Cannot parse a compressed file with several "
+                             "jobs or the 'mmap' engine")
+        if resume:
+            if flush_clusters is None and flush_megabytes is None:
+                raise ValueError('Cannot resume a parsing without '
+                                 'flush_clusters or flush_megabytes')
+            if limit is not None or jobs > 1:
+                raise ValueError('Cannot resume a parsing with limit '
+                                 'or several jobs')
+        if store is not None and (jobs > 1 or resume):
+            raise ValueError('Cannot parse into a columnar store with '
+                             'several jobs or resume')
+
         self.filename = filename
-        self.line_count = line_count
         self.limit = limit
+        self.flush_clusters = flush_clusters
+        self.flush_megabytes = flush_megabytes
+        self.jobs = jobs
+        self.engine = engine
+        self.timestamp_decoder = timestamp_decoder
+        self._decode_timestamp = self.timestamp_decoders[timestamp_decoder]
+        self.resume = resume
+        self.append = append
+        self.store = store
+
+        # Dump number and id offsets for the parsed clusters and quotes, set
+        # by _setup_ids() when parsing.
+        self.dump = 0
+        self.cluster_id_offset = 0
+        self.quote_id_offset = 0
+
+        # Checkpoints are saved with each batch when flushing to the database.
+        self._checkpointing = (store is None and
+                               (flush_clusters is not None or
+                                flush_megabytes is not None))
+        self._checkpoint_filename = os.path.abspath(filename)
 
         # Keep track of if we've already parsed or not.
         self.parsed = False
 
-        # Keep track of current cluster and quote.
+        # Keep track of current cluster and quote (and its urls), and of
+        # progress.
         self._cluster = None
         self._quote = None
+        self._url_buffer = None
+        self._bar = None
+        self._raw_file = None
 
     def parse(self):
         """Parse the whole MemeTracker file, save, optimise the database, and
@@ -421,17 +1612,35 @@ class MemeTrackerParser(Parser):
         Parse the MemeTracker file with :meth:`_parse` to create
         :class:`~.db.Cluster` and :class:`~.db.Quote` database entries
         corresponding to the dataset. The parsed data is then persisted to
-        database in one step (with :func:`~.db.save_by_copy`). The database is
-        then VACUUMed and ANALYZEd (with :func:`~.utils.execute_raw`) to force
-        it to recompute its optimisations. Finally, the consistency of the
-        database is checked (with :meth:`_check`) against number of quotes and
-        frequency in each cluster of the original file, and against number of
-        urls and frequency in each quote of the original file. Progress is
-        printed to stdout.
+        database in one step (with :func:`~.db.save_by_copy`, in binary
+        format), or in several batches during the parsing if
+        `self.flush_clusters` or `self.flush_megabytes` are set (see
+        :meth:`_flush`). The database is then VACUUMed and ANALYZEd (with
+        :func:`~.utils.execute_raw`) to force it to recompute its
+        optimisations. Finally, the consistency of the database is checked
+        (with :meth:`_check`) against number of quotes and frequency in each
+        cluster of the original file, and against number of urls and
+        frequency in each quote of the original file. Progress is printed to
+        stdout.
 
         Note that if `self.limit` is not `None`, parsing will stop after
         `self.limit` clusters have been read.
 
+        Consistency checking is the same whether the parsed data is saved in
+        one step or in batches, since `self._checks` is kept for the whole
+        file in both cases. If `self.jobs` is more than 1, the parsing and
+        saving is done by :meth:`_parse_parallel` instead.
+
+        If `self.resume` is `True`, the parsing starts from the last
+        :class:`~.db.LoadCheckpoint` of the file (see
+        :meth:`_load_checkpoint`); otherwise any checkpoints left over from a
+        previous parsing of the file are deleted. Checkpoints are deleted once
+        the database has been checked.
+
+        If `self.append` is `True`, the parsed clusters are added to those
+        already in the database as a new dump, with shifted ids (see
+        :meth:`_setup_ids`).
+
         Once the parsing is finished, `self.parsed` is set to `True`.
 
         Raises
@@ -444,6 +1653,15 @@ class MemeTrackerParser(Parser):
         logger.info('Parsing memetracker file')
         if self.limit is not None:
             logger.info('Parsing is limited to %s clusters', self.limit)
+        if self.flush_clusters is not None:
+            logger.info('Saving to database every %s clusters',
+                        self.flush_clusters)
+        if self.flush_megabytes is not None:
+            logger.info('Saving to database every %s megabytes',
+                        self.flush_megabytes)
+        if self.jobs > 1:
+            logger.info('Parsing with %s jobs', self.jobs)
+        logger.info("Reading file with the '%s' engine", self.engine)
 
         click.echo('Parsing MemeTracker data file into database{}...'
                    .format('' if self.limit is None
@@ -452,173 +1670,652 @@ class MemeTrackerParser(Parser):
         if self.parsed:
             raise ValueError('Parser has already run')
 
-        # +100 is some margin for ProgressBar, otherwise it raises an exception
-        # at the *end* of parsing (once the internal count exceeds max_value).
-        lines_left = self.line_count - self.header_size + 100
-        with open(self.filename, 'rb', encoding='utf8') as self._file, \
-                ProgressBar(max_value=lines_left,
-                            redirect_stdout=True) as self._bar:
-            self._parse()
+        if not self.resume and self.store is None:
+            self._drop_checkpoints()
+        checkpoint = self._load_checkpoint() if self.resume else None
+        self._setup_ids(checkpoint)
 
-        click.secho('OK', fg='green', bold=True)
-        logger.info('Parsed %s clusters and %s quotes from memetracker file',
-                    len(self._objects['clusters']),
-                    len(self._objects['quotes']))
-
-        # Save.
-        logger.info('Saving parsed clusters to database')
-        save_by_copy(**self._objects)
-        self._objects = {'clusters': [], 'quotes': []}
+        if self.jobs > 1:
+            self._parse_parallel()
+        else:
+            start = 0 if checkpoint is None else checkpoint['offset']
+            size = os.path.getsize(self.filename)
+            with open(self.filename, 'rb') as self._raw_file, \
+                    ProgressBar(max_value=size,
+                                redirect_stdout=True) as self._bar:
+                if self.compression is None:
+                    file = self._raw_file
+                else:
+                    logger.info("Decompressing '%s' file on the fly",
+                                self.compression)
+                    file = self.decompressors[self.compression](
+                        self._raw_file)
+                with self.engines[self.engine](file, start) as self._file:
+                    self._parse(skip_header=(start == 0),
+                                checkpoint=checkpoint)
+            self._bar = None
+            self._raw_file = None
+
+            click.secho('OK', fg='green', bold=True)
+            logger.info('Parsed %s clusters and %s quotes from memetracker '
+                        'file', self._clusters_read, self._quotes_read)
+
+            # Save what hasn't been flushed yet.
+            logger.info('Saving parsed clusters to database')
+            self._flush(echo=True)
 
         # Vacuum analyze.
-        logger.info('Vacuuming and analyzing database')
-        click.echo('Vacuuming and analyzing... ', nl=False)
-        execute_raw(Session.kw['bind'], 'VACUUM ANALYZE')
-        click.secho('OK', fg='green', bold=True)
+        if self.store is None:
+            logger.info('Vacuuming and analyzing database')
+            click.echo('Vacuuming and analyzing... ', nl=False)
+            execute_raw(Session.kw['bind'], 'VACUUM ANALYZE')
+            click.secho('OK', fg='green', bold=True)
 
         # And check.
         logger.info('Checking consistency of the file against the database')
-        click.echo('Checking consistency...')
+        click.echo('Checking consistency... ', nl=False)
         self._check()
+        click.secho('OK', fg='green', bold=True)
+        if self.store is None:
+            self._drop_checkpoints()
 
         # Don't do this twice.
         self.parsed = True
         click.secho('All done.', fg='green', bold=True)
 
-    def _parse(self):
+    def _setup_ids(self, checkpoint=None):
+        """Set the dump number and id offsets for the parsed clusters and
+        quotes.
+
+        If resuming from `checkpoint`, the values saved in the checkpoint are
+        used. Otherwise, if `self.append` is `True`, the dump number is one
+        more than the largest in the database, and id offsets are one more
+        than the largest ids of unfiltered clusters and quotes in the
+        database (or in `self.store`). If not, ids are not shifted and the
+        dump number is 0.
+
+        Parameters
+        ----------
+        checkpoint : dict, optional
+            Checkpoint to resume from, as returned by :meth:`_load_checkpoint`.
+
+        """
+
+        if checkpoint is not None:
+            self.dump = checkpoint['dump']
+            self.cluster_id_offset = checkpoint['cluster_id_offset']
+            self.quote_id_offset = checkpoint['quote_id_offset']
+        elif self.append:
+            if self.store is not None:
+                max_dump = self.store.max('clusters', 'dump')
+                max_cluster_id = self.store.max('clusters', 'id',
+                                                filtered=False)
+                max_quote_id = self.store.max('quotes', 'id', filtered=False)
+            else:
+                with session_scope() as session:
+                    max_dump = session.query(func.max(Cluster.dump)).scalar()
+                    max_cluster_id = session.query(func.max(Cluster.id))\
+                        .filter(Cluster.filtered.is_(False)).scalar()
+                    max_quote_id = session.query(func.max(Quote.id))\
+                        .filter(Quote.filtered.is_(False)).scalar()
+            self.dump = 0 if max_dump is None else max_dump + 1
+            self.cluster_id_offset = (0 if max_cluster_id is None
+                                      else max_cluster_id + 1)
+            self.quote_id_offset = (0 if max_quote_id is None
+                                    else max_quote_id + 1)
+
+        if self.dump > 0:
+            logger.info('Loading memetracker file as dump #%s (cluster ids '
+                        'shifted by %s, quote ids by %s)', self.dump,
+                        self.cluster_id_offset, self.quote_id_offset)
+            click.echo('Appending file to database as dump #{}'
+                       .format(self.dump))
+
+    def _parse_parallel(self):
+        """Parse the MemeTracker file with `self.jobs` worker processes, and
+        save the parsed data to the database.
+
+        The file is split into blocks of whole clusters by
+        :meth:`_cluster_ranges`, and each block is parsed by
+        :func:`_parse_range` in a worker process, which returns rows encoded
+        for the binary COPY command. Blocks are saved to the database (with
+        :func:`~.db.save_rows_by_copy`) in file order as soon as they are
+        available, so the database ends up the same as with a serial parsing.
+        Counts for later checking are merged into `self._checks`.
+
+        """
+
+        ranges = self._cluster_ranges(self.jobs * self.blocks_per_job)
+        logger.info('Split memetracker file into %s blocks', len(ranges))
+
+        self._clusters_read = 0
+        self._quotes_read = 0
+        self._lines_read = 0
+        self._checks = {}
+        # Workers don't touch the database, but need this to encode quotes.
+        with session_scope() as session:
+            self._url_type_oid = _url_type_oid(session)
+        with Pool(self.jobs) as pool, \
+                ProgressBar(max_value=len(ranges),
+                            redirect_stdout=True) as bar:
+            results = pool.imap(_parse_range,
+                                [(self, start, end) for start, end in ranges])
+            for i, (cluster_rows, quote_rows, checks, lines_read) \
+                    in enumerate(results):
+                save_rows_by_copy(cluster_rows, quote_rows, echo=False,
+                                  binary=True)
+                self._clusters_read += len(cluster_rows)
+                self._quotes_read += len(quote_rows)
+                self._lines_read += lines_read
+                self._checks.update(checks)
+                bar.update(i + 1)
+
+        click.secho('OK', fg='green', bold=True)
+        logger.info('Parsed and saved %s clusters and %s quotes from '
+                    'memetracker file', self._clusters_read,
+                    self._quotes_read)
+
+    def _cluster_ranges(self, count):
+        """Split the MemeTracker file into (at most) `count` blocks of whole
+        clusters.
+
+        Block boundaries are first placed evenly in the file (after the
+        header), then each one is moved forward to the beginning of the next
+        cluster line. Blocks that end up empty are dropped.
+
+        Parameters
+        ----------
+        count : int
+            Number of blocks to split the file into.
+
+        Returns
+        -------
+        list of tuples
+            List of `(start, end)` byte offsets for each block; the line at
+            `start` is always a cluster line.
+
+        """
+
+        with open(self.filename, 'rb') as file:
+            for i in range(self.header_size):
+                file.readline()
+            data_start = file.tell()
+            size = os.fstat(file.fileno()).st_size
+
+            bounds = [data_start]
+            for i in range(1, count):
+                target = data_start + (size - data_start) * i // count
+                if target <= bounds[-1]:
+                    continue
+
+                # Skip the (probably partial) line we landed in, then look for
+                # the next cluster line.
+                file.seek(target)
+                file.readline()
+                while True:
+                    offset = file.tell()
+                    line = file.readline()
+                    if not line:
+                        break
+                    tipe, _ = self._parse_line(line.decode('utf8'))
+                    if tipe == 'cluster':
+                        break
+
+                if bounds[-1] < offset < size:
+                    bounds.append(offset)
+
+            bounds.append(size)
+
+        return [(start, end) for start, end in zip(bounds[:-1], bounds[1:])
+                if start < end]
+
+    def _parse(self, skip_header=True, checkpoint=None):
         """Do the actual MemeTracker file parsing.
 
         Initialises the parsing tracking variables, then delegates each new
         cluster block to :meth:`_parse_cluster_block`. Parsed clusters and
         quotes are stored as :class:`~.db.Cluster`\ s and
         :class:`~.db.Quote`\ s in `self._objects` (to be saved later in
-        :meth:`parse`). Frequency and url counts for clusters and quotes are
-        saved in `self._checks` for later checking in :meth:`parse`.
+        :meth:`parse`, or earlier by :meth:`_flush`). Frequency and url counts
+        for clusters and quotes are saved in `self._checks` for later checking
+        in :meth:`parse`.
+
+        Parameters
+        ----------
+        skip_header : bool, optional
+            If `False`, don't skip the file header before parsing; use this
+            when `self._file` starts directly on a cluster line (as in
+            :func:`_parse_range`). Defaults to `True`.
+        checkpoint : dict, optional
+            If not `None` (default), counters and checks to resume the parsing
+            with, as returned by :meth:`_load_checkpoint` (`self._file` should
+            then start at the checkpoint's offset).
 
         """
 
         # The first lines are not data.
-        self._skip_header()
+        if skip_header:
+            self._skip_header()
 
         # Initialize the parsing with the first line.
-        self._cluster_line = self._file.readline()
+        self._flushed_offset = self._file.offset
+        self._cluster_offset = self._file.offset
+        self._cluster_record = self._read_record()
         self._clusters_read = 0
-        self._lines_read = 1
-        self._bar.update(self._lines_read)
+        self._quotes_read = 0
+        self._lines_read = 0 if self._cluster_record is None else 1
 
         # Results to be saved and checks to be done.
         self._objects = {'clusters': [], 'quotes': []}
         self._checks = {}
 
-        while self._cluster_line is not None:
-            logger.debug("Parsing new cluster ('%s')", self._cluster_line[:-1])
+        if checkpoint is not None:
+            self._clusters_read = checkpoint['clusters_read']
+            self._quotes_read = checkpoint['quotes_read']
+            self._lines_read += checkpoint['lines_read']
+            self._checks = checkpoint['checks']
+        self._update_progress()
+
+        while self._cluster_record is not None:
+            logger.debug('Parsing new cluster (line %s)',
+                         self._lines_read + self.header_size)
             self._parse_cluster_block()
 
+    def _read_record(self):
+        """Read and classify the next line of `self._file`.
+
+        Returns
+        -------
+        record : tuple or None
+            `(tipe, fields)` tuple as returned by :meth:`_parse_line` (or by
+            :meth:`MmapRangeFile.read_record` if `self.engine` is `'mmap'`);
+            `None` if the end of the file (or range) was reached.
+
+        """
+
+        if self.engine == 'mmap':
+            return self._file.read_record()
+
+        line = self._file.readline()
+        if not line:
+            return None
+        return self._parse_line(line)
+
+    def _update_progress(self):
+        """Show parsing progress on `self._bar`, if there is one, as the
+        number of bytes read from `self.filename`.
+
+        For compressed files, that is the position in the compressed file
+        (`self._raw_file`), which the decompressor reads ahead of the lines
+        parsed, by up to one chunk.
+
+        """
+
+        if self._bar is None:
+            return
+        if self.compression is None:
+            self._bar.update(self._file.offset)
+        else:
+            self._bar.update(self._raw_file.tell())
+
     def _check(self):
         """Check the consistency of the database with `self._checks`.
 
         The original MemeTracker dataset specifies the number of quotes and
         frequency for each cluster, and the number of urls and frequency for
         each quote. This information is saved in `self._checks` during parsing.
-        This method iterates through the whole database of saved
-        :class:`~.db.Cluster`\ s and :class:`~.db.Quote`\ s to check that their
-        counts correspond to what the MemeTracker dataset says (as stored in
-        `self._checks`).
+        This method copies it into temporary tables (with
+        :func:`~.db._copy`), and compares it in bulk with the counts of the
+        saved :class:`~.db.Cluster`\ s and :class:`~.db.Quote`\ s in a single
+        query (:attr:`_check_query`), which is much faster than loading each
+        cluster and quote from the database. When parsing into `self.store`,
+        counts are compared with the columns of the store instead (see
+        :meth:`_store_mismatches`).
 
         Raises
         ------
         ValueError
             If any count in the database differs from its specification in
-            `self._checks`.
+            `self._checks`, or if a quote is missing from either. The error
+            message lists all the differences found.
 
         """
 
-        for id, check in ProgressBar()(self._checks.items()):
-            logger.debug('Checking cluster #%s consistency', id)
+        logger.debug('Checking consistency of %s clusters',
+                     len(self._checks))
+        if self.store is not None:
+            mismatches = self._store_mismatches()
+        else:
+            mismatches = self._database_mismatches()
+
+        if len(mismatches) > 0:
+            errors = []
+            for kind, sid, field, expected, actual in mismatches:
+                if expected is None:
+                    errors.append('{} #{} is not in file'.format(kind, sid))
+                elif actual is None:
+                    errors.append('{} #{} is not in database'
+                                  .format(kind, sid))
+                else:
+                    errors.append('{} {} #{} does not match value in file '
+                                  '(file: {}, database: {})'
+                                  .format(kind, field, sid, expected, actual))
+            raise ValueError('{} inconsistencies between file and database:\n'
+                             .format(len(errors)) + '\n'.join(errors))
+
+        self._checks = {}
+
+    def _database_mismatches(self):
+        """Compare `self._checks` with the counts of the database, for
+        :meth:`_check`.
+
+        Returns
+        -------
+        mismatches : list of tuples
+            `(kind, sid, field, expected, actual)` tuple for each difference,
+            as returned by :attr:`_check_query`.
+
+        """
+
+        cluster_rows = StringIO()
+        quote_rows = StringIO()
+        for id, check in self._checks.items():
+            cluster_rows.write('{}\t{}\t{}\n'.format(
+                id, check['cluster']['size'], check['cluster']['frequency']))
+            for quote_id, quote_check in check['quotes'].items():
+                quote_rows.write('{}\t{}\t{}\t{}\n'.format(
+                    quote_id, id, quote_check['size'],
+                    quote_check['frequency']))
+
+        with session_scope() as session:
+            for table, (columns, rows) in zip(
+                    ['check_cluster', 'check_quote'],
+                    [(('id', 'size', 'frequency'), cluster_rows),
+                     (('id', 'cluster_id', 'size', 'frequency'), quote_rows)]):
+                definition = ', '.join(column + ' integer'
+                                       for column in columns)
+                session.execute('CREATE TEMPORARY TABLE {} ({}) '
+                                'ON COMMIT DROP'.format(table, definition))
+                _copy(rows, table, columns, session=session)
+            mismatches = session.execute(self._check_query).fetchall()
+        cluster_rows.close()
+        quote_rows.close()
+        return mismatches
+
+    def _store_mismatches(self):
+        """Compare `self._checks` with the counts of `self.store`, for
+        :meth:`_check`.
+
+        This gives the same results as :meth:`_database_mismatches`, using
+        :meth:`~.columnar.ColumnarStore.quote_counts` instead of
+        :attr:`_check_query`.
+
+        Returns
+        -------
+        mismatches : list of tuples
+            `(kind, sid, field, expected, actual)` tuple for each difference.
+
+        """
+
+        cluster_sids = {}
+        for columns in self.store.scan('clusters', 'id', 'sid'):
+            for id, sid in zip(columns['id'].tolist(),
+                               columns['sid'].tolist()):
+                if id in self._checks:
+                    cluster_sids[id] = sid
+
+        # Counts of the stored quotes in the checked clusters, and of the
+        # clusters they belong to.
+        quote_counts = {}
+        cluster_counts = {id: {'size': 0, 'frequency': 0}
+                          for id in self._checks}
+        for counts in self.store.quote_counts():
+            for id, cluster_id, sid, size, frequency in zip(
+                    counts['id'].tolist(), counts['cluster_id'].tolist(),
+                    counts['sid'].tolist(), counts['size'].tolist(),
+                    counts['frequency'].tolist()):
+                if cluster_id in self._checks:
+                    quote_counts[id] = {'sid': sid, 'size': size,
+                                        'frequency': frequency}
+                    cluster_counts[cluster_id]['size'] += 1
+                    cluster_counts[cluster_id]['frequency'] += frequency
+
+        mismatches = []
+        check_quotes = {}
+        for id, check in self._checks.items():
+            check_quotes.update(check['quotes'])
+            for field in ['size', 'frequency']:
+                expected = check['cluster'][field]
+                actual = cluster_counts[id][field]
+                if expected != actual:
+                    mismatches.append(('Cluster', cluster_sids.get(id, id),
+                                       field, expected, actual))
+
+        for id in set(check_quotes) | set(quote_counts):
+            expected = check_quotes.get(id)
+            actual = quote_counts.get(id)
+            if actual is None or expected is None:
+                mismatches.append(
+                    ('Quote', id if actual is None else actual['sid'], 'size',
+                     None if expected is None else expected['size'],
+                     None if actual is None else actual['size']))
+                continue
+            for field in ['size', 'frequency']:
+                if expected[field] != actual[field]:
+                    mismatches.append(('Quote', actual['sid'], field,
+                                       expected[field], actual[field]))
+
+        return sorted(mismatches, key=lambda mismatch: mismatch[:3])
+
+    def _should_flush(self):
+        """Test if the clusters and quotes parsed since the last flush should
+        now be saved to the database, according to `self.flush_clusters` and
+        `self.flush_megabytes`."""
+
+        if (self.flush_clusters is not None and
+                len(self._objects['clusters']) >= self.flush_clusters):
+            return True
+        if (self.flush_megabytes is not None and
+                self._file.offset - self._flushed_offset >=
+                self.flush_megabytes * 2 ** 20):
+            return True
+        return False
+
+    def _flush(self, echo=False):
+        """Save the clusters and quotes parsed since the last flush to the
+        database, and forget about them.
+
+        This lets the parser run in constant memory (apart from
+        `self._checks`, which is much smaller than the parsed data) when
+        `self.flush_clusters` or `self.flush_megabytes` are set. In that case,
+        a :class:`~.db.LoadCheckpoint` is also saved (with
+        :meth:`_save_checkpoint`) in the same transaction as the data.
+
+        Parameters
+        ----------
+        echo : bool, optional
+            If `True`, print saving progress to stdout; defaults to `False`.
+
+        """
 
+        logger.debug('Flushing %s clusters and %s quotes to database',
+                     len(self._objects['clusters']),
+                     len(self._objects['quotes']))
+        if self.store is not None:
+            self.store.save(**self._objects)
+        else:
             with session_scope() as session:
-                # Check the cluster itself.
-                cluster = session.query(Cluster).get(id)
-                err_end = (' #{} does not match value'
-                           ' in file').format(cluster.sid)
-                if check['cluster']['size'] != cluster.size:
-                    raise ValueError("Cluster size" + err_end)
-                if check['cluster']['frequency'] != cluster.frequency:
-                    raise ValueError("Cluster frequency" + err_end)
-
-                # Check each quote.
-                for quote in cluster.quotes:
-                    quote_check = check['quotes'][quote.id]
-                    err_end = (' #{} does not match value'
-                               ' in file').format(quote.sid)
-                    if quote_check['size'] != quote.size:
-                        raise ValueError("Quote size" + err_end)
-                    if quote_check['frequency'] != quote.frequency:
-                        raise ValueError("Quote frequency" + err_end)
+                save_by_copy(echo=echo, session=session, binary=True,
+                             **self._objects)
+                if self._checkpointing:
+                    self._save_checkpoint(session)
+        self._objects = {'clusters': [], 'quotes': []}
+        self._flushed_offset = self._file.offset
 
-        self._checks = {}
+    def _save_checkpoint(self, session):
+        """Add a :class:`~.db.LoadCheckpoint` for the clusters in
+        `self._objects` to `session`.
+
+        The checkpoint records the offset of the first cluster not in
+        `self._objects` (`self._cluster_offset`), the parsing counters up to
+        that cluster, and the checks for the clusters in `self._objects`.
+
+        """
+
+        checks = {cluster.id: self._checks[cluster.id]
+                  for cluster in self._objects['clusters']}
+        # The line of the next cluster, if already read, is read again when
+        # resuming.
+        lines_read = self._lines_read - (self._cluster_record is not None)
+        logger.debug('Saving checkpoint at byte %s', self._cluster_offset)
+        session.add(LoadCheckpoint(filename=self._checkpoint_filename,
+                                   offset=self._cluster_offset,
+                                   clusters_read=self._clusters_read,
+                                   quotes_read=self._quotes_read,
+                                   lines_read=lines_read, dump=self.dump,
+                                   cluster_id_offset=self.cluster_id_offset,
+                                   quote_id_offset=self.quote_id_offset,
+                                   checks=checks))
+
+    def _load_checkpoint(self):
+        """Load the :class:`~.db.LoadCheckpoint`\ s saved for
+        `self.filename`, to resume an interrupted parsing.
+
+        Returns
+        -------
+        checkpoint : dict or None
+            Offset (`'offset'`) from which to resume the parsing, counters
+            (`'clusters_read'`, `'quotes_read'` and `'lines_read'`) at that
+            offset, dump number and id offsets of the parsing (`'dump'`,
+            `'cluster_id_offset'` and `'quote_id_offset'`), and checks
+            (`'checks'`) for all the clusters already saved; `None` if there
+            is no checkpoint for the file.
+
+        """
+
+        with session_scope() as session:
+            checkpoints = session.query(LoadCheckpoint)\
+                .filter_by(filename=self._checkpoint_filename)\
+                .order_by(LoadCheckpoint.id).all()
+            if len(checkpoints) == 0:
+                logger.info('No checkpoint to resume from, parsing from '
+                            'the start')
+                return None
+
+            checks = {}
+            for checkpoint in checkpoints:
+                checks.update(self._decode_checks(checkpoint.checks))
+            last = checkpoints[-1]
+            logger.info('Resuming parsing from byte %s, after %s clusters',
+                        last.offset, last.clusters_read)
+            click.echo('Resuming after {} clusters already saved'
+                       .format(last.clusters_read))
+            return {'offset': last.offset,
+                    'clusters_read': last.clusters_read,
+                    'quotes_read': last.quotes_read,
+                    'lines_read': last.lines_read,
+                    'dump': last.dump,
+                    'cluster_id_offset': last.cluster_id_offset,
+                    'quote_id_offset': last.quote_id_offset,
+                    'checks': checks}
+
+    @classmethod
+    def _decode_checks(cls, checks):
+        """Restore the integer ids in `checks` loaded from JSON (where they
+        were turned into strings)."""
+
+        return {int(id): {'cluster': check['cluster'],
+                          'quotes': {int(quote_id): quote_check
+                                     for quote_id, quote_check
+                                     in check['quotes'].items()}}
+                for id, check in checks.items()}
+
+    def _drop_checkpoints(self):
+        """Delete all :class:`~.db.LoadCheckpoint`\ s saved for
+        `self.filename`."""
+
+        with session_scope() as session:
+            count = session.query(LoadCheckpoint)\
+                .filter_by(filename=self._checkpoint_filename).delete()
+        if count > 0:
+            logger.info('Deleted %s checkpoints', count)
 
     def _parse_cluster_block(self):
         """Parse a block of lines representing a cluster in the source
         MemeTracker file.
 
         The :class:`~.db.Cluster` itself is first created from
-        `self._cluster_line` with :meth:`_handle_cluster`, then each following
-        line is delegated to :meth:`_handle_quote` or :meth:`_handle_url` until
-        exhaustion of this cluster block. During the parsing of this cluster,
-        `self._cluster` holds the current cluster being filled and
-        `self._quote` the current quote (both are cleaned up when the method
-        finishes). At the end of this block, the method increments
-        `self._clusters_read` and sets `self._cluster_line` to the line
-        defining the next cluster, or `None` if the end of file or `self.limit`
-        was reached.
+        `self._cluster_record` with :meth:`_handle_cluster`, then each
+        following line is delegated to :meth:`_handle_quote` or
+        :meth:`_handle_url` until exhaustion of this cluster block. During the
+        parsing of this cluster, `self._cluster` holds the current cluster
+        being filled and `self._quote` the current quote (both are cleaned up
+        when the method finishes). Urls are accumulated in
+        `self._url_buffer`, and added to their quote by :meth:`_end_quote`. At
+        the end of this block, the method increments `self._clusters_read` and
+        sets `self._cluster_record` to the parsed line defining the next
+        cluster, or `None` if the end of file or `self.limit` was reached.
+        Finally, the parsed data is flushed to the database with
+        :meth:`_flush` if :meth:`_should_flush` says so.
 
         Raises
         ------
         ValueError
-            If `self._cluster_line` is not a line defining a new cluster.
+            If `self._cluster_record` is not a line defining a new cluster.
 
         """
 
-        # Check we have a cluster line and parse it.
-        tipe, fields = self._parse_line(self._cluster_line)
-        # If self._cluster_line stays None, _parse() stops.
+        # Check we have a cluster line.
+        tipe, fields = self._cluster_record
+        # If self._cluster_record stays None, _parse() stops.
         # So it's filled further down when we get to the next cluster
         # definition line (unless self.limit says we should read
         # only a subset of all clusters).
-        self._cluster_line = None
+        self._cluster_record = None
         if tipe != 'cluster':
-            raise ValueError("Our supposed cluster_line ('{}', line {}) "
+            raise ValueError("Our supposed cluster line (line {}) "
                              "is not a cluster line!"
-                             .format(self._cluster_line,
-                                     self._lines_read + self.header_size))
+                             .format(self._lines_read + self.header_size))
 
         # Create the cluster.
         self._handle_cluster(fields)
 
-        # Keep reading until the next cluster, or exhaustion.
-        for line in self._file:
+        # Keep reading until the next cluster, or exhaustion (in which case
+        # there is no next cluster).
+        next_record = None
+        while True:
+            offset = self._file.offset
+            record = self._read_record()
+            if record is None:
+                break
             self._lines_read += 1
-            self._bar.update(self._lines_read)
+            self._update_progress()
 
-            tipe, fields = self._parse_line(line)
+            tipe, fields = record
             if tipe == 'cluster':
+                next_record = record
                 break
             elif tipe == 'quote':
                 self._handle_quote(fields)
             elif tipe == 'url':
                 self._handle_url(fields)
 
-        # If we just saw a new cluster, feed that new cluster_line
+        # If we just saw a new cluster, feed that new cluster record
         # for the next cluster, unless asked to stop.
+        # Offset of the next cluster, or of the end of the file.
+        self._cluster_offset = offset
         self._clusters_read += 1
-        if (tipe == 'cluster' and
+        if (next_record is not None and
                 (self.limit is None or self._clusters_read < self.limit)):
-            self._cluster_line = line
+            self._cluster_record = next_record
 
         # Clean up.
+        self._end_quote()
         self._cluster = None
-        self._quote = None
+
+        # Save what we have if it's time to.
+        if self._should_flush():
+            self._flush()
 
     @classmethod
     def _parse_line(self, line):
@@ -652,7 +2349,8 @@ class MemeTrackerParser(Parser):
         return tipe, re.split(r'[\t\r\n]', line)
 
     def _handle_cluster(self, fields):
-        """Handle a list of cluster fields to create a new :class:`~.db.Cluster`.
+        """Handle a list of cluster fields to create a new
+        :class:`~.db.Cluster`.
 
         The newly created :class:`~.db.Cluster` is appended to
         `self._objects['clusters']`, and corresponding fields are created in
@@ -662,13 +2360,14 @@ class MemeTrackerParser(Parser):
         ----------
         fields : list of str
             List of fields defining the new cluster, as returned by
-            :meth:`_parse_line`.
+            :meth:`_parse_line` (or by :meth:`MmapRangeFile.read_record`).
 
         """
 
-        id = int(fields[3])
-        self._cluster = Cluster(id=id, sid=id, filtered=False,
-                                source='memetracker')
+        sid = int(fields[3])
+        self._cluster = Cluster(id=self.cluster_id_offset + sid, sid=sid,
+                                filtered=False, source='memetracker',
+                                dump=self.dump)
         self._objects['clusters'].append(self._cluster)
 
         # Save checks for later on.
@@ -685,22 +2384,27 @@ class MemeTrackerParser(Parser):
     def _handle_quote(self, fields):
         """Handle a list of quote fields to create a new :class:`~.db.Quote`.
 
-        The newly created :class:`~.db.Quote` is appended to
-        `self._objects['quotes']`, and corresponding fields are created in
-        `self._checks`.
+        The previous quote is finished with :meth:`_end_quote`. The newly
+        created :class:`~.db.Quote` is appended to `self._objects['quotes']`,
+        and corresponding fields are created in `self._checks`.
 
         Parameters
         ----------
         fields : list of str
             List of fields defining the new quote, as returned by
-            :meth:`_parse_line`.
+            :meth:`_parse_line` (or by :meth:`MmapRangeFile.read_record`).
 
         """
 
-        id = int(fields[4])
-        self._quote = Quote(cluster_id=self._cluster.id, id=id, sid=id,
+        self._end_quote()
+
+        sid = int(fields[4])
+        self._url_buffer = UrlBuffer()
+        self._quote = Quote(cluster_id=self._cluster.id,
+                            id=self.quote_id_offset + sid, sid=sid,
                             filtered=False, string=fields[3])
         self._objects['quotes'].append(self._quote)
+        self._quotes_read += 1
 
         # Save checks for later on.
         quote_size = int(fields[2])
@@ -710,23 +2414,81 @@ class MemeTrackerParser(Parser):
             'frequency': quote_frequency
         }
 
+    def _end_quote(self):
+        """Add the urls accumulated in `self._url_buffer` to the currently
+        parsed quote, `self._quote`, and forget about that quote."""
+
+        if self._quote is not None:
+            self._quote.add_urls(self._url_buffer)
+        self._quote = None
+        self._url_buffer = None
+
     def _handle_url(self, fields):
-        """Handle a list of url fields to create a new :class:`~.db.Url`.
+        """Handle a list of url fields to add a new url to the current quote.
 
-        The newly created :class:`~.db.Url` is stored on `self._quote` which
-        holds the currently parsed quote.
+        The url fields are accumulated in `self._url_buffer` (without creating
+        a :class:`~.db.Url`), and later added to `self._quote`, which holds the
+        currently parsed quote, by :meth:`_end_quote`.
 
         Parameters
         ----------
         fields : list of str
             List of fields defining the new url, as returned by
-            :meth:`_parse_line`.
+            :meth:`_parse_line` (or by :meth:`MmapRangeFile.read_record`).
 
         """
 
-        timestamp = datetime.strptime(fields[2], '%Y-%m-%d %H:%M:%S')
+        timestamp = self._decode_timestamp(fields[2])
         assert timestamp.tzinfo is None
 
-        url = Url(timestamp=timestamp, frequency=int(fields[3]),
-                  url_type=fields[4], url=fields[5])
-        self._quote.add_url(url)
+        self._url_buffer.append(timestamp, int(fields[3]), fields[4],
+                                fields[5])
+
+
+def _parse_range(args):
+    """Parse a block of clusters from a MemeTracker file into rows ready for
+    the binary COPY command.
+
+    This is run in worker processes by
+    :meth:`MemeTrackerParser._parse_parallel`, and doesn't touch the database:
+    the worker's copy of the parser never flushes or saves checkpoints, even
+    if `flush_clusters` or `flush_megabytes` are set.
+
+    Parameters
+    ----------
+    args : tuple
+        `(parser, start, end)` tuple, where `parser` is the
+        :class:`MemeTrackerParser` running the parsing (a copy of which does
+        the work in the worker process, with the same options, dump number
+        and id offsets), and `start` and `end` are the byte offsets of the
+        block to parse (as returned by
+        :meth:`MemeTrackerParser._cluster_ranges`).
+
+    Returns
+    -------
+    cluster_rows : list of bytes
+        Parsed clusters, encoded by :meth:`~.db.Cluster.format_copy_binary`.
+    quote_rows : list of bytes
+        Parsed quotes, encoded by :meth:`~.db.Quote.format_copy_binary`.
+    checks : dict
+        Counts to check the database against, in the format of
+        `MemeTrackerParser._checks`.
+    lines_read : int
+        Number of lines read in the block.
+
+    """
+
+    parser, start, end = args
+    # Keep everything in memory for the parent process to save.
+    parser.flush_clusters = None
+    parser.flush_megabytes = None
+    parser._checkpointing = False
+    with open(parser.filename, 'rb') as file, \
+            parser.engines[parser.engine](file, start, end) as parser._file:
+        parser._parse(skip_header=False)
+
+    return ([cluster.format_copy_binary()
+             for cluster in parser._objects['clusters']],
+            [quote.format_copy_binary(parser._url_type_oid)
+             for quote in parser._objects['quotes']],
+            parser._checks, parser._lines_read)
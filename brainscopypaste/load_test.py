@@ -5,17 +5,25 @@
 
 import os
 from tempfile import mkstemp
-from datetime import timedelta
-import pickle
+from collections import Counter
+import gzip
+import bz2
+import lzma
+from datetime import datetime, timedelta
 
 import pytest
 
 from brainscopypaste.utils import session_scope
-from brainscopypaste.db import Cluster, Quote
-from brainscopypaste.load import (MemeTrackerParser, FAFeatureLoader,
-                                  load_fa_features,
-                                  load_mt_frequency_and_tokens)
+from brainscopypaste.db import Cluster, Quote, LoadCheckpoint, _url_type_oid
+from brainscopypaste.load import (MemeTrackerParser, MmapRangeFile,
+                                  FAFeatureLoader, load_fa_features,
+                                  decode_timestamp, MT_TIMESTAMP_FORMAT,
+                                  load_mt_frequency_and_tokens,
+                                  compute_features, load_quote_tags,
+                                  _mt_digest, _filtered_quotes_digest,
+                                  _parse_range, _count_batch)
 from brainscopypaste.filter import filter_clusters
+from brainscopypaste.featurestore import FeatureStore
 from brainscopypaste.conf import settings
 
 
@@ -127,8 +135,20 @@ def memetracker_file():
     with open(fd, 'w') as tmp:
         tmp.write(content)
 
-    line_count = content.count('\n') + 1
-    yield filepath, line_count
+    yield filepath
+    os.remove(filepath)
+
+
+@pytest.yield_fixture(params=[('.gz', gzip.open), ('.bz2', bz2.open),
+                              ('.xz', lzma.open)])
+def memetracker_file_compressed(request):
+    extension, compressed_open = request.param
+    fd, filepath = mkstemp(suffix=extension)
+    os.close(fd)
+    with compressed_open(filepath, 'wt') as tmp:
+        tmp.write(content)
+
+    yield filepath
     os.remove(filepath)
 
 
@@ -138,14 +158,27 @@ def memetracker_file_errored(request):
     with open(fd, 'w') as tmp:
         tmp.write(contents_errored[request.param])
 
-    line_count = contents_errored[request.param].count('\n') + 1
-    yield request.param, filepath, line_count
+    yield request.param, filepath
     os.remove(filepath)
 
 
-def test_parser(tmpdb, memetracker_file):
-    filepath, line_count = memetracker_file
-    MemeTrackerParser(filepath, line_count=line_count).parse()
+@pytest.mark.parametrize('kwargs', [{},
+                                    {'flush_clusters': 1},
+                                    {'flush_megabytes': 1e-4},
+                                    {'flush_clusters': 5,
+                                     'flush_megabytes': 1},
+                                    {'jobs': 2},
+                                    {'jobs': 3},
+                                    {'jobs': 2, 'flush_clusters': 1},
+                                    {'jobs': 2, 'flush_megabytes': 1e-4},
+                                    {'engine': 'mmap'},
+                                    {'engine': 'mmap',
+                                     'flush_megabytes': 1e-4},
+                                    {'engine': 'mmap', 'jobs': 2},
+                                    {'timestamp_decoder': 'strptime'}])
+def test_parser(tmpdb, memetracker_file, kwargs):
+    filepath = memetracker_file
+    MemeTrackerParser(filepath, **kwargs).parse()
 
     with session_scope() as session:
         assert session.query(Cluster).count() == 2
@@ -197,14 +230,372 @@ def test_parser(tmpdb, memetracker_file):
         assert q1.urls[1].url_type == 'M'
         assert q1.urls[1].url == 'some-url-6'
 
+        assert session.query(LoadCheckpoint).count() == 0
+
+
+def test_parse_range_no_flush(tmpdb, memetracker_file, monkeypatch):
+    # Workers keep all their clusters for the parent process to save, even
+    # when the parser flushes.
+    parser = MemeTrackerParser(memetracker_file, flush_clusters=1,
+                               flush_megabytes=1e-4, jobs=2)
+    with session_scope() as session:
+        parser._url_type_oid = _url_type_oid(session)
+
+    def fail(*args, **kwargs):
+        raise AssertionError('Worker tried to flush')
 
-def test_parser_errored(tmpdb, memetracker_file_errored):
-    error, filepath, line_count = memetracker_file_errored
+    monkeypatch.setattr(parser, '_flush', fail)
+    start, end = parser._cluster_ranges(1)[0]
+    cluster_rows, quote_rows, checks, _ = _parse_range((parser, start, end))
+    assert len(cluster_rows) == 2
+    assert len(quote_rows) == 3
+    assert len(checks) > 0
+
+    with session_scope() as session:
+        assert session.query(Cluster).count() == 0
+        assert session.query(LoadCheckpoint).count() == 0
+
+
+@pytest.mark.parametrize('kwargs', [{}, {'flush_clusters': 1}, {'jobs': 2},
+                                    {'engine': 'mmap'}])
+def test_parser_errored(tmpdb, memetracker_file_errored, kwargs):
+    error, filepath = memetracker_file_errored
     with pytest.raises(ValueError) as excinfo:
-        MemeTrackerParser(filepath, line_count=line_count).parse()
+        MemeTrackerParser(filepath, **kwargs).parse()
     assert error in str(excinfo.value)
 
 
+def test_parser_check_all_errors(tmpdb, memetracker_file):
+    filepath = memetracker_file
+    MemeTrackerParser(filepath).parse()
+
+    parser = MemeTrackerParser(filepath)
+    parser._checks = {
+        36543: {'cluster': {'size': 2, 'frequency': 6},
+                'quotes': {950238: {'size': 2, 'frequency': 2},
+                           43: {'size': 3, 'frequency': 3}}},
+        43112: {'cluster': {'size': 2, 'frequency': 3},
+                'quotes': {1485: {'size': 2, 'frequency': 3},
+                           1486: {'size': 1, 'frequency': 1}}},
+    }
+    with pytest.raises(ValueError) as excinfo:
+        parser._check()
+    assert str(excinfo.value).split('\n') == [
+        '4 inconsistencies between file and database:',
+        'Cluster frequency #36543 does not match value in file '
+        '(file: 6, database: 5)',
+        'Cluster size #43112 does not match value in file '
+        '(file: 2, database: 1)',
+        'Quote size #43 does not match value in file (file: 3, database: 2)',
+        'Quote #1486 is not in database',
+    ]
+
+    # Quotes in the database but not in the file are found too.
+    del parser._checks[36543]['quotes'][950238]
+    with pytest.raises(ValueError) as excinfo:
+        parser._check()
+    assert 'Quote #950238 is not in file' in str(excinfo.value)
+
+
+def interrupt_at_cluster(monkeypatch, sid):
+    """Make :class:`~.load.MemeTrackerParser` crash when it reaches the
+    cluster with id `sid`."""
+
+    handle_cluster = MemeTrackerParser._handle_cluster
+
+    def crashing_handle_cluster(self, fields):
+        if int(fields[3]) == sid:
+            raise RuntimeError('Interrupted')
+        handle_cluster(self, fields)
+
+    monkeypatch.setattr(MemeTrackerParser, '_handle_cluster',
+                        crashing_handle_cluster)
+
+
+@pytest.mark.parametrize('kwargs', [{'flush_clusters': 1},
+                                    {'flush_megabytes': 1e-4},
+                                    {'flush_clusters': 1, 'engine': 'mmap'}])
+def test_parser_resume(tmpdb, memetracker_file, monkeypatch, kwargs):
+    filepath = memetracker_file
+
+    # Crash while parsing the second cluster, after saving the first one.
+    interrupt_at_cluster(monkeypatch, 43112)
+    with pytest.raises(RuntimeError):
+        MemeTrackerParser(filepath, **kwargs).parse()
+    monkeypatch.undo()
+    with session_scope() as session:
+        assert session.query(Cluster).count() == 1
+        assert session.query(Quote).count() == 2
+        checkpoint = session.query(LoadCheckpoint).one()
+        assert checkpoint.filename == os.path.abspath(filepath)
+        assert checkpoint.clusters_read == 1
+        assert checkpoint.quotes_read == 2
+        with open(filepath, 'rb') as f:
+            f.seek(checkpoint.offset)
+            assert f.readline().startswith(b'1\t3\tyes we can yes we can')
+
+    # Resume.
+    parser = MemeTrackerParser(filepath, resume=True, **kwargs)
+    parser.parse()
+    assert parser._clusters_read == 2
+    assert parser._quotes_read == 3
+    with session_scope() as session:
+        assert session.query(Cluster).count() == 2
+        assert session.query(Quote).count() == 3
+        assert session.query(LoadCheckpoint).count() == 0
+        q4 = session.query(Quote).filter_by(sid=1485).one()
+        assert q4.cluster.sid == 43112
+        assert q4.size == 2
+        assert q4.frequency == 3
+
+    # Resuming with no checkpoint parses from the start.
+    with session_scope() as session:
+        session.query(Cluster).delete()
+    MemeTrackerParser(filepath, resume=True, **kwargs).parse()
+    with session_scope() as session:
+        assert session.query(Cluster).count() == 2
+        assert session.query(Quote).count() == 3
+
+
+def test_parser_resume_errored(tmpdb, memetracker_file_errored, monkeypatch):
+    error, filepath = memetracker_file_errored
+    interrupt_at_cluster(monkeypatch, 43112)
+    with pytest.raises(RuntimeError):
+        MemeTrackerParser(filepath, flush_clusters=1).parse()
+    monkeypatch.undo()
+
+    # Checks for the clusters saved before the crash are not lost.
+    with pytest.raises(ValueError) as excinfo:
+        MemeTrackerParser(filepath, flush_clusters=1, resume=True).parse()
+    assert error in str(excinfo.value)
+
+
+def test_parser_resume_options():
+    for kwargs in [{}, {'flush_clusters': 1, 'jobs': 2},
+                   {'flush_clusters': 1, 'limit': 2}]:
+        with pytest.raises(ValueError) as excinfo:
+            MemeTrackerParser('some-file', resume=True, **kwargs)
+        assert 'Cannot resume' in str(excinfo.value)
+
+
+@pytest.mark.parametrize('kwargs', [{}, {'flush_clusters': 1}, {'jobs': 2},
+                                    {'engine': 'mmap'}])
+def test_parser_append(tmpdb, memetracker_file, kwargs):
+    filepath = memetracker_file
+    MemeTrackerParser(filepath).parse()
+
+    # Appending the same file again creates a new dump with shifted ids.
+    parser = MemeTrackerParser(filepath, append=True, **kwargs)
+    parser.parse()
+    assert parser.dump == 1
+    assert parser.cluster_id_offset == 43113
+    assert parser.quote_id_offset == 950239
+    with session_scope() as session:
+        assert session.query(Cluster).count() == 4
+        assert session.query(Quote).count() == 6
+        assert session.query(Cluster).filter_by(dump=0).count() == 2
+        c4 = session.query(Cluster).filter_by(dump=1, sid=43112).one()
+        assert c4.id == 43113 + 43112
+        q1 = c4.quotes.one()
+        assert q1.sid == 1485
+        assert q1.id == 950239 + 1485
+        assert q1.size == 2
+        assert q1.frequency == 3
+
+    # Appending to an empty database is the same as a normal load.
+    with session_scope() as session:
+        session.query(Cluster).delete()
+    parser = MemeTrackerParser(filepath, append=True, **kwargs)
+    parser.parse()
+    assert parser.dump == 0
+    with session_scope() as session:
+        c4 = session.query(Cluster).filter_by(sid=43112).one()
+        assert c4.id == 43112
+        assert c4.dump == 0
+
+
+def test_parser_append_resume(tmpdb, memetracker_file, monkeypatch):
+    filepath = memetracker_file
+    MemeTrackerParser(filepath).parse()
+
+    interrupt_at_cluster(monkeypatch, 43112)
+    with pytest.raises(RuntimeError):
+        MemeTrackerParser(filepath, flush_clusters=1, append=True).parse()
+    monkeypatch.undo()
+
+    # Offsets and dump are taken from the checkpoint, not from the database
+    # which now holds part of the new dump.
+    parser = MemeTrackerParser(filepath, flush_clusters=1, append=True,
+                               resume=True)
+    parser.parse()
+    assert parser.dump == 1
+    assert parser.cluster_id_offset == 43113
+    assert parser.quote_id_offset == 950239
+    with session_scope() as session:
+        assert session.query(Cluster).filter_by(dump=1).count() == 2
+        assert session.query(Quote).count() == 6
+
+
+def test_filter_clusters_dump(tmpdb, memetracker_file):
+    filepath = memetracker_file
+    MemeTrackerParser(filepath).parse()
+    filter_clusters()
+    MemeTrackerParser(filepath, append=True).parse()
+
+    # Filtering the new dump keeps the filtered ids of the first one stable.
+    with session_scope() as session:
+        filtered_ids = set(id for (id,) in session.query(Cluster.id)
+                           .filter(Cluster.filtered.is_(True)))
+    filter_clusters(dump=1)
+    with session_scope() as session:
+        assert set(id for (id,) in session.query(Cluster.id)
+                   .filter(Cluster.filtered.is_(True), Cluster.dump == 0)) \
+            == filtered_ids
+        assert session.query(Cluster)\
+            .filter(Cluster.filtered.is_(True), Cluster.dump == 1).count() \
+            == len(filtered_ids)
+
+
+def test_parser_cluster_ranges(memetracker_file):
+    filepath = memetracker_file
+    parser = MemeTrackerParser(filepath)
+    with open(filepath, 'rb') as f:
+        data = f.read()
+
+    for count in [1, 2, 3, 10, 100]:
+        ranges = parser._cluster_ranges(count)
+        assert 1 <= len(ranges) <= min(count, 2)
+        # Ranges are contiguous, cover the whole data, and start on clusters.
+        assert ranges[-1][1] == len(data)
+        for (start, end), (next_start, _) in zip(ranges[:-1], ranges[1:]):
+            assert end == next_start
+        for start, end in ranges:
+            tipe, _ = parser._parse_line(data[start:end].decode('utf8'))
+            assert tipe == 'cluster'
+
+
+def test_mmap_range_file(memetracker_file):
+    filepath = memetracker_file
+    odd_lines = ('\xa0starts with a non-breaking space\n'
+                 '+3\tstarts with a plus\n'
+                 ' 3\tstarts with a space\n'
+                 '3\t5\tcarriage return\t42\r\n'
+                 '\t\t\tthree tabs\n'
+                 '\t\t2008-08-01 00:31:56\t2\tM\tno-final-newline')
+    with open(filepath, 'a') as f:
+        f.write('\n' + odd_lines)
+
+    with open(filepath, 'rb') as f:
+        lines = [line.decode('utf8') for line in f]
+        with MmapRangeFile(f, 0) as reader:
+            records = list(iter(reader.read_record, None))
+            assert reader.offset == f.tell()
+            buf = reader._mmap
+        # The memory map is released, but the file is left to its owner.
+        assert buf.closed
+        assert not f.closed
+
+    assert len(records) == len(lines)
+    for line, (tipe, _) in zip(lines, records):
+        assert tipe == MemeTrackerParser._parse_line(line)[0]
+    # Fields are compared on data lines only, past the header.
+    header_size = MemeTrackerParser.header_size
+    for line, (tipe, fields) in zip(lines[header_size:],
+                                    records[header_size:]):
+        if tipe is None:
+            continue
+        expected_fields = MemeTrackerParser._parse_line(line)[1]
+        for i in MmapRangeFile.decoded_fields[tipe]:
+            assert fields[i] == expected_fields[i]
+        for i, field in enumerate(fields):
+            if isinstance(field, bytes):
+                assert i not in MmapRangeFile.decoded_fields[tipe]
+                field = field.decode('utf8')
+            assert field == expected_fields[i]
+
+
+def test_mmap_range_file_empty():
+    fd, filepath = mkstemp()
+    with open(filepath, 'rb') as f:
+        with MmapRangeFile(f, 0) as reader:
+            assert reader.read_record() is None
+            assert reader.readline() == ''
+    os.close(fd)
+    os.remove(filepath)
+
+
+def test_parser_engine():
+    with pytest.raises(ValueError) as excinfo:
+        MemeTrackerParser('some-file', engine='magic')
+    assert 'magic' in str(excinfo.value)
+
+
+def test_decode_timestamp():
+    for string in ['2008-08-01 00:24:08', '2008-08-01 00:24:09',
+                   '2008-09-17 23:59:59', '2000-02-29 12:00:00',
+                   '2008-8-1 0:24:08']:
+        assert decode_timestamp(string) == \
+            datetime.strptime(string, MT_TIMESTAMP_FORMAT)
+
+    # Malformed timestamps raise the same errors as strptime.
+    for string in ['2008-08-01 24:00:00', '2008-02-30 00:00:00',
+                   '2001-02-29 12:00:00', '2008-08-01 00:61:00',
+                   '2008-08-01T00:24:08', '2008-08-01 00:24:08 ',
+                   '2008-08-01 00:24', '', 'not a timestamp']:
+        with pytest.raises(ValueError) as excinfo:
+            datetime.strptime(string, MT_TIMESTAMP_FORMAT)
+        with pytest.raises(ValueError) as fast_excinfo:
+            decode_timestamp(string)
+        assert str(fast_excinfo.value) == str(excinfo.value)
+
+
+def test_parser_timestamp_decoder():
+    with pytest.raises(ValueError) as excinfo:
+        MemeTrackerParser('some-file', timestamp_decoder='magic')
+    assert 'magic' in str(excinfo.value)
+
+
+@pytest.mark.parametrize('kwargs', [{}, {'flush_clusters': 1}])
+def test_parser_compressed(tmpdb, memetracker_file_compressed, kwargs):
+    filepath = memetracker_file_compressed
+    MemeTrackerParser(filepath, **kwargs).parse()
+
+    with session_scope() as session:
+        assert session.query(Cluster).count() == 2
+        assert session.query(Quote).count() == 3
+        q4 = session.query(Quote).filter_by(sid=1485).one()
+        assert q4.cluster.sid == 43112
+        assert q4.string == 'yes we can do this'
+        assert [url.url for url in q4.urls] == ['some-url-5', 'some-url-6']
+
+
+def test_parser_compressed_resume(tmpdb, memetracker_file_compressed,
+                                  monkeypatch):
+    filepath = memetracker_file_compressed
+    interrupt_at_cluster(monkeypatch, 43112)
+    with pytest.raises(RuntimeError):
+        MemeTrackerParser(filepath, flush_clusters=1).parse()
+    monkeypatch.undo()
+
+    MemeTrackerParser(filepath, flush_clusters=1, resume=True).parse()
+    with session_scope() as session:
+        assert session.query(Cluster).count() == 2
+        assert session.query(Quote).count() == 3
+
+
+def test_parser_compressed_options():
+    for kwargs in [{'jobs': 2}, {'engine': 'mmap'}]:
+        with pytest.raises(ValueError) as excinfo:
+            MemeTrackerParser('some-file.gz', **kwargs)
+        assert 'compressed' in str(excinfo.value)
+
+
+def test_parser_jobs_limit():
+    with pytest.raises(ValueError) as excinfo:
+        MemeTrackerParser('some-file', limit=2, jobs=2)
+    assert 'several jobs' in str(excinfo.value)
+
+
 def test_fa_feature_loader_norms():
     loader = FAFeatureLoader()
     norms = loader._norms
@@ -301,6 +692,15 @@ def test_fa_feature_loader_undirected_norms_graph():
         assert weight > 0
 
 
+def test_fa_feature_loader_engine():
+    with pytest.raises(ValueError) as excinfo:
+        FAFeatureLoader(engine='magic')
+    assert 'magic' in str(excinfo.value)
+    with pytest.raises(ValueError) as excinfo:
+        FAFeatureLoader(engine='networkx', jobs=2)
+    assert 'several jobs' in str(excinfo.value)
+
+
 def test_fa_feature_loader_remove_zeros():
     testdict = {'a': -1, 'b': 0, 'c': .1, 'd': 1, 'e': 'something',
                 'f': 0, 0: 1}
@@ -385,7 +785,9 @@ d, e, x, x, x, 1
 c, e, x, x, x, 1
 e, c, x, x, x, 1''',
         'result': {'a': 0.5, 'b': 0.5, 'c': 0.18832675415790612,
-                   'd': 0.6299605249474366, 'e': 0.6299605249474366}
+                   'd': 0.6299605249474366, 'e': 0.6299605249474366},
+        # Sparse matrix products don't round exactly like networkx.
+        'tol': 1e-15
     }
 }
 
@@ -420,13 +822,61 @@ def test_fa_feature_loader_feature(fa_sources):
             assert abs(result[k] - v) < tol
 
 
+def test_fa_feature_loader_feature_jobs(fa_sources):
+    feature, expected_result, tol = fa_sources
+    result = getattr(FAFeatureLoader(jobs=2), feature)()
+    assert set(result.keys()) == set(expected_result.keys())
+    for k, v in expected_result.items():
+        assert abs(result[k] - v) < (tol or 1e-15)
+
+
+def test_fa_feature_loader_betweenness_pivots():
+    fd, fa_filepath = mkstemp()
+    with open(fd, 'w') as tmp:
+        tmp.write(fa_header + fa_cases['betweenness']['content'] + fa_footer)
+
+    with settings.override(('FA_SOURCES', [fa_filepath])):
+        # All words as pivots give the exact betweenness.
+        loader = FAFeatureLoader(pivots=4)
+        assert loader.betweenness() == {'c': 1/6}
+        assert loader.betweenness_error == 0
+        assert loader.betweenness_errors == {'a': 0, 'b': 0, 'c': 0, 'd': 0}
+
+        loader = FAFeatureLoader(pivots=2, seed=3)
+        betweenness = loader.betweenness()
+        assert betweenness == FAFeatureLoader(pivots=2, seed=3).betweenness()
+        assert loader.betweenness_error is not None
+        assert set(loader.betweenness_errors.keys()) == {'a', 'b', 'c', 'd'}
+
+        assert FAFeatureLoader().betweenness_error is None
+
+    os.remove(fa_filepath)
+
+
 def test_load_fa_features(fa_sources):
     feature, expected_result, tol = fa_sources
-    with settings.file_override('DEGREE', 'PAGERANK',
-                                'BETWEENNESS', 'CLUSTERING'):
+    with settings.file_override('FEATURES'):
         load_fa_features()
-        with open(getattr(settings, feature.upper()), 'rb') as f:
-            result = pickle.load(f)
+        result = dict(FeatureStore(settings.FEATURES).feature(feature))
+        if tol is None:
+            assert result == expected_result
+        else:
+            assert set(result.keys()) == set(expected_result.keys())
+            for k, v in expected_result.items():
+                assert abs(result[k] - v) < tol
+
+
+@pytest.mark.parametrize('processes', [1, 2, 5])
+def test_compute_features(tmpdb, fa_sources, processes):
+    feature, expected_result, tol = fa_sources
+    with settings.file_override('FEATURES'):
+        # MemeTracker features are up to date, so only FA tasks run.
+        FeatureStore(settings.FEATURES).save(
+            {'frequency': {'yes': 1}, 'tokens': {'yes'}}, _mt_digest())
+        compute_features(processes=processes, jobs=2)
+        store = FeatureStore(settings.FEATURES)
+        assert dict(store.feature('frequency')) == {'yes': 1}
+        result = dict(store.feature(feature))
         if tol is None:
             assert result == expected_result
         else:
@@ -434,25 +884,159 @@ def test_load_fa_features(fa_sources):
             for k, v in expected_result.items():
                 assert abs(result[k] - v) < tol
 
+        # Now everything is up to date.
+        store.save({feature: {'a': 1}}, store.digest(feature))
+        compute_features(processes=processes)
+        assert dict(FeatureStore(settings.FEATURES)
+                    .feature(feature)) == {'a': 1}
+
+        # Forcing runs all tasks, which fails without filtered quotes.
+        with pytest.raises(Exception) as excinfo:
+            compute_features(processes=processes, force=True)
+        assert 'no filtered quotes' in str(excinfo.value)
 
-def test_load_mt_frequency_and_tokens(tmpdb, memetracker_file):
-    filepath, line_count = memetracker_file
-    MemeTrackerParser(filepath, line_count=line_count).parse()
+
+def test_filtered_quotes_digest(tmpdb, memetracker_file):
+    MemeTrackerParser(memetracker_file).parse()
+    filter_clusters()
+    digest = _filtered_quotes_digest()
+    assert _filtered_quotes_digest() == digest
+
+    # Strings, frequencies and stored tags change the digest, even with the
+    # same ids.
+    with session_scope() as session:
+        quote = session.query(Quote).filter(Quote.filtered.is_(True))\
+            .order_by(Quote.id).first()
+        string, frequencies = quote.string, list(quote.url_frequencies)
+        quote_id = quote.id
+    for change in [{'string': string + ' edited'},
+                   {'url_frequencies': frequencies[:-1] +
+                    [frequencies[-1] + 1]},
+                   {'string_tokens': ['yes'], 'string_lemmas': ['yes']}]:
+        with session_scope() as session:
+            session.query(Quote).filter_by(id=quote_id).update(change)
+        assert _filtered_quotes_digest() != digest
+        with session_scope() as session:
+            session.query(Quote).filter_by(id=quote_id).update(
+                {'string': string, 'url_frequencies': frequencies,
+                 'string_tokens': None, 'string_lemmas': None})
+        assert _filtered_quotes_digest() == digest
+
+
+@pytest.mark.parametrize('jobs', [1, 2])
+def test_load_mt_frequency_and_tokens(tmpdb, memetracker_file, jobs):
+    filepath = memetracker_file
+    MemeTrackerParser(filepath).parse()
 
     with pytest.raises(Exception) as excinfo:
-        load_mt_frequency_and_tokens()
+        load_mt_frequency_and_tokens(jobs=jobs)
     assert 'no filtered quotes' in str(excinfo.value)
 
     # Run the filtering and test real values.
     filter_clusters()
-    with settings.file_override('FREQUENCY', 'TOKENS'):
-        load_mt_frequency_and_tokens()
-        with open(settings.FREQUENCY, 'rb') as f:
-            frequency = pickle.load(f)
+    with settings.file_override('FEATURES'):
+        load_mt_frequency_and_tokens(jobs=jobs)
+        store = FeatureStore(settings.FEATURES)
+        frequency = dict(store.feature('frequency'))
         assert frequency == {'yes': 8, 'that': 5, 'be': 4, 'what': 2,
                              'love': 5, 'person': 3, 'do': 6, 'you': 3,
                              'we': 3, 'can': 3, 'this': 3}
-        with open(settings.TOKENS, 'rb') as f:
-            tokens = pickle.load(f)
+        tokens = set(store.feature('tokens'))
         assert tokens == {'yes', 'that', "'s", 'what', 'love', 'is', 'person',
                           'does', 'you', 'we', 'can', 'do', 'this'}
+
+        # Up-to-date features are not recomputed, unless forced.
+        store.save({'frequency': {'yes': 1}}, store.digest('frequency'))
+        load_mt_frequency_and_tokens()
+        assert dict(FeatureStore(settings.FEATURES)
+                    .feature('frequency')) == {'yes': 1}
+        load_mt_frequency_and_tokens(force=True)
+        assert dict(FeatureStore(settings.FEATURES)
+                    .feature('frequency')) == frequency
+
+        # Features are recomputed when filtered quotes change.
+        store.save({'frequency': {'yes': 1}}, store.digest('frequency'))
+        with session_scope() as session:
+            session.query(Quote).filter(Quote.filtered.is_(True))\
+                .limit(1).one().filtered = False
+        load_mt_frequency_and_tokens()
+        assert dict(FeatureStore(settings.FEATURES)
+                    .feature('frequency')) != {'yes': 1}
+
+
+def test_count_batch(monkeypatch):
+    from brainscopypaste import tagger
+    from brainscopypaste.tagcache import TagCache
+
+    calls = Counter()
+
+    def counting(name, function):
+        def wrapper(*args, **kwargs):
+            calls[name] += 1
+            return function(*args, **kwargs)
+        return wrapper
+
+    for name in ['get', 'get_many', 'put', 'put_many']:
+        monkeypatch.setattr(TagCache, name,
+                            counting(name, getattr(TagCache, name)))
+    for name in ['_tag_text', '_tag_texts']:
+        monkeypatch.setattr(tagger, name,
+                            counting(name, getattr(tagger, name)))
+    for function in [tagger.tag, tagger.tags, tagger.tokens, tagger.lemmas]:
+        function.drop_cache()
+
+    # Untagged strings of a batch are looked up in the tag cache, tagged by
+    # TreeTagger and stored at once.
+    batch = [('The counted dog barks', 2, None, None),
+             ('The counted cat purrs', 1, None, None),
+             ('The counted dog barks', 1, None, None),
+             ('Stored', 4, ('stored',), ('store',))]
+    frequencies = Counter()
+    tokens = set()
+    _count_batch(batch, 'tokens', frequencies, tokens)
+    assert frequencies == {'the': 4, 'counted': 4, 'dog': 3, 'barks': 3,
+                           'cat': 1, 'purrs': 1, 'stored': 4}
+    assert tokens == {'the', 'counted', 'dog', 'barks', 'cat', 'purrs',
+                      'stored'}
+    assert calls == {'get_many': 1, 'put_many': 1, '_tag_texts': 1}
+
+    frequencies = Counter()
+    _count_batch(batch, 'lemmas', frequencies, set())
+    assert frequencies['store'] == 4
+    assert frequencies['dog'] == 3
+
+
+def test_load_quote_tags(tmpdb, memetracker_file):
+    from brainscopypaste import tagger
+
+    MemeTrackerParser(memetracker_file).parse()
+    load_quote_tags(batch_size=2)
+
+    with session_scope() as session:
+        quotes = session.query(Quote).all()
+        assert len(quotes) > 0
+        for quote in quotes:
+            assert tuple(quote.string_tags) == tagger.tags(quote.string)
+            assert tuple(quote.string_tokens) == tagger.tokens(quote.string)
+            assert tuple(quote.string_lemmas) == tagger.lemmas(quote.string)
+
+        # Tagged quotes are left untouched.
+        quote_id, string = quotes[0].id, quotes[0].string
+        quotes[0].string_tokens = ['changed']
+    load_quote_tags()
+    with session_scope() as session:
+        quote = session.query(Quote).get(quote_id)
+        assert quote.tokens == ('changed',)
+        quote.string_tokens = list(tagger.tokens(string))
+
+    # Filtered quotes keep their tags, which are used for frequencies.
+    filter_clusters()
+    with session_scope() as session:
+        assert session.query(Quote)\
+            .filter(Quote.filtered.is_(True))\
+            .filter(Quote.string_tokens.is_(None)).count() == 0
+    with settings.file_override('FEATURES'):
+        load_mt_frequency_and_tokens()
+        assert dict(FeatureStore(settings.FEATURES).feature('frequency')) \
+            == {'yes': 8, 'that': 5, 'be': 4, 'what': 2, 'love': 5,
+                'person': 3, 'do': 6, 'you': 3, 'we': 3, 'can': 3, 'this': 3}
@@ -19,23 +19,27 @@ together to mine for all substitutions in the dataset for a given
 
 from enum import Enum, unique
 from datetime import timedelta, datetime
+from itertools import islice
 import logging
 
 import click
 from progressbar import ProgressBar
 import numpy as np
-from nltk.corpus import wordnet
 
 from brainscopypaste.conf import settings
 from brainscopypaste.utils import (is_int, is_same_ending_us_uk_spelling,
                                    stopwords, levenshtein, subhamming,
+                                   subhamming_batch, Vocabulary,
                                    session_scope, memoized)
 
 
 logger = logging.getLogger(__name__)
+#: Vocabulary encoding lemmas for :meth:`Model.prime_distances`, shared by
+#: all models and clusters.
+_lemma_vocabulary = Vocabulary()
 
 
-def mine_substitutions_with_model(model, limit=None):
+def mine_substitutions_with_model(model, limit=None, dump=None, store=None):
     """Mine all substitutions in the MemeTracker dataset conforming to `model`.
 
     Iterates through the whole MemeTracker dataset to find all substitutions
@@ -54,42 +58,97 @@ def mine_substitutions_with_model(model, limit=None):
     limit : int, optional
         If not `None` (default), mining will stop after `limit` clusters have
         been examined.
+    dump : int, optional
+        If not `None`, only mine the filtered :class:`~.db.Cluster`\ s of
+        this dump (see :attr:`~.db.Cluster.dump`), e.g. to mine a MemeTracker
+        file that was appended to an already mined database.
+    store : :class:`~.columnar.ColumnarStore`, optional
+        If not `None`, mine the clusters of this store and save substitutions
+        to it, instead of using the database.
 
     Raises
     ------
     Exception
-        If no filtered clusters are found in the database, or if there already
-        are some substitutions from model `model` in the database.
+        If no filtered clusters are found in the database (or in dump `dump`
+        if it is not `None`), or if there already are some substitutions from
+        model `model` in the database (or in dump `dump`).
 
     """
 
-    from brainscopypaste.db import Cluster, Substitution
-
     logger.info('Mining clusters for substitutions')
     if limit is not None:
         logger.info('Mining is limited to %s clusters', limit)
+    if dump is not None:
+        logger.info('Mining is restricted to dump #%s', dump)
 
-    click.echo('Mining clusters for substitutions with {}{}...'
-               .format(model, '' if limit is None
+    click.echo('Mining clusters{} for substitutions with {}{}...'
+               .format('' if dump is None else ' of dump #{}'.format(dump),
+                       model, '' if limit is None
                        else ' (limit={})'.format(limit)))
 
     # Check we haven't already mined substitutions with this model.
+    substitution_count = _count_substitutions(model, dump, store)
+    if substitution_count != 0:
+        raise Exception(('The database already contains substitutions '
+                         'mined with this model ({} - {} substitutions). '
+                         'You should drop these before doing anything '
+                         'else.'.format(model, substitution_count)))
+
+    if store is None:
+        seen, kept = _mine_database(model, limit, dump)
+    else:
+        seen, kept = _mine_store(model, limit, dump, store)
+
+    click.secho('OK', fg='green', bold=True)
+    logger.info('Seen %s candidate substitutions, kept %s', seen, kept)
+    click.echo('Seen {} candidate substitutions, kept {}.'.format(seen, kept))
+
+
+def _count_substitutions(model, dump=None, store=None):
+    """Count the substitutions mined with `model` (from clusters of dump
+    `dump` if it is not `None`) in the database, or in `store` if it is not
+    `None`."""
+
+    from brainscopypaste.db import Cluster, Quote, Substitution
+
+    if store is not None:
+        return store.count_substitutions(model, dump)
+
     with session_scope() as session:
-        substitution_count = session.query(Substitution)\
-            .filter(Substitution.model == model).count()
-        if substitution_count != 0:
-            raise Exception(('The database already contains substitutions '
-                             'mined with this model ({} - {} substitutions). '
-                             'You should drop these before doing anything '
-                             'else.'.format(model, substitution_count)))
+        substitutions = session.query(Substitution)\
+            .filter(Substitution.model == model)
+        if dump is not None:
+            substitutions = substitutions\
+                .join(Quote, Substitution.source_id == Quote.id)\
+                .join(Cluster).filter(Cluster.dump == dump)
+        return substitutions.count()
+
+
+def _mine_database(model, limit, dump):
+    """Mine the filtered clusters of the database for substitutions, for
+    :func:`mine_substitutions_with_model`.
+
+    Valid substitutions are saved to the database as they are found.
+
+    Returns
+    -------
+    seen : int
+        Number of candidate substitutions seen.
+    kept : int
+        Number of valid substitutions saved.
+
+    """
+
+    from brainscopypaste.db import Cluster
 
     # Check clusters have been filtered.
     with session_scope() as session:
-        if session.query(Cluster)\
-           .filter(Cluster.filtered.is_(True)).count() == 0:
+        query = session.query(Cluster.id).filter(Cluster.filtered.is_(True))
+        if dump is not None:
+            query = query.filter(Cluster.dump == dump)
+        if query.count() == 0:
             raise Exception('Found no filtered clusters, aborting.')
 
-        query = session.query(Cluster.id).filter(Cluster.filtered.is_(True))
         if limit is not None:
             query = query.limit(limit)
         cluster_ids = [id for (id,) in query]
@@ -116,13 +175,50 @@ def mine_substitutions_with_model(model, limit=None):
                     session.rollback()
 
     # Sanity check. This session business is tricky.
-    with session_scope() as session:
-        assert session.query(Substitution)\
-            .filter(Substitution.model == model).count() == kept
+    assert _count_substitutions(model, dump) == kept
 
-    click.secho('OK', fg='green', bold=True)
-    logger.info('Seen %s candidate substitutions, kept %s', seen, kept)
-    click.echo('Seen {} candidate substitutions, kept {}.'.format(seen, kept))
+    return seen, kept
+
+
+def _mine_store(model, limit, dump, store):
+    """Mine the filtered clusters of a :class:`~.columnar.ColumnarStore`
+    for substitutions, for :func:`mine_substitutions_with_model`.
+
+    Valid substitutions are saved to `store` in one part once all clusters
+    have been mined.
+
+    Returns
+    -------
+    seen : int
+        Number of candidate substitutions seen.
+    kept : int
+        Number of valid substitutions saved.
+
+    """
+
+    count = store.count('clusters', filtered=True, dump=dump)
+    if count == 0:
+        raise Exception('Found no filtered clusters, aborting.')
+    count = count if limit is None else min(limit, count)
+    logger.info('Got %s clusters to mine', count)
+
+    seen = 0
+    substitutions = []
+    for cluster in ProgressBar(max_value=count)(
+            store.clusters(filtered=True, dump=dump, limit=limit)):
+        model.drop_caches()
+        for substitution in cluster.substitutions(model):
+            seen += 1
+            if substitution.validate():
+                logger.debug('Found valid substitution in cluster #%s',
+                             cluster.sid)
+                substitutions.append(substitution)
+            else:
+                logger.debug('Dropping substitution from cluster #%s',
+                             cluster.sid)
+
+    store.save_substitutions(substitutions)
+    return seen, len(substitutions)
 
 
 @unique
@@ -308,7 +404,7 @@ class Model:
         return ('Model(time={0.time}, source={0.source}, past={0.past}, '
                 'durl={0.durl}, max_distance={0.max_distance})').format(self)
 
-    @memoized
+    @memoized(maxsize=2 ** 16)
     def validate(self, source, durl):
         """Test if potential substitutions from `source` quote to `durl`
         destination url are valid for this model.
@@ -399,6 +495,7 @@ class Model:
                        self.past_surls(source.cluster, durl)]
         return durl.quote not in past_quotes
 
+    @memoized(maxsize=2 ** 16)
     def _distance_start(self, source, durl):
         """Get a `(distance, start)` tuple indicating the minimal distance
         between `source` and `durl`, and the position of `source`'s substring
@@ -406,7 +503,8 @@ class Model:
 
         This is in fact an alias for what the model considers to be valid
         transformations and how to define them, but provides proper
-        encapsulation of concerns.
+        encapsulation of concerns. This method is :func:`~.utils.memoized`,
+        and :meth:`prime_distances` fills its cache for many pairs at once.
 
         """
 
@@ -418,13 +516,31 @@ class Model:
         # instead of making this function more complicated.
         return subhamming(source.lemmas, durl.quote.lemmas)
 
+    def prime_distances(self, pairs):
+        """Compute the :meth:`_distance_start` of all `(source, durl)`
+        `pairs` at once, and cache them.
+
+        Lemmas are encoded with a vocabulary shared by all models, and
+        distances for all the sources of a same destination quote are
+        computed together (see :func:`~.utils.subhamming_batch`).
+
+        """
+
+        pairs = list(pairs)
+        distance_starts = subhamming_batch(
+            [(source.lemmas, durl.quote.lemmas) for source, durl in pairs],
+            vocabulary=_lemma_vocabulary)
+        for (source, durl), distance_start in zip(pairs, distance_starts):
+            self._distance_start.prime_cache(distance_start, self, source,
+                                             durl)
+
     def find_start(self, source, durl):
         """Get the position of the substring of `source` that achieves minimal
         distance to `durl`."""
 
         return self._distance_start(source, durl)[1]
 
-    @memoized
+    @memoized(maxsize=2 ** 16)
     def past_surls(self, cluster, durl):
         """Get the list of all :class:`~.db.Url`\ s that are in what this model
         considers to be the past before `durl`.
@@ -436,7 +552,7 @@ class Model:
         past = self._past(cluster, durl)
         return list(filter(lambda url: url.timestamp in past, cluster.urls))
 
-    @memoized
+    @memoized(maxsize=2 ** 16)
     def _past(self, cluster, durl):
         """Get an :class:`Interval` representing what this model considers to
         be the past before `durl`.
@@ -483,6 +599,7 @@ class Model:
         self.validate.drop_cache()
         self.past_surls.drop_cache()
         self._past.drop_cache()
+        self._distance_start.drop_cache()
 
     def __key(self):
         """Unique identifier for this model, used to compute e.g. equality
@@ -515,6 +632,10 @@ class ClusterMinerMixin:
 
     """
 
+    #: Number of candidate `(source, durl)` pairs whose distances are
+    #: computed in a single batch (see :meth:`Model.prime_distances`).
+    distance_batch_size = 10000
+
     def substitutions(self, model):
         """Iterate through all substitutions in this cluster considered valid
         by `model`.
@@ -539,7 +660,28 @@ class ClusterMinerMixin:
 
         """
 
-        # Iterate through candidate substitutions.
+        # Iterate through candidate substitutions, computing their distances
+        # by batches.
+        candidates = self._candidates(model)
+        while True:
+            batch = list(islice(candidates, self.distance_batch_size))
+            if len(batch) == 0:
+                break
+            model.prime_distances(batch)
+            for source, durl in batch:
+                # Check distance, source and durl validity.
+                if model.validate(source, durl):
+                    logger.debug('Found candidate substitution(s) between '
+                                 'quote #%s and durl #%s/%s', source.sid,
+                                 durl.quote.sid, durl.occurrence)
+                    for substitution in self._substitutions(source, durl,
+                                                            model):
+                        yield substitution
+
+    def _candidates(self, model):
+        """Iterate through the `(source, durl)` pairs in this cluster that
+        `model` could consider for substitutions."""
+
         for durl in self.urls:
             past_quotes_set = set([surl.quote for surl in
                                    model.past_surls(self, durl)])
@@ -549,15 +691,7 @@ class ClusterMinerMixin:
                 # Source can't be shorter than destination
                 if len(source.lemmas) < len(durl.quote.lemmas):
                     continue
-
-                # Check distance, source and durl validity.
-                if model.validate(source, durl):
-                    logger.debug('Found candidate substitution(s) between '
-                                 'quote #%s and durl #%s/%s', source.sid,
-                                 durl.quote.sid, durl.occurrence)
-                    for substitution in self._substitutions(source, durl,
-                                                            model):
-                        yield substitution
+                yield source, durl
 
     @classmethod
     def _substitutions(cls, source, durl, model):
@@ -600,6 +734,8 @@ def _get_wordnet_words():
 
     """
 
+    from nltk.corpus import wordnet
+
     return set(word.lower()
                for synset in wordnet.all_synsets()
                for word in synset.lemma_names())
@@ -71,6 +71,31 @@ def test_model_eq():
         Model(Time.continuous, Source.all, Past.all, Durl.all, 2)
 
 
+def test_model_prime_distances():
+    model = Model(Time.continuous, Source.all, Past.all, Durl.all, 1)
+    model.drop_caches()
+    source1 = Namespace({'lemmas': ('yes', 'the', 'cat', 'sit', 'on', 'it')})
+    source2 = Namespace({'lemmas': ('the', 'dog', 'sit', 'on', 'it')})
+    durl1 = Namespace({'quote': Namespace({'lemmas': ('the', 'cat', 'sit')})})
+    durl2 = Namespace({'quote': Namespace({'lemmas': ('a', 'cat', 'lie',
+                                                      'on', 'it')})})
+    pairs = [(source1, durl1), (source2, durl1), (source1, durl2),
+             (source2, durl2)]
+
+    model.prime_distances(pairs)
+    for source, durl in pairs:
+        assert model._distance_start.is_cached(model, source, durl)
+    assert [model._distance_start(source, durl) for source, durl in pairs] \
+        == [(0, 1), (1, 0), (2, 1), (3, 0)]
+    assert model.find_start(source1, durl1) == 1
+
+    # Primed values are those computed one by one.
+    model.drop_caches()
+    assert not model._distance_start.is_cached(model, source1, durl1)
+    assert [model._distance_start(source, durl) for source, durl in pairs] \
+        == [(0, 1), (1, 0), (2, 1), (3, 0)]
+
+
 header = '''format:
 <ClSz>\t<TotFq>\t<Root>\t<ClusterId>
 \t<QtFq>\t<Urls>\t<QtStr>\t<QuteId>
@@ -890,8 +915,7 @@ def load_db(content):
     with open(fd, 'w') as tmp:
         tmp.write(content)
 
-    line_count = content.count('\n') + 1
-    MemeTrackerParser(filepath, line_count=line_count).parse()
+    MemeTrackerParser(filepath).parse()
     os.remove(filepath)
 
 
@@ -62,25 +62,16 @@ FA_SOURCES = [join(fa_root, fa) for
                      'Cue_Target_Pairs.P-R',
                      'Cue_Target_Pairs.S',
                      'Cue_Target_Pairs.T-Z']]
-#: Path to the pickle file containing word pagerank centrality values.
-PAGERANK = join(fa_root, 'pagerank.pickle')
-#: Path to the pickle file containing word betweeness centrality values.
-BETWEENNESS = join(fa_root, 'betweenness.pickle')
-#: Path to the pickle file containing word clustering coefficient values.
-CLUSTERING = join(fa_root, 'clustering.pickle')
-#: Path to the pickle file containing word degree centrality values.
-DEGREE = join(fa_root, 'degree.pickle')
 
 # MemeTracker data and features.
 #: Path to the source MemeTracker data set.
 MT_SOURCE = join(mt_root, 'clust-qt08080902w3mfq5.txt')
-#: Number of lines in the :data:`MT_SOURCE` file (pre-computed with ``wc -l
-#: <memetracker-file>``); used by :class:`~.load.MemeTrackerParser`.
-MT_LENGTH = 8357595
-#: Path to the pickle file containing word frequency values.
-FREQUENCY = join(mt_root, 'frequency.pickle')
-#: Path to the pickle file containing the list of known tokens.
-TOKENS = join(mt_root, 'tokens.pickle')
+
+# Computed features.
+#: Path to the feature store file containing computed FreeAssociation (degree,
+#: pagerank, betweenness, clustering) and MemeTracker (frequency, tokens)
+#: features.
+FEATURES = join(data_root, 'features.store')
 
 # Where figures from notebooks live.
 #: Template for the file path to a figure from the main analysis that is to be
@@ -92,6 +83,9 @@ FIGURE_VARIANTS = join(figures_root, '{notebook}', '{model}')
 
 #: TreeTagger library folder.
 TREETAGGER_TAGDIR = 'treetagger'
+#: Path to the SQLite database caching TreeTagger codings across processes
+#: (see :class:`~.tagcache.TagCache`); set to `None` to disable it.
+TAG_CACHE = join(data_root, 'tags.sqlite')
 
 # Database credentials.
 #: PostgreSQL connection user name.
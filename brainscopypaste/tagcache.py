@@ -0,0 +1,155 @@
+"""Persistent storage for TreeTagger codings.
+
+This module defines :class:`TagCache`, which keeps the codings computed by
+:func:`~.tagger.tag` in an SQLite database (see :data:`~.settings.TAG_CACHE`)
+so that they survive the process that computed them: CLI commands, notebook
+kernels and worker processes then only start TreeTagger for sentences that
+were never tagged before.
+
+Codings are keyed by a hash of the sentence and of a digest of the tagging
+parameters (e.g. the TreeTagger parameter file, see
+:func:`~.featurestore.input_digest`), so changing those parameters never
+returns stale codings. The database is used in SQLite's write-ahead logging
+mode, so any number of processes can read it while one of them writes.
+
+"""
+
+
+from hashlib import sha1
+import logging
+import os
+import sqlite3
+
+from brainscopypaste.utils import mkdirp
+
+
+logger = logging.getLogger(__name__)
+
+
+class TagCache:
+
+    """Read and write the TreeTagger codings stored in SQLite database `path`
+    for tagging parameters `parameters`.
+
+    A missing or empty file is an empty cache. Use :meth:`get_many` to look
+    codings up and :meth:`put_many` to store them. Connections are opened on
+    first use in each process, so a cache can be shared with forked worker
+    processes.
+
+    Parameters
+    ----------
+    path : str
+        Path to the cache database.
+    parameters : str
+        Digest of the tagging parameters the codings depend on.
+
+    """
+
+    #: Seconds to wait for another process' write to finish.
+    timeout = 60
+
+    def __init__(self, path, parameters):
+        self.path = path
+        self.parameters = parameters
+        self._connection = None
+        self._pid = None
+        self._inherited = []
+
+    def __repr__(self):
+        return 'TagCache({!r}, {!r})'.format(self.path, self.parameters)
+
+    @property
+    def connection(self):
+        """Connection to the database for the current process, created (along
+        with the database) if necessary."""
+
+        if self._connection is None or self._pid != os.getpid():
+            if self._connection is not None:
+                # Never use or close a connection inherited through a fork
+                # (see https://www.sqlite.org/howtocorrupt.html), just keep
+                # it from being garbage-collected.
+                self._inherited.append(self._connection)
+            logger.debug("Opening tag cache '%s'", self.path)
+            dirname = os.path.dirname(self.path)
+            if dirname != '':
+                mkdirp(dirname)
+            self._connection = sqlite3.connect(self.path,
+                                               timeout=self.timeout)
+            self._pid = os.getpid()
+            self._connection.execute('PRAGMA journal_mode=WAL')
+            self._connection.execute('PRAGMA synchronous=NORMAL')
+            with self._connection:
+                self._connection.execute(
+                    'CREATE TABLE IF NOT EXISTS codings '
+                    '(key BLOB PRIMARY KEY, codings TEXT NOT NULL) '
+                    'WITHOUT ROWID')
+        return self._connection
+
+    def key(self, sentence):
+        """Get the key of `sentence` for our tagging parameters."""
+
+        return sha1('{}\0{}'.format(self.parameters, sentence)
+                    .encode('utf-8')).digest()
+
+    def get(self, sentence):
+        """Get the stored codings of `sentence`, or `None` if it is not
+        stored."""
+
+        return self.get_many([sentence]).get(sentence)
+
+    def get_many(self, sentences, batch_size=500):
+        """Get a dict of the stored codings of `sentences` (sentences that are
+        not stored are left out), querying `batch_size` sentences at a
+        time."""
+
+        keys = {}
+        for sentence in sentences:
+            keys[self.key(sentence)] = sentence
+        found = {}
+        items = list(keys.items())
+        for i in range(0, len(items), batch_size):
+            batch = dict(items[i:i + batch_size])
+            rows = self.connection.execute(
+                'SELECT key, codings FROM codings WHERE key IN ({})'
+                .format(', '.join('?' * len(batch))), list(batch.keys()))
+            for key, codings in rows:
+                found[batch[key]] = _decode(codings)
+        return found
+
+    def put(self, sentence, codings):
+        """Store the `codings` of `sentence`."""
+
+        self.put_many([(sentence, codings)])
+
+    def put_many(self, items):
+        """Store an iterable of `(sentence, codings)` `items` in a single
+        transaction."""
+
+        with self.connection as connection:
+            connection.executemany(
+                'INSERT OR REPLACE INTO codings (key, codings) VALUES (?, ?)',
+                ((self.key(sentence), _encode(codings))
+                 for sentence, codings in items))
+
+    def close(self):
+        """Close the connection of the current process, if it is open."""
+
+        if self._connection is not None and self._pid == os.getpid():
+            self._connection.close()
+        self._connection = None
+        self._pid = None
+
+
+def _encode(codings):
+    """Encode `codings` as TreeTagger outputs them: one line per token, and
+    tab-separated fields."""
+
+    return '\n'.join('\t'.join(coding) for coding in codings)
+
+
+def _decode(text):
+    """Decode codings encoded by :func:`_encode`."""
+
+    if text == '':
+        return ()
+    return tuple(line.split('\t') for line in text.split('\n'))
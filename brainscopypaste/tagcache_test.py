@@ -0,0 +1,64 @@
+import os
+from multiprocessing import Pool
+from tempfile import TemporaryDirectory
+
+import pytest
+
+from brainscopypaste.tagcache import TagCache
+
+
+codings = (['The', 'DT', 'the'], ['cat', 'NN', 'cat'],
+           ['sat', 'VVD', 'sit'])
+
+
+@pytest.yield_fixture
+def path():
+    with TemporaryDirectory() as tmpdir:
+        yield os.path.join(tmpdir, 'cache', 'tags.sqlite')
+
+
+def test_tag_cache(path):
+    cache = TagCache(path, 'abc')
+    assert cache.get('The cat sat') is None
+    assert cache.get_many(['The cat sat', '']) == {}
+
+    cache.put('The cat sat', codings)
+    cache.put_many([('', ()),
+                    ('Ünïcödé', (['Ünïcödé', 'NP', 'Ünïcödé'],))])
+    assert cache.get('The cat sat') == codings
+    assert cache.get('') == ()
+    assert cache.get_many(['The cat sat', '', 'Ünïcödé', 'Other'],
+                          batch_size=2) == \
+        {'The cat sat': codings, '': (),
+         'Ünïcödé': (['Ünïcödé', 'NP', 'Ünïcödé'],)}
+
+    # Codings persist, but only for the same parameters.
+    cache.close()
+    assert TagCache(path, 'abc').get('The cat sat') == codings
+    assert TagCache(path, 'def').get('The cat sat') is None
+
+    # Storing again replaces codings.
+    cache.put('The cat sat', codings[:1])
+    assert TagCache(path, 'abc').get('The cat sat') == codings[:1]
+
+
+#: Cache inherited by the processes of :func:`test_tag_cache_processes`.
+_inherited = None
+
+
+def _put_and_get(i):
+    _inherited.put('Sentence {}'.format(i), (['Sentence', 'NN', str(i)],))
+    return _inherited.get('The cat sat')
+
+
+def test_tag_cache_processes(path):
+    global _inherited
+    _inherited = cache = TagCache(path, 'abc')
+    cache.put('The cat sat', codings)
+
+    # Forked processes open their own connections, and concurrent writes
+    # wait for each other.
+    with Pool(4) as pool:
+        assert pool.map(_put_and_get, range(20)) == [codings] * 20
+    assert len(cache.get_many(['Sentence {}'.format(i)
+                               for i in range(20)])) == 20
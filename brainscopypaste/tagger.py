@@ -1,57 +1,397 @@
 """Tag and tokenize strings using TreeTagger.
 
-All the functions in this module are :func:`~.utils.memoized`, because they are
-called very often and repeatedly.
+The single-sentence functions in this module are :func:`~.utils.memoized`
+(keeping the most recently used sentences), because they are called very often
+and repeatedly. :func:`tag_batch` tags many sentences in few TreeTagger calls
+and fills those caches, and :func:`tag_many` spreads such calls over a pool of
+worker processes which each run their own TreeTagger instance.
+
+Codings are also kept in a persistent :class:`~.tagcache.TagCache` (see
+:data:`~.settings.TAG_CACHE`), so that sentences tagged by any earlier process
+are not sent to TreeTagger again. TreeTagger itself is only started when a
+sentence needs to be tagged.
 
 """
 
 
+from multiprocessing import Pool
+import atexit
+import logging
+import os
+
 from treetaggerwrapper import TreeTagger, TreeTaggerError
 from brainscopypaste.utils import find_parent_rel_dir, NotFoundError, memoized
+from brainscopypaste.featurestore import input_digest
+from brainscopypaste.tagcache import TagCache
 
 from brainscopypaste.conf import settings
 
 
-try:
-    _treetagger = TreeTagger(
-        TAGLANG='en', TAGPARFILE='english-utf8.par',
-        TAGDIR=find_parent_rel_dir(settings.TREETAGGER_TAGDIR))
-except NotFoundError:
-    raise TreeTaggerError('TreeTagger directory not found '
-                          '(searched parent directories '
-                          'recursively)')
+logger = logging.getLogger(__name__)
+#: TreeTagger language and parameter file.
+_TAGLANG, _TAGPARFILE = 'en', 'english-utf8.par'
+
+
+def _tagdir():
+    """Find the TreeTagger directory (see
+    :data:`~.settings.TREETAGGER_TAGDIR`)."""
+
+    try:
+        return find_parent_rel_dir(settings.TREETAGGER_TAGDIR)
+    except NotFoundError:
+        raise TreeTaggerError('TreeTagger directory not found '
+                              '(searched parent directories '
+                              'recursively)')
+
+
+def _new_treetagger():
+    """Start a new English TreeTagger instance."""
+
+    return TreeTagger(TAGLANG=_TAGLANG, TAGPARFILE=_TAGPARFILE,
+                      TAGDIR=_tagdir())
+
+
+#: TreeTagger instance of this process, started on first use by
+#: :func:`_get_treetagger`.
+_treetagger = None
+#: Pool of tagging processes used by :func:`tag_many`, created on first use
+#: and kept for later calls.
+_pool = None
+#: Number of processes in :data:`_pool`.
+_pool_jobs = None
+#: :class:`~.tagcache.TagCache` used by :func:`_tag_cache`.
+_cache = None
+#: SGML tags around each sentence in a single TreeTagger call (see
+#: :func:`_tag_texts`), which TreeTagger passes through untagged.
+_SENTENCE_START, _SENTENCE_END = '<bcp:sentence>', '</bcp:sentence>'
+
+
+def _get_treetagger():
+    """Get this process' TreeTagger instance, starting it on first use (so
+    that importing this module, or only reading cached codings, doesn't start
+    a TreeTagger process)."""
+
+    global _treetagger
+    if _treetagger is None:
+        logger.debug('Starting TreeTagger')
+        _treetagger = _new_treetagger()
+    return _treetagger
+
+
+def _tag_text(sentence):
+    """Tag `sentence` with this process' TreeTagger instance (see
+    :func:`tag`)."""
+
+    return tuple(t.split('\t') for t in
+                 _get_treetagger().tag_text(sentence, notagdns=True))
+
+
+def _tag_texts(sentences):
+    """Tag all `sentences` with a single call to this process' TreeTagger
+    instance (see :func:`_tag_text`).
 
+    Each sentence is preprocessed on its own, put between
+    :data:`_SENTENCE_START` and :data:`_SENTENCE_END`, and followed by the
+    tokens that treetaggerwrapper sends after each text to flush TreeTagger
+    (a full stop and a dummy sentence ending with two full stops). TreeTagger
+    ignores SGML tags, so each sentence is tagged between the same tokens as
+    when it is tagged in its own call, and gets the same codings. Sentences
+    which contain those SGML tags are tagged in their own call.
 
-@memoized
+    """
+
+    treetagger = _get_treetagger()
+    flush = ['.'] + treetagger.dummysequence.split('\n')
+    lines = []
+    batched = []
+    codings = {}
+    for i, sentence in enumerate(sentences):
+        sentence_lines = treetagger.tag_text(sentence, prepronly=True,
+                                             notagdns=True)
+        if (_SENTENCE_START in sentence_lines or
+                _SENTENCE_END in sentence_lines):
+            codings[i] = _tag_text(sentence)
+            continue
+        lines.append(_SENTENCE_START)
+        lines.extend(sentence_lines)
+        lines.append(_SENTENCE_END)
+        lines.extend(flush)
+        batched.append(i)
+    if len(batched) == 0:
+        return [codings[i] for i in range(len(sentences))]
+
+    split = []
+    current = None
+    for t in treetagger.tag_text(lines, tagonly=True, notagdns=True):
+        if t == _SENTENCE_START:
+            current = []
+        elif t == _SENTENCE_END and current is not None:
+            split.append(tuple(current))
+            current = None
+        elif current is not None:
+            current.append(t.split('\t'))
+    if len(split) != len(batched):
+        logger.warning('Could not split the output of a batch of %s '
+                       'sentences, tagging them one by one', len(batched))
+        split = [_tag_text(sentences[i]) for i in batched]
+    codings.update(zip(batched, split))
+    return [codings[i] for i in range(len(sentences))]
+
+
+@memoized(maxsize=2 ** 17)
 def tag(sentence):
     """Get all the TreeTagger codings of `sentence` (tokens, POS tags,
     lemmas).
 
+    Codings are read from the persistent :func:`_tag_cache` if it holds
+    them, and stored in it otherwise.
+
     Prefer using :func:`tags`, :func:`tokens`, or :func:`lemmas` which parse
-    this function's output.
+    this function's output (with :func:`parse`).
 
     """
 
-    return tuple(t.split('\t') for t in
-                 _treetagger.tag_text(sentence, notagdns=True))
+    cache = _tag_cache()
+    if cache is None:
+        return _tag_text(sentence)
+    codings = cache.get(sentence)
+    if codings is None:
+        codings = _tag_text(sentence)
+        cache.put(sentence, codings)
+    return codings
 
 
-@memoized
+@memoized(maxsize=2 ** 17)
 def tags(sentence):
     """Get the list of TreeTagger POS tags of `sentence`."""
 
-    return tuple(t[1] for t in tag(sentence))
+    return parse(tag(sentence))[0]
 
 
-@memoized
+@memoized(maxsize=2 ** 17)
 def tokens(sentence):
     """Get the list of tokens of `sentence`."""
 
-    return tuple(t[0].lower() for t in tag(sentence))
+    return parse(tag(sentence))[1]
 
 
-@memoized
+@memoized(maxsize=2 ** 17)
 def lemmas(sentence):
     """Get the list of lemmas of `sentence`."""
 
-    return tuple(t[2].lower() for t in tag(sentence))
+    return parse(tag(sentence))[2]
+
+
+def parse(codings):
+    """Split the TreeTagger `codings` of a sentence (as returned by
+    :func:`tag` or :func:`tag_many`) into its tuples of POS tags, (lowercase)
+    tokens, and (lowercase) lemmas."""
+
+    return (tuple(t[1] for t in codings),
+            tuple(t[0].lower() for t in codings),
+            tuple(t[2].lower() for t in codings))
+
+
+def tag_batch(sentences, batch_size=500):
+    """Tag `sentences` by batches of `batch_size` per TreeTagger call, and
+    fill the caches of :func:`tag`, :func:`tags`, :func:`tokens` and
+    :func:`lemmas` with the results.
+
+    Each call to TreeTagger pays for a round trip through its pipe, which
+    dominates the time needed to tag a short sentence. This function looks up
+    the sentences that are not yet cached in the persistent
+    :func:`_tag_cache` at once, tags the others in few calls (see
+    :func:`_tag_texts`, which gives the same codings as :func:`tag`) and
+    stores them there at once, so that the following calls to the functions
+    above are answered from their caches.
+
+    Parameters
+    ----------
+    sentences : iterable of str
+        Sentences to tag.
+    batch_size : int, optional
+        Number of sentences tagged in a single TreeTagger call; defaults to
+        500.
+
+    Returns
+    -------
+    tuple
+        One tuple of `[token, POS tag, lemma]` lists per sentence, as returned
+        by :func:`tag`.
+
+    """
+
+    sentences = list(sentences)
+    # Keep our own references to the codings, since the caches may evict
+    # some of them if there are many sentences.
+    tagged = {}
+    missing = []
+    for sentence in set(sentences):
+        if tag.is_cached(sentence):
+            tagged[sentence] = tag(sentence)
+        else:
+            missing.append(sentence)
+    stored = _lookup(missing)
+    missing = [sentence for sentence in missing if sentence not in stored]
+    new = []
+    for i in range(0, len(missing), batch_size):
+        batch = missing[i:i + batch_size]
+        new.extend(zip(batch, _tag_texts(batch)))
+    _store(new)
+    for sentence, codings in list(stored.items()) + new:
+        _prime_caches(sentence, codings)
+        tagged[sentence] = codings
+    return tuple(tagged[sentence] for sentence in sentences)
+
+
+def _prime_caches(sentence, codings):
+    """Cache `codings` (and their parsed tags, tokens and lemmas) as the
+    results for `sentence`."""
+
+    tag.prime_cache(codings, sentence)
+    try:
+        parsed = parse(codings)
+    except IndexError:
+        # SGML tags in the sentence come out untagged, so leave it to
+        # tags(), tokens() and lemmas() to fail when they are called.
+        return
+    for function, values in zip([tags, tokens, lemmas], parsed):
+        function.prime_cache(values, sentence)
+
+
+def tag_many(sentences, jobs=None, chunksize=100):
+    """Get the TreeTagger codings of all `sentences`, in order (see
+    :func:`tag`).
+
+    Distinct sentences are tagged once each, by chunks of `chunksize` per
+    TreeTagger call (see :func:`tag_batch`), unless they are in the
+    persistent :func:`_tag_cache`, which stores the new codings. With several
+    `jobs`, chunks are sent to a pool of worker processes, each of which runs
+    its own TreeTagger instance, so tagging scales with the number of cores.
+    The pool is started on the first call and reused by later calls with the
+    same number of `jobs`. Results are then not :func:`~.utils.memoized`, so
+    that tagging a whole data set doesn't fill memory.
+
+    Parameters
+    ----------
+    sentences : iterable of str
+        Sentences to tag.
+    jobs : int, optional
+        Number of tagging processes; defaults to the number of CPUs. With 1
+        job, sentences are tagged in the current process with
+        :func:`tag_batch` (whose results are then memoized).
+    chunksize : int, optional
+        Number of sentences tagged in a single TreeTagger call; defaults to
+        100.
+
+    Returns
+    -------
+    tuple
+        One tuple of `[token, POS tag, lemma]` lists per sentence, as returned
+        by :func:`tag`.
+
+    """
+
+    sentences = list(sentences)
+    if jobs is None:
+        jobs = os.cpu_count() or 1
+    if jobs == 1:
+        return tag_batch(sentences, batch_size=chunksize)
+
+    distinct = list(set(sentences))
+    tagged = _lookup(distinct)
+    missing = [sentence for sentence in distinct if sentence not in tagged]
+    chunks = [missing[i:i + chunksize]
+              for i in range(0, len(missing), chunksize)]
+    new = []
+    for chunk, codings in zip(chunks, _get_pool(jobs).map(_tag_texts,
+                                                          chunks)):
+        new.extend(zip(chunk, codings))
+    _store(new)
+    tagged.update(new)
+    return tuple(tagged[sentence] for sentence in sentences)
+
+
+def _tag_cache():
+    """Get the :class:`~.tagcache.TagCache` at :data:`~.settings.TAG_CACHE`
+    for our TreeTagger parameters, or `None` if it is disabled.
+
+    Codings are keyed on a digest of the TreeTagger language, parameter file
+    and options, so they are never reused with another parameter file.
+
+    """
+
+    global _cache
+    if settings.TAG_CACHE is None:
+        return None
+    if _cache is None or _cache.path != settings.TAG_CACHE:
+        _cache = TagCache(settings.TAG_CACHE, parameters_digest())
+    return _cache
+
+
+def parameters_digest():
+    """Get a digest of the TreeTagger language, parameter file (its contents,
+    if it is found) and options, which the codings of sentences depend on
+    (see :func:`~.featurestore.input_digest`)."""
+
+    try:
+        parfile = os.path.join(_tagdir(), 'lib', _TAGPARFILE)
+    except TreeTaggerError:
+        parfile = None
+    paths = ([parfile] if parfile is not None and os.path.exists(parfile)
+             else [])
+    return input_digest(paths, (_TAGLANG, _TAGPARFILE, 'notagdns'))
+
+
+def _lookup(sentences):
+    """Get a dict of the codings of `sentences` held in the persistent
+    :func:`_tag_cache` (empty if it is disabled)."""
+
+    cache = _tag_cache()
+    if cache is None:
+        return {}
+    return cache.get_many(sentences)
+
+
+def _store(items):
+    """Store `(sentence, codings)` `items` in the persistent
+    :func:`_tag_cache`, if it is enabled."""
+
+    cache = _tag_cache()
+    if cache is not None:
+        cache.put_many(items)
+
+
+def _get_pool(jobs):
+    """Get the pool of `jobs` tagging processes, (re)starting it if
+    necessary."""
+
+    global _pool, _pool_jobs
+    if _pool is None or _pool_jobs != jobs:
+        close_pool()
+        _pool = Pool(jobs, initializer=_init_worker)
+        _pool_jobs = jobs
+    return _pool
+
+
+def _init_worker():
+    """Make this worker process start its own TreeTagger instance."""
+
+    global _treetagger
+    # Keep a reference to the parent's instance, whose TreeTagger process
+    # could otherwise be stopped when it is garbage-collected here.
+    _init_worker.parent_treetagger = _treetagger
+    _treetagger = None
+
+
+@atexit.register
+def close_pool():
+    """Stop the pool of tagging processes used by :func:`tag_many`, if it
+    was started."""
+
+    global _pool, _pool_jobs
+    if _pool is not None:
+        _pool.terminate()
+        _pool.join()
+    _pool = None
+    _pool_jobs = None
@@ -3,7 +3,12 @@
 """
 
 
-from brainscopypaste.tagger import tag, tags, tokens, lemmas
+import pytest
+
+from brainscopypaste.tagger import (tag, tags, tokens, lemmas, parse,
+                                    tag_batch, tag_many, close_pool,
+                                    _tag_text, _tag_texts, _tag_cache)
+from brainscopypaste.conf import settings
 
 
 sentence = ("Don't! I wouldn't. I've been there. The cat "
@@ -53,3 +58,94 @@ def test_lemmas():
                                 'i', 'have', 'be', 'there', '.', 'the', 'cat',
                                 'jump', 'over', 'the', 'fox', 'and', 'eat',
                                 'the', 'rat')
+
+
+def test_parse():
+    assert parse(tag(sentence)) == (tags(sentence), tokens(sentence),
+                                    lemmas(sentence))
+    assert parse(()) == ((), (), ())
+
+
+@pytest.mark.parametrize('jobs', [1, 2])
+def test_tag_many(jobs):
+    sentences = [sentence, 'The dog barks', sentence, '']
+    assert tag_many(sentences, jobs=jobs, chunksize=1) == \
+        (tag(sentence), tag('The dog barks'), tag(sentence), ())
+    assert tag_many([], jobs=jobs) == ()
+    # The pool is reused.
+    assert tag_many(iter(['The dog barks']), jobs=jobs) == \
+        (tag('The dog barks'),)
+    close_pool()
+
+
+def test_tag_texts():
+    # Sentences tagged in one call get the codings of _tag_text, whatever
+    # they are tagged with.
+    sentences = ['The dog barks', sentence, 'Run!', 'I saw her duck', '',
+                 'Time flies like an arrow', 'The old man the boat',
+                 'The <bcp:sentence> marker']
+    single = [_tag_text(s) for s in sentences]
+    for order in [sentences, sentences[::-1], sentences[3:] + sentences[:3]]:
+        assert _tag_texts(order) == [single[sentences.index(s)]
+                                     for s in order]
+    assert _tag_texts([]) == []
+
+
+def test_tag_batch():
+    sentences = [sentence, 'The dog barks', 'The cat purrs', sentence]
+    for function in [tag, tags, tokens, lemmas]:
+        function.drop_cache()
+    with settings.override(('TAG_CACHE', None)):
+        assert tag_batch(sentences, batch_size=2) == \
+            tuple(_tag_text(s) for s in sentences)
+    for function in [tag, tags, tokens, lemmas]:
+        assert function.is_cached('The dog barks')
+    assert tokens('The dog barks') == ('the', 'dog', 'barks')
+    assert tag_batch([]) == ()
+
+
+@pytest.mark.parametrize('jobs', [1, 2])
+def test_tag_many_same_as_tag_text(jobs):
+    # Pooled or not, sentences tagged by chunks get the codings of
+    # _tag_text, whatever order they come in.
+    sentences = ['The dog barks', sentence, 'Run!', 'I saw her duck',
+                 'Time flies like an arrow', 'The old man the boat']
+    single = []
+    for s in sentences:
+        for function in [tag, tags, tokens, lemmas]:
+            function.drop_cache()
+        with settings.override(('TAG_CACHE', None)):
+            single.append(_tag_text(s))
+    for order in [sentences, sentences[::-1]]:
+        for function in [tag, tags, tokens, lemmas]:
+            function.drop_cache()
+        with settings.override(('TAG_CACHE', None)):
+            assert tag_many(order, jobs=jobs, chunksize=3) == \
+                tuple(single[sentences.index(s)] for s in order)
+    close_pool()
+
+
+def test_tag_cache():
+    for function in [tag, tags, tokens, lemmas]:
+        function.drop_cache()
+    codings = tag(sentence)
+    assert _tag_cache().get(sentence) == codings
+
+    # Stored codings are used without calling TreeTagger.
+    _tag_cache().put('Not tagged', (['Stored', 'NN', 'store'],))
+    assert tag('Not tagged') == (['Stored', 'NN', 'store'],)
+    _tag_cache().put('Not pooled', (['Stored', 'NN', 'store'],))
+    assert tag_many(['Not pooled', 'The dog barks'], jobs=2) == \
+        ((['Stored', 'NN', 'store'],), _tag_text('The dog barks'))
+    assert _tag_cache().get('The dog barks') == _tag_text('The dog barks')
+    close_pool()
+    _tag_cache().put('Not batched', (['Stored', 'NN', 'store'],))
+    assert tag_batch(['Not batched', 'The cat purrs']) == \
+        ((['Stored', 'NN', 'store'],), _tag_text('The cat purrs'))
+    assert _tag_cache().get('The cat purrs') == _tag_text('The cat purrs')
+
+    # Disabling the cache.
+    with settings.override(('TAG_CACHE', None)):
+        assert _tag_cache() is None
+        tag.drop_cache()
+        assert tag('Not tagged') == _tag_text('Not tagged')
@@ -5,11 +5,16 @@
 
 import logging
 import pickle
+from collections import OrderedDict
 from contextlib import contextmanager
+from functools import partial
 from itertools import zip_longest
+from weakref import WeakSet
 import os
+import sys
 
 import numpy as np
+from numpy.lib.stride_tricks import as_strided
 from langdetect import detect
 from langdetect.lang_detect_exception import LangDetectException
 from sqlalchemy import create_engine
@@ -108,6 +113,151 @@ class cache:
         return result
 
 
+class MemoizedCache:
+
+    """Cache of a :func:`memoized` function, with optional eviction of its
+    least recently used values and statistics on its use.
+
+    Values are kept in insertion/use order. When the cache holds more than
+    `maxsize` values or more than (approximately) `maxbytes` bytes, the least
+    recently used values are evicted (though the last value stored is always
+    kept). Sizes are estimated with :func:`approximate_size`. Walking each
+    value has a cost, so they are only kept up to date on every miss if
+    `maxbytes` is set, and otherwise computed when :meth:`stats` are asked
+    for.
+
+    Parameters
+    ----------
+    name : str
+        Name of the memoized function, used in statistics.
+    maxsize : int, optional
+        Maximum number of values kept; defaults to `None` (unbounded).
+    maxbytes : int, optional
+        Maximum approximate size of the values kept (and of their keys), in
+        bytes; defaults to `None` (unbounded).
+
+    """
+
+    def __init__(self, name, maxsize=None, maxbytes=None):
+        self.name = name
+        self.maxsize = maxsize
+        self.maxbytes = maxbytes
+        #: Number of lookups answered from the cache.
+        self.hits = 0
+        #: Number of lookups that were not.
+        self.misses = 0
+        #: Number of values evicted to respect `maxsize` or `maxbytes`.
+        self.evictions = 0
+        #: Approximate size of the cached keys and values, in bytes; `None`
+        #: if `maxbytes` is not set, since sizes are then not computed.
+        self.nbytes = None if maxbytes is None else 0
+        self._values = OrderedDict()
+        self._bounded = maxsize is not None or maxbytes is not None
+
+    def __repr__(self):
+        return ('MemoizedCache({0.name!r}, maxsize={0.maxsize}, '
+                'maxbytes={0.maxbytes})').format(self)
+
+    def __len__(self):
+        return len(self._values)
+
+    def __contains__(self, key):
+        return key in self._values
+
+    def get(self, key):
+        """Get the value cached for `key`, raising :class:`KeyError` if there
+        is none, and count the hit or miss."""
+
+        try:
+            value, _ = self._values[key]
+        except KeyError:
+            self.misses += 1
+            raise
+        self.hits += 1
+        if self._bounded:
+            self._values.move_to_end(key)
+        return value
+
+    def put(self, key, value):
+        """Cache `value` for `key`, evicting least recently used values if
+        the cache is then too large."""
+
+        if key in self._values:
+            _, nbytes = self._values.pop(key)
+            if self.nbytes is not None:
+                self.nbytes -= nbytes
+        if self.nbytes is None:
+            self._values[key] = (value, 0)
+        else:
+            nbytes = approximate_size(key) + approximate_size(value)
+            self._values[key] = (value, nbytes)
+            self.nbytes += nbytes
+        if self._bounded:
+            self._evict()
+
+    def _evict(self):
+        while len(self._values) > 1 and (
+                (self.maxsize is not None
+                 and len(self._values) > self.maxsize) or
+                (self.maxbytes is not None and self.nbytes > self.maxbytes)):
+            _, (_, nbytes) = self._values.popitem(last=False)
+            if self.nbytes is not None:
+                self.nbytes -= nbytes
+            self.evictions += 1
+
+    def clear(self):
+        """Empty the cache (statistics are kept)."""
+
+        self._values.clear()
+        if self.nbytes is not None:
+            self.nbytes = 0
+
+    def stats(self):
+        """Get a dict of statistics on this cache: `name`, `hits`, `misses`,
+        `evictions`, `size` (number of values), `maxsize`, `bytes` (approximate
+        size of the cached keys and values) and `maxbytes`."""
+
+        nbytes = self.nbytes
+        if nbytes is None:
+            nbytes = sum(approximate_size(key) + approximate_size(value)
+                         for key, (value, _) in self._values.items())
+        return {'name': self.name, 'hits': self.hits, 'misses': self.misses,
+                'evictions': self.evictions, 'size': len(self._values),
+                'maxsize': self.maxsize, 'bytes': nbytes,
+                'maxbytes': self.maxbytes}
+
+
+#: Caches of all :func:`memoized` functions, for :func:`memoized_stats`.
+_memoized_caches = WeakSet()
+
+
+def approximate_size(obj):
+    """Estimate the memory used by `obj`, in bytes.
+
+    This adds up :func:`sys.getsizeof` for `obj` and, recursively, for the
+    items of the tuples, lists, sets and dicts it contains (counting each
+    object once). Other objects are not explored, so their attributes are
+    not counted.
+
+    """
+
+    seen = set()
+    size = 0
+    stack = [obj]
+    while stack:
+        obj = stack.pop()
+        if id(obj) in seen:
+            continue
+        seen.add(id(obj))
+        size += sys.getsizeof(obj)
+        if isinstance(obj, dict):
+            stack.extend(obj.keys())
+            stack.extend(obj.values())
+        elif isinstance(obj, (tuple, list, set, frozenset)):
+            stack.extend(obj)
+    return size
+
+
 def _memoize(func, *args, **kwargs):
     # frozenset is used to ensure hashability
     if kwargs:
@@ -116,30 +266,70 @@ def _memoize(func, *args, **kwargs):
         key = args
     # Attribute added by memoized
     cache = func.cache
-    if key not in cache:
-        cache[key] = func(*args, **kwargs)
-    return cache[key]
+    try:
+        return cache.get(key)
+    except KeyError:
+        value = func(*args, **kwargs)
+        cache.put(key, value)
+        return value
 
 
-def memoized(f):
+def memoized(f=None, maxsize=None, maxbytes=None):
     """Decorate a function to cache its return value the first time it is
     called.
 
     If called later with the same arguments, the cached value is returned
-    (not reevaluated).
+    (not reevaluated). The decorated function also gets a `drop_cache()`
+    method to empty its cache, an `is_cached(*args)` method to test if the
+    value for positional arguments `args` is cached, and a
+    `prime_cache(value, *args)` method to cache `value` as the result for
+    `args` (e.g. when computing many values at once is cheaper).
+
+    Use as ``@memoized`` for an unbounded cache, or as
+    ``@memoized(maxsize=..., maxbytes=...)`` to evict the least recently used
+    values once the cache holds more than `maxsize` values or approximately
+    `maxbytes` bytes (see :class:`MemoizedCache`). The cache is in the
+    decorated function's `cache` attribute, and :func:`memoized_stats` reports
+    on the caches of all memoized functions.
 
     """
 
-    f.cache = {}
+    if f is None:
+        return partial(memoized, maxsize=maxsize, maxbytes=maxbytes)
+
+    f.cache = MemoizedCache('{}.{}'.format(f.__module__, f.__qualname__),
+                            maxsize=maxsize, maxbytes=maxbytes)
+    _memoized_caches.add(f.cache)
 
     def drop_cache():
         logger.debug('Dropping cache for %s', f)
-        f.cache = {}
+        f.cache.clear()
+
+    def is_cached(*args):
+        return args in f.cache
+
+    def prime_cache(value, *args):
+        f.cache.put(args, value)
 
     f.drop_cache = drop_cache
+    f.is_cached = is_cached
+    f.prime_cache = prime_cache
     return decorate(f, _memoize)
 
 
+def memoized_stats():
+    """Get the statistics of the caches of all :func:`memoized` functions
+    (see :meth:`MemoizedCache.stats`), sorted by function name.
+
+    Only the current process is covered: worker processes have their own
+    caches.
+
+    """
+
+    return sorted((cache.stats() for cache in _memoized_caches),
+                  key=lambda stats: stats['name'])
+
+
 def mpl_palette(n_colors, variation='Set2'):  # or variation='colorblind'
     """Get any seaborn palette as a usable matplotlib colormap."""
 
@@ -232,7 +422,7 @@ class NotFoundError(Exception):
     """Signal a file or directory can't be found."""
 
 
-@memoized
+@memoized(maxsize=2 ** 17)
 def langdetect(sentence):
     """Detect the language of `sentence`."""
 
@@ -268,7 +458,7 @@ def execute_raw(engine, statement):
     connection.close()
 
 
-@memoized
+@memoized(maxsize=2 ** 16)
 def is_same_ending_us_uk_spelling(w1, w2):
     """Test if `w1` and `w2` differ by only the last two letters inverted,
     as in `center`/`centre` (words must be at least 4 letters)."""
@@ -302,7 +492,7 @@ def is_int(s):
         return False
 
 
-@memoized
+@memoized(maxsize=2 ** 16)
 def levenshtein(s1, s2):
     """Compute the levenshtein distance between strings or lists `s1` and
     `s2`."""
@@ -329,17 +519,17 @@ def levenshtein(s1, s2):
     return previous_row[-1]
 
 
-@memoized
+@memoized(maxsize=2 ** 16)
 def hamming(s1, s2):
     """Compute the hamming distance between strings or lists `s1` and `s2`."""
 
     if len(s1) != len(s2):
         raise ValueError('Strings must be the same length.')
     else:
-        return np.sum(c1 != c2 for c1, c2 in zip(s1, s2))
+        return sum(c1 != c2 for c1, c2 in zip(s1, s2))
 
 
-@memoized
+@memoized(maxsize=2 ** 16)
 def sublists(s, l):
     """Get all sublists of `s` of length `l`."""
 
@@ -350,10 +540,143 @@ def sublists(s, l):
     return tuple(s[i:i + l] for i in range(len(s) - l + 1))
 
 
-@memoized
+class Vocabulary:
+
+    """Encode sequences of words (or of any hashable items) as arrays of
+    integer codes.
+
+    Each new item gets the next code, so that sequences encoded with the same
+    vocabulary can be compared code by code in NumPy (see
+    :func:`subhamming_batch`). Codes are never negative.
+
+    """
+
+    def __init__(self):
+        self._codes = {}
+
+    def __len__(self):
+        return len(self._codes)
+
+    def encode(self, sequence):
+        """Get the :class:`numpy.ndarray` of the codes of the items in
+        `sequence`, adding new items to the vocabulary."""
+
+        codes = self._codes
+        return np.fromiter((codes.setdefault(item, len(codes))
+                            for item in sequence),
+                           dtype=np.int64, count=len(sequence))
+
+
+def sliding_hamming(codes1, codes2):
+    """Compute the hamming distances between `codes2` and all windows of
+    `codes1` as long as `codes2` (both 1-D integer arrays, `codes1` being at
+    least as long as `codes2`), returning an array of distances indexed by
+    window start.
+
+    The windows are views on `codes1` (built with
+    :func:`numpy.lib.stride_tricks.as_strided`), so no sublist is copied.
+
+    """
+
+    l1, l2 = len(codes1), len(codes2)
+    # The windows overlap in memory, so never write to them.
+    windows = as_strided(codes1, shape=(l1 - l2 + 1, l2),
+                         strides=(codes1.strides[0], codes1.strides[0]))
+    return (windows != codes2).sum(axis=1)
+
+
+def _subhamming_group(sources, destination):
+    """Compute the :func:`subhamming` `(distances, starts)` arrays of all
+    encoded `sources` to encoded `destination` at once.
+
+    Sources are padded to the same length with -1 (which is no code) into a
+    2-D array, whose windows are taken with stride tricks; windows that run
+    over the padding are then excluded.
+
+    """
+
+    l2 = len(destination)
+    lengths = np.array([len(source) for source in sources])
+    width = lengths.max()
+    padded = np.full((len(sources), width), -1, dtype=np.int64)
+    padded[np.arange(width) < lengths[:, np.newaxis]] = \
+        np.concatenate(sources)
+
+    n_windows = width - l2 + 1
+    row_stride, column_stride = padded.strides
+    # The windows overlap in memory, so never write to them.
+    windows = as_strided(padded, shape=(len(sources), n_windows, l2),
+                         strides=(row_stride, column_stride, column_stride))
+    distances = (windows != destination).sum(axis=2)
+    distances[np.arange(n_windows) > (lengths - l2)[:, np.newaxis]] = l2 + 1
+    starts = distances.argmin(axis=1)
+    return distances[np.arange(len(sources)), starts], starts
+
+
+def subhamming_batch(pairs, vocabulary=None):
+    """Compute the :func:`subhamming` distances and starts of many `(s1, s2)`
+    `pairs` of strings or lists.
+
+    Sequences are encoded as integer arrays with `vocabulary` (see
+    :class:`Vocabulary`), and pairs are grouped by `s2` so that the
+    distances to all windows of all the `s1` of a group are computed in a
+    few NumPy operations (see :func:`_subhamming_group`). This is much faster
+    than calling :func:`subhamming` on each pair when there are many pairs
+    per `s2`, e.g. for all the candidate sources of a destination in a
+    cluster.
+
+    Parameters
+    ----------
+    pairs : iterable of tuples
+        `(s1, s2)` pairs of strings or lists, `s2` being no longer than `s1`.
+    vocabulary : :class:`Vocabulary`, optional
+        Vocabulary to encode the sequences with; defaults to a new
+        vocabulary for this batch. Sharing a vocabulary across batches
+        avoids building it again.
+
+    Returns
+    -------
+    list of tuples
+        One `(distance, sublist start in s1)` tuple of ints per pair, in the
+        order of `pairs`.
+
+    Raises
+    ------
+    ValueError
+        If an `s2` is longer than its `s1`.
+
+    """
+
+    if vocabulary is None:
+        vocabulary = Vocabulary()
+
+    results = []
+    groups = {}
+    for i, (s1, s2) in enumerate(pairs):
+        if len(s1) < len(s2):
+            raise ValueError('The second string must be shorter or '
+                             'as long as the first one.')
+        results.append((len(s1), 0))
+        if len(s2) > 0:
+            indices, sources = groups.setdefault(tuple(s2), ([], []))
+            indices.append(i)
+            sources.append(vocabulary.encode(s1))
+
+    for s2, (indices, sources) in groups.items():
+        distances, starts = _subhamming_group(sources, vocabulary.encode(s2))
+        for i, distance, start in zip(indices, distances, starts):
+            results[i] = (int(distance), int(start))
+    return results
+
+
+@memoized(maxsize=2 ** 16)
 def subhamming(s1, s2):
     """Compute the minimum hamming distance between `s2` and all sublists of
-    `s1` as long as `s2`, returning `(distance, sublist start in s1)`."""
+    `s1` as long as `s2`, returning `(distance, sublist start in s1)`.
+
+    Use :func:`subhamming_batch` to compute this for many pairs at once.
+
+    """
 
     l1 = len(s1)
     l2 = len(s2)
@@ -364,16 +687,11 @@ def subhamming(s1, s2):
     if l1 < l2:
         raise ValueError('The second string must be shorter or '
                          'as long as the first one.')
-    if l1 == l2:
-        return hamming(s1, s2), 0
-
-    distances = np.zeros(l1 - l2 + 1)
-
-    for i, subs in enumerate(sublists(s1, l2)):
-        distances[i] = hamming(subs, s2)
 
+    vocabulary = Vocabulary()
+    distances = sliding_hamming(vocabulary.encode(s1), vocabulary.encode(s2))
     amin = np.argmin(distances)
-    return int(distances[amin]), amin
+    return int(distances[amin]), int(amin)
 
 
 class Stopwords:
@@ -448,7 +766,7 @@ def init_db(echo_sql=False):
 
     """
 
-    from brainscopypaste.db import Base, Session
+    from brainscopypaste.db import Base, Session, add_missing_columns
     from brainscopypaste.conf import settings
     logger.info('Initializing database connection')
 
@@ -463,4 +781,5 @@ def init_db(echo_sql=False):
     logger.debug('Checking tables to create')
 
     Base.metadata.create_all(engine)
+    add_missing_columns(engine)
     return engine
@@ -6,13 +6,18 @@
 import pickle
 from tempfile import mkstemp
 import os
+import sys
 
+import numpy as np
 import pytest
 
 from brainscopypaste.utils import (grouper, grouper_adaptive, langdetect,
                                    is_same_ending_us_uk_spelling, is_int,
                                    levenshtein, hamming, sublists, subhamming,
-                                   stopwords, memoized, cache, unpickle)
+                                   subhamming_batch, sliding_hamming,
+                                   Vocabulary,
+                                   stopwords, memoized, memoized_stats,
+                                   approximate_size, cache, unpickle)
 
 
 def test_langdetect():
@@ -129,6 +134,52 @@ def test_stopwords():
     assert 'do ' not in stopwords
 
 
+def test_vocabulary():
+    vocabulary = Vocabulary()
+    assert list(vocabulary.encode(('the', 'cat', 'the'))) == [0, 1, 0]
+    assert list(vocabulary.encode(['a', 'cat'])) == [2, 1]
+    assert list(vocabulary.encode('')) == []
+    assert len(vocabulary) == 3
+
+
+def test_sliding_hamming():
+    vocabulary = Vocabulary()
+    s1 = 'hello there sir'
+    codes1 = vocabulary.encode(s1)
+    for s2 in ['hello', 'e', 'there sir', s1]:
+        assert list(sliding_hamming(codes1, vocabulary.encode(s2))) == \
+            [hamming(sub, s2) for sub in sublists(s1, len(s2))]
+
+
+def test_subhamming_batch():
+    pairs = [('hello there sir', 'hallo'), ('hello there sir', 'e'),
+             ('hello there sir', ''), ('hallo', 'hallo'),
+             ('hello there sir', 'there'), ('hello', 'hallo'),
+             (('the', 'cat', 'sat'), ['a', 'cat']), ('sir', 'e')]
+    assert subhamming_batch(pairs) == \
+        [(1, 0), (0, 1), (15, 0), (0, 0), (0, 6), (1, 0), (1, 0), (1, 0)]
+    assert subhamming_batch([]) == []
+
+    # Results are those of subhamming, with a shared vocabulary or not.
+    random = np.random.RandomState(0)
+    words = tuple('abcdefgh')
+    pairs = []
+    for _ in range(200):
+        l1 = random.randint(1, 15)
+        l2 = random.randint(0, l1 + 1)
+        pairs.append((tuple(random.choice(words, l1)),
+                      tuple(random.choice(words[:4], l2))))
+    expected = [subhamming(s1, s2) for s1, s2 in pairs]
+    assert subhamming_batch(pairs) == expected
+    vocabulary = Vocabulary()
+    assert subhamming_batch(pairs[:100], vocabulary) == expected[:100]
+    assert subhamming_batch(pairs[100:], vocabulary) == expected[100:]
+
+    with pytest.raises(ValueError):
+        subhamming_batch([('hello there sir', 'hallo'),
+                          ('hello', 'hello there dear sir')])
+
+
 def test_memoized():
     counter = 0
 
@@ -150,6 +201,16 @@ def test_memoized():
     assert mfunc() == 2
     assert mfunc() == 2
 
+    # The cache can be tested and primed.
+    assert mfunc.is_cached()
+    assert not mfunc.is_cached('other')
+    mfunc.drop_cache()
+    assert not mfunc.is_cached()
+    mfunc.prime_cache(10)
+    assert mfunc.is_cached()
+    assert mfunc() == 10
+    assert counter == 2
+
 
 def test_memoized_class():
     counter = 0
@@ -277,6 +338,98 @@ def test_memoized_class_staticmethod():
     assert klass2.staticfunc() == 4
 
 
+def test_memoized_maxsize():
+    calls = []
+
+    @memoized(maxsize=2)
+    def func(x):
+        """My bounded func."""
+        calls.append(x)
+        return x * 2
+
+    # Doc is propagated through memoization.
+    assert func.__doc__ == 'My bounded func.'
+
+    # The least recently used value is evicted.
+    assert func(1) == 2
+    assert func(2) == 4
+    assert func(1) == 2
+    assert func(3) == 6
+    assert func.is_cached(1)
+    assert not func.is_cached(2)
+    assert func.is_cached(3)
+    assert func(2) == 4
+    assert calls == [1, 2, 3, 2]
+
+    # Statistics are kept, even after dropping the cache.
+    stats = func.cache.stats()
+    assert stats['name'] == __name__ + '.test_memoized_maxsize.<locals>.func'
+    assert (stats['hits'], stats['misses'], stats['evictions']) == (1, 4, 2)
+    assert (stats['size'], stats['maxsize']) == (2, 2)
+    # Sizes are computed for stats, even without maxbytes.
+    assert func.cache.nbytes is None
+    assert stats['bytes'] == sum(approximate_size((x,)) +
+                                 approximate_size(x * 2) for x in [3, 2])
+    func.drop_cache()
+    stats = func.cache.stats()
+    assert (stats['hits'], stats['misses'], stats['evictions']) == (1, 4, 2)
+    assert (stats['size'], stats['bytes']) == (0, 0)
+
+    # Primed values count in the size.
+    func.prime_cache(0, 4)
+    func.prime_cache(0, 5)
+    func.prime_cache(0, 6)
+    assert len(func.cache) == 2
+    assert func.cache.evictions == 3
+
+
+def test_memoized_maxbytes():
+    @memoized(maxbytes=3 * approximate_size(((0,), 'x' * 100)))
+    def func(x):
+        return 'x' * 100 if x >= 0 else 'x' * 1000
+
+    for x in range(5):
+        func(x)
+    assert len(func.cache) == 3
+    assert func.cache.evictions == 2
+    assert func.cache.nbytes <= func.cache.maxbytes
+    assert func.cache.stats()['bytes'] == \
+        sum(approximate_size((x,)) + approximate_size('x' * 100)
+            for x in range(2, 5))
+
+    # A value larger than the limit is still kept, alone.
+    func(-1)
+    assert len(func.cache) == 1
+    assert func.is_cached(-1)
+    func.drop_cache()
+    assert func.cache.stats()['bytes'] == 0
+
+
+def test_memoized_stats():
+    @memoized
+    def func(x):
+        return x
+
+    func(1)
+    func(1)
+    stats = [s for s in memoized_stats() if s['name'] == func.cache.name]
+    assert stats == [func.cache.stats()]
+    assert stats[0]['hits'] == 1
+    assert stats[0]['maxsize'] is None
+    # Memoized functions of the package are registered.
+    assert 'brainscopypaste.utils.levenshtein' in \
+        [s['name'] for s in memoized_stats()]
+
+
+def test_approximate_size():
+    assert approximate_size(1) == sys.getsizeof(1)
+    shared = 'a string'
+    assert approximate_size((shared, shared)) == \
+        sys.getsizeof((shared, shared)) + sys.getsizeof(shared)
+    assert approximate_size({'key': [shared]}) > \
+        approximate_size({'key': []})
+
+
 def test_cache():
 
     class Klass: